@@ -1,6 +1,8 @@
 from django.contrib import admin
 
-from apps.chat.models import Message, ChatHistory, Answer, RequestCount
+from apps.chat.entitlements import entitlement_cache
+from apps.chat.models import Message, ChatHistory, Answer, RequestCount, GenerationJob, UserMessageCounter, QuestionCluster, \
+	Entitlement, RequestCountLedger, MessageArchive
 
 
 @admin.register(Message)
@@ -21,3 +23,64 @@ class AnswerAdmin(admin.ModelAdmin):
 @admin.register(RequestCount)
 class RequestCountAdmin(admin.ModelAdmin):
     list_display = ['id', 'request_count', 'user']
+
+
+@admin.register(GenerationJob)
+class GenerationJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'message', 'status', 'attempts', 'worker', 'lease_until', 'created']
+    list_filter = ['status']
+    raw_id_fields = ['message', 'answer']
+
+
+@admin.register(UserMessageCounter)
+class UserMessageCounterAdmin(admin.ModelAdmin):
+    list_display = ['user', 'message_count', 'updated']
+    raw_id_fields = ['user']
+
+
+@admin.register(QuestionCluster)
+class QuestionClusterAdmin(admin.ModelAdmin):
+    list_display = ['id', 'representative', 'size', 'updated']
+    exclude = ['signature']
+
+
+@admin.register(Entitlement)
+class EntitlementAdmin(admin.ModelAdmin):
+    list_display = ['user', 'product', 'remaining', 'request_limit', 'period_start', 'period_end', 'updated']
+    raw_id_fields = ['user', 'product', 'payment']
+    readonly_fields = ['version', 'updated']
+
+    def save_model(self, request, obj, form, change):
+        obj.version += 1
+        super().save_model(request, obj, form, change)
+        entitlement_cache.invalidate(obj.user_id)
+
+
+@admin.register(RequestCountLedger)
+class RequestCountLedgerAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'reason', 'rows_compacted', 'request_count_total', 'last_created', 'created']
+    list_filter = ['reason']
+    raw_id_fields = ['user']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(MessageArchive)
+class MessageArchiveAdmin(admin.ModelAdmin):
+    list_display = ['month', 'name', 'messages_count', 'answers_count', 'buckets', 'created']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
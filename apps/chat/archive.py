@@ -0,0 +1,260 @@
+"""
+Cold archive of old message partitions (PostgreSQL, see apps.chat.partitions). archive_month() writes one month of
+chat_message and chat_answer rows into gzipped JSONL files under CHAT_ARCHIVE_DIR/<YYYY-MM>/, spread over
+`buckets` files by chat id, records which chats have rows in it and drops the two partitions. When such a chat is
+opened, schedule_restore() has restore_archived_chat() read its bucket files in the background and insert the rows
+back; they end up in the default partition, the months themselves stay archived.
+
+Each line is {"chat_history_id": <id>, "row": <the row as returned by row_to_json>}. Answers of the month's
+messages that were written in later months go to the month's archive as well, so an archive holds whole messages.
+"""
+import gzip
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+from apps.chat.models import Answer, ArchivedChat, ChatHistory, Message, MessageArchive, QuestionCluster
+from apps.chat.partitions import add_months, bound, drop_partition, partition_name
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=settings.CHAT_ARCHIVE_RESTORE_WORKERS, thread_name_prefix="archive-restore")
+
+
+def archive_dir():
+    return Path(settings.CHAT_ARCHIVE_DIR)
+
+
+def bucket_path(directory, kind, bucket):
+    return Path(directory) / f"{kind}-{bucket}.jsonl.gz"
+
+
+def chat_bucket(chat_history_id, buckets):
+    return 'nochat' if chat_history_id is None else f"{chat_history_id % buckets:03d}"
+
+
+class BucketWriter:
+    """Lazily opened gzip files of one archive directory, one per (kind, bucket)."""
+
+    def __init__(self, directory, buckets):
+        self.directory = Path(directory)
+        self.buckets = buckets
+        self.files = {}
+        self.chat_ids = set()
+        self.counts = {'messages': 0, 'answers': 0}
+
+    def write(self, kind, chat_history_id, row_json):
+        key = (kind, chat_bucket(chat_history_id, self.buckets))
+        if key not in self.files:
+            self.files[key] = gzip.open(bucket_path(self.directory, *key), 'wt', encoding='utf-8')
+        chat = 'null' if chat_history_id is None else int(chat_history_id)
+        self.files[key].write(f'{{"chat_history_id": {chat}, "row": {row_json}}}\n')
+        self.counts[kind] += 1
+        if chat_history_id is not None:
+            self.chat_ids.add(chat_history_id)
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+        self.files = {}
+
+
+def export_rows(writer, kind, sql, params, batch_size):
+    """Streams `SELECT id, chat_history_id, row_json ...` (without ORDER BY/LIMIT) into the writer by id ranges."""
+    last_id = 0
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute(f"SELECT * FROM ({sql}) exported WHERE id > %s ORDER BY id LIMIT %s",
+                           [*params, last_id, batch_size])
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            for row_id, chat_history_id, row_json in rows:
+                writer.write(kind, chat_history_id, row_json)
+            last_id = rows[-1][0]
+
+
+def archive_month(month, buckets=None, batch_size=10000):
+    """
+    Moves the month's message and answer partitions into the archive; returns the MessageArchive. The bulk of the
+    rows is exported before the partitions are locked; answers written to later months for the month's messages are
+    exported, deleted and the partitions dropped in one transaction with the message partition locked.
+    """
+    directory = archive_dir()
+    buckets = buckets or settings.CHAT_ARCHIVE_BUCKETS
+    quote = connection.ops.quote_name
+    messages, answers = partition_name('chat_message', month), partition_name('chat_answer', month)
+    name = f"{month:%Y-%m}"
+    target, partial = directory / name, directory / f"{name}.partial"
+    shutil.rmtree(partial, ignore_errors=True)
+    partial.mkdir(parents=True)
+
+    writer = BucketWriter(partial, buckets)
+    try:
+        export_rows(
+            writer, 'messages',
+            f"SELECT m.id, m.chat_history_id, row_to_json(m)::text FROM {quote(messages)} m", [], batch_size,
+        )
+        # Answers of the month, whatever month their message is in (it may have been restored to the default one)
+        export_rows(
+            writer, 'answers',
+            f"SELECT a.id, m.chat_history_id, row_to_json(a)::text FROM {quote(answers)} a "
+            f"LEFT JOIN chat_message m ON m.id = a.message_id",
+            [], batch_size,
+        )
+        later = bound(add_months(month, 1))
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {quote(messages)} IN ACCESS EXCLUSIVE MODE")
+                export_rows(
+                    writer, 'answers',
+                    f"SELECT a.id, m.chat_history_id, row_to_json(a)::text FROM chat_answer a "
+                    f"JOIN {quote(messages)} m ON m.id = a.message_id WHERE a.created >= {later}",
+                    [], batch_size,
+                )
+                cursor.execute(
+                    f"DELETE FROM chat_answer a USING {quote(messages)} m "
+                    f"WHERE a.message_id = m.id AND a.created >= {later}"
+                )
+                cursor.execute(f"DELETE FROM chat_generationjob WHERE message_id IN (SELECT id FROM {quote(messages)})")
+                drop_partition(cursor, 'chat_message', month)
+                drop_partition(cursor, 'chat_answer', month)
+
+            archive = MessageArchive.objects.create(
+                month=month, name=name, buckets=buckets,
+                messages_count=writer.counts['messages'], answers_count=writer.counts['answers'],
+            )
+            chat_ids = sorted(writer.chat_ids)
+            for start in range(0, len(chat_ids), batch_size):
+                existing = list(
+                    ChatHistory.all_objects.filter(id__in=chat_ids[start:start + batch_size]).values_list('id', flat=True)
+                )
+                ArchivedChat.objects.bulk_create(
+                    [ArchivedChat(chat_history_id=chat_id, archive=archive) for chat_id in existing],
+                    ignore_conflicts=True,
+                )
+                ChatHistory.all_objects.filter(id__in=existing).update(has_archived_messages=True)
+
+            writer.close()
+            # The files are in place before the partitions are gone for good
+            shutil.rmtree(target, ignore_errors=True)
+            os.replace(partial, target)
+    finally:
+        writer.close()
+        shutil.rmtree(partial, ignore_errors=True)
+    return archive
+
+
+def read_archived_rows(archive, chat_history_id, kind):
+    directory = archive_dir() / archive.name
+    if not directory.is_dir():
+        raise FileNotFoundError(f"Archive {directory} is missing")
+    # A chat may only have messages or only answers in a month
+    path = bucket_path(directory, kind, chat_bucket(chat_history_id, archive.buckets))
+    if not path.exists():
+        return
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        for line in file:
+            record = json.loads(line)
+            if record['chat_history_id'] == chat_history_id:
+                yield record['row']
+
+
+def model_from_row(model, row):
+    values = {}
+    for field in model._meta.concrete_fields:
+        if field.column in row:
+            value = row[field.column]
+            values[field.attname] = value if value is None else field.to_python(value)
+    return model(**values)
+
+
+def read_archived_chat(chat_history_id):
+    """The ids of the chat's archives and its unsaved archived messages and answers, read without any lock."""
+    archive_ids, messages, answers = [], [], []
+    for archive in MessageArchive.objects.filter(chats__chat_history_id=chat_history_id).order_by('month'):
+        messages += [model_from_row(Message, row) for row in read_archived_rows(archive, chat_history_id, 'messages')]
+        answers += [model_from_row(Answer, row) for row in read_archived_rows(archive, chat_history_id, 'answers')]
+        archive_ids.append(archive.id)
+    return archive_ids, messages, answers
+
+
+def restore_archived_chat(chat_history):
+    """
+    Inserts the chat's archived messages and answers back, once; returns the number of messages restored.
+    A missing archive directory is logged and the chat is served with what is left in the database.
+
+    The files are read before the chat row is locked, so the lock is only held for the inserts. An archive of the
+    chat written meanwhile stays recorded and `has_archived_messages` set, to be restored by the next call.
+
+    bulk_create() stamps `created` (auto_now_add) with the current time, so the rows are first inserted into the
+    current month's partition; bulk_update() then writes their original `created` back, which moves them to the
+    default partition as their month has none any more. Ids are kept, so references between them stay valid.
+    """
+    if not chat_history.has_archived_messages:
+        return 0
+    try:
+        archive_ids, messages, answers = read_archived_chat(chat_history.pk)
+    except OSError:
+        logger.exception("Could not restore the archived messages of chat %s", chat_history.pk)
+        return 0
+    cluster_ids = {message.cluster_id for message in messages if message.cluster_id is not None}
+    with transaction.atomic():
+        locked = ChatHistory.all_objects.select_for_update().filter(
+            pk=chat_history.pk, has_archived_messages=True
+        ).exists()
+        if not locked:
+            return 0
+        known_clusters = set(QuestionCluster.objects.filter(id__in=cluster_ids).values_list('id', flat=True))
+        for message in messages:
+            if message.cluster_id not in known_clusters:
+                message.cluster_id = None
+        # Inserted with created = now(), then moved back to their month (see above)
+        for model, objects in ((Message, messages), (Answer, answers)):
+            created = [obj.created for obj in objects]
+            model.all_objects.bulk_create(objects, batch_size=1000)
+            for obj, value in zip(objects, created):
+                obj.created = value
+            model.all_objects.bulk_update(objects, ['created'], batch_size=1000)
+        ArchivedChat.objects.filter(chat_history_id=chat_history.pk, archive_id__in=archive_ids).delete()
+        remaining = ArchivedChat.objects.filter(chat_history_id=chat_history.pk).exists()
+        ChatHistory.all_objects.filter(pk=chat_history.pk).update(has_archived_messages=remaining)
+    chat_history.has_archived_messages = remaining
+    return len(messages)
+
+
+def restore_key(chat_history_id):
+    return f"chat:archive_restore:{chat_history_id}"
+
+
+def schedule_restore(chat_history):
+    """
+    Starts restoring the chat's archived messages in the background once the current transaction commits; returns
+    whether the chat has any. A mark in the shared cache keeps the requests of every worker from restoring a chat
+    twice at the same time; it expires after CHAT_ARCHIVE_RESTORE_TIMEOUT should the worker die.
+    """
+    if not chat_history.has_archived_messages:
+        return False
+    marks = caches[settings.CHAT_ANSWER_CACHE_ALIAS]
+    if marks.add(restore_key(chat_history.pk), True, settings.CHAT_ARCHIVE_RESTORE_TIMEOUT):
+        transaction.on_commit(lambda: _executor.submit(_restore, chat_history.pk))
+    return True
+
+
+def _restore(chat_history_id):
+    try:
+        chat_history = ChatHistory.all_objects.filter(pk=chat_history_id).first()
+        if chat_history is not None:
+            restore_archived_chat(chat_history)
+    except Exception:
+        logger.exception("Could not restore the archived messages of chat %s", chat_history_id)
+    finally:
+        caches[settings.CHAT_ANSWER_CACHE_ALIAS].delete(restore_key(chat_history_id))
+        connection.close()
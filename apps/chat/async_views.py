@@ -0,0 +1,88 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse
+from django.shortcuts import aget_object_or_404
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed, Throttled, ValidationError
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from apps.chat.models import ChatHistory, Message
+from apps.chat.serializers import AnswerSerializer
+from apps.chat.service import ChatService, aget_or_generate_answer
+
+
+class AsyncAuthenticatedView(View):
+    """
+    Native async counterpart of an IsAuthenticated APIView.
+    DRF views are sync only, so JWT authentication is done here before dispatching.
+    """
+    authentication = JWTAuthentication()
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            auth = await sync_to_async(self.authentication.authenticate)(request)
+        except AuthenticationFailed as e:
+            return JsonResponse({'detail': str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+
+        if auth is None:
+            return JsonResponse({'detail': "Учетные данные не были предоставлены."},
+                                status=status.HTTP_401_UNAUTHORIZED)
+
+        request.user, request.auth = auth
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except Http404:
+            return JsonResponse({'detail': "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        except Throttled as e:
+            response = JsonResponse({'detail': str(e.detail)}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+            response['Retry-After'] = str(e.wait)
+            return response
+
+
+class AsyncTypingView(AsyncAuthenticatedView):
+
+    async def post(self, request, *args, **kwargs):
+        chat_history = await aget_object_or_404(ChatHistory, id=kwargs.get('id'))
+
+        try:
+            data = json.loads(request.body or b'{}')
+        except json.JSONDecodeError:
+            return JsonResponse({'detail': "JSON parse error."}, status=status.HTTP_400_BAD_REQUEST)
+
+        message_content = data.get('message')
+        if not isinstance(message_content, str) or not message_content.strip():
+            return JsonResponse({'message': ["Message cannot be empty."]}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            message = await ChatService.acreate_chat_history_and_message(
+                request.user, message_content, chat_history.id
+            )
+        except ValidationError as e:
+            detail = e.detail[0] if isinstance(e.detail, list) and e.detail else e.detail
+            return JsonResponse({'message': [str(detail)]}, status=status.HTTP_400_BAD_REQUEST)
+
+        return JsonResponse({
+            "message": "Typing status sent successfully.",
+            "message_id": message.id
+        }, status=status.HTTP_200_OK)
+
+
+class AsyncMessageDetailListView(AsyncAuthenticatedView):
+
+    async def get(self, request, *args, **kwargs):
+        message_id = kwargs['id']
+        msg_data = await aget_object_or_404(Message, id=message_id)
+        regenerate = request.GET.get('regenerate') in ('1', 'true', 'True')
+        answer, created = await aget_or_generate_answer(msg_data, regenerate=regenerate)
+
+        data = AnswerSerializer(answer).data
+        if created:
+            return JsonResponse({'msg': "Successfull added", 'answer': data}, status=status.HTTP_201_CREATED)
+        return JsonResponse({'msg': "Already answered", 'answer': data}, status=status.HTTP_200_OK)
@@ -0,0 +1,68 @@
+import hashlib
+import re
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import caches
+
+from apps.chat import metrics
+
+NON_WORD_RE = re.compile(r"[\W_]+")
+
+
+def normalize_question(text):
+    """
+    NFKC + case folding, with every run of punctuation/whitespace collapsed to a single space,
+    so "Headache??" and "  headache " share one cache entry.
+    """
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    return NON_WORD_RE.sub(" ", text).strip()
+
+
+class AnswerCache:
+    """
+    Answers shared by all workers through Django's cache framework.
+    Keys include the model and the prompt version, so changing either never serves stale answers.
+    """
+
+    def __init__(self, model, prompt_version, alias=None):
+        self.model = model
+        self.prompt_version = prompt_version
+        self.alias = alias or settings.CHAT_ANSWER_CACHE_ALIAS
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, question, language):
+        digest = hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+        return f"answer:{self.model}:{self.prompt_version}:{language}:{digest}"
+
+    def get(self, question, language):
+        answer = self.cache.get(self.make_key(question, language))
+        metrics.incr("answer_cache_hits" if answer is not None else "answer_cache_misses")
+        return answer
+
+    def peek(self, question, language):
+        """Like get(), without touching the hit/miss counters."""
+        return self.cache.get(self.make_key(question, language))
+
+    def set(self, question, language, answer):
+        self.cache.set(self.make_key(question, language), answer, settings.CHAT_ANSWER_CACHE_TTL)
+
+    async def aget(self, question, language):
+        answer = await self.cache.aget(self.make_key(question, language))
+        await metrics.aincr("answer_cache_hits" if answer is not None else "answer_cache_misses")
+        return answer
+
+    async def apeek(self, question, language):
+        return await self.cache.aget(self.make_key(question, language))
+
+    async def aset(self, question, language, answer):
+        await self.cache.aset(self.make_key(question, language), answer, settings.CHAT_ANSWER_CACHE_TTL)
+
+    @staticmethod
+    def stats():
+        counters = metrics.get_counters("answer_cache_hits", "answer_cache_misses")
+        lookups = counters["answer_cache_hits"] + counters["answer_cache_misses"]
+        return {**counters, "answer_cache_hit_rate": metrics.ratio(counters["answer_cache_hits"], lookups)}
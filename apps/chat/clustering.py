@@ -0,0 +1,156 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from apps.chat.cache import normalize_question
+from apps.chat.minhash import MinHasher, LSHIndex
+from apps.chat.models import Message, QuestionCluster
+
+
+class QuestionClusterer:
+    """
+    Incremental leader clustering of questions. Every cluster is represented by the MinHash signature of its first
+    question; a new question joins the most similar cluster at or above `threshold` (estimated Jaccard similarity
+    of character 3-grams) or starts a new one. A chunk is first matched against the existing clusters in one
+    vectorized LSH query; only the questions left over are handled one by one.
+
+    New clusters get provisional keys -1, -2, ... until `register()` is called with their real keys.
+    """
+
+    def __init__(self, threshold=0.6, num_perm=64, bands=16):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm=num_perm)
+        self.index = LSHIndex(num_perm=num_perm, bands=bands)
+        self.exact = {}
+        self.pending = []
+
+    def load(self, keys, representatives, signatures):
+        """Adds existing clusters."""
+        if not len(keys):
+            return
+        self.index.add_many(keys, signatures, np.zeros(len(keys), dtype=np.uint8))
+        for key, representative in zip(keys, representatives):
+            self.exact.setdefault(normalize_question(representative), key)
+
+    def assign(self, questions):
+        """
+        Returns (labels, new_clusters): a cluster key per question and a list of (provisional key, question,
+        signature) for the clusters started by this chunk.
+        """
+        if self.pending:
+            raise RuntimeError("register() the clusters of the previous chunk first")
+        normalized = [normalize_question(question or "") for question in questions]
+        labels = np.array([self.exact.get(text, 0) for text in normalized], dtype=np.int64)
+        todo = np.flatnonzero(labels == 0)
+        if not len(todo):
+            return labels, []
+
+        signatures = self.hasher.signatures([normalized[i] for i in todo])
+        self.index.flush()
+        keys, _ = self.index.query_many(signatures, self.threshold)
+        labels[todo] = np.where(keys >= 0, keys, 0)
+
+        chunk_index = LSHIndex(num_perm=self.index.num_perm, bands=self.index.bands, merge_every=1 << 30)
+        local_exact = {}
+        for position in np.flatnonzero(keys < 0):
+            i = todo[position]
+            signature = signatures[position]
+            key = local_exact.get(normalized[i])
+            if key is None:
+                match = chunk_index.query(signature, self.threshold)
+                key = match[0] if match else None
+            if key is None:
+                key = -(len(self.pending) + 1)
+                chunk_index.add(key, signature)
+                local_exact[normalized[i]] = key
+                self.pending.append((key, questions[i] or "", signature))
+            labels[i] = key
+        return labels, list(self.pending)
+
+    def register(self, real_keys):
+        """Replaces the provisional keys of the last chunk's new clusters; returns the label mapping."""
+        mapping = {}
+        for (key, question, signature), real_key in zip(self.pending, real_keys):
+            mapping[key] = real_key
+        if self.pending:
+            self.load(
+                list(real_keys),
+                [question for _, question, _ in self.pending],
+                np.stack([signature for _, _, signature in self.pending]),
+            )
+        self.pending = []
+        return mapping
+
+
+def load_clusterer(batch_size=None):
+    """A clusterer holding every stored cluster."""
+    batch_size = batch_size or settings.CHAT_CLUSTER_BATCH_SIZE
+    clusterer = QuestionClusterer(
+        threshold=settings.CHAT_CLUSTER_THRESHOLD,
+        num_perm=settings.CHAT_SEMANTIC_CACHE_NUM_PERM,
+        bands=settings.CHAT_SEMANTIC_CACHE_BANDS,
+    )
+    last_id = 0
+    while True:
+        rows = list(
+            QuestionCluster.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'representative', 'signature')[:batch_size]
+        )
+        if not rows:
+            return clusterer
+        clusterer.load(
+            [row[0] for row in rows],
+            [row[1] for row in rows],
+            np.stack([np.frombuffer(bytes(row[2]), dtype=np.uint32) for row in rows]),
+        )
+        last_id = rows[-1][0]
+
+
+def cluster_pending_messages(clusterer, batch_size=None, limit=None):
+    """
+    Assigns every message without a cluster, streaming them from the database in id order.
+    Returns (messages clustered, clusters created).
+    """
+    batch_size = batch_size or settings.CHAT_CLUSTER_BATCH_SIZE
+    clustered = created = 0
+    last_id = 0
+    while limit is None or clustered < limit:
+        rows = list(
+            Message.objects.filter(cluster__isnull=True, id__gt=last_id).order_by('id')
+            .values_list('id', 'question')[:batch_size]
+        )
+        if not rows:
+            break
+        labels, new_clusters = clusterer.assign([question for _, question in rows])
+
+        with transaction.atomic():
+            clusters = QuestionCluster.objects.bulk_create([
+                QuestionCluster(representative=question, signature=signature.tobytes())
+                for _, question, signature in new_clusters
+            ])
+            mapping = clusterer.register([cluster.id for cluster in clusters])
+            cluster_ids = [mapping.get(int(label), int(label)) for label in labels]
+            Message.objects.bulk_update(
+                [Message(id=message_id, cluster_id=cluster_id) for (message_id, _), cluster_id in zip(rows, cluster_ids)],
+                ['cluster'],
+                batch_size=1000,
+            )
+            recount_clusters(set(cluster_ids))
+
+        clustered += len(rows)
+        created += len(new_clusters)
+        last_id = rows[-1][0]
+    return clustered, created
+
+
+def recount_clusters(cluster_ids=None):
+    """Recomputes `size` of the given clusters (all of them when None) from their messages."""
+    counts = Message.objects.filter(cluster=OuterRef('pk')).order_by().values('cluster').annotate(
+        count=Count('id')
+    ).values('count')
+    clusters = QuestionCluster.objects.all()
+    if cluster_ids is not None:
+        clusters = clusters.filter(id__in=cluster_ids)
+    return clusters.update(size=Coalesce(Subquery(counts), 0))
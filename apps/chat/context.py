@@ -0,0 +1,186 @@
+import logging
+
+import tiktoken
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Prefetch
+
+from apps.chat.models import Message, Answer
+
+logger = logging.getLogger(__name__)
+
+# Tokens the chat format adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class TokenCounter:
+    def __init__(self, model):
+        self.model = model
+        self._encoding = None
+        self._loaded = False
+
+    @property
+    def encoding(self):
+        if not self._loaded:
+            self._loaded = True
+            try:
+                try:
+                    self._encoding = tiktoken.encoding_for_model(self.model)
+                except KeyError:
+                    self._encoding = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                # tiktoken downloads encodings on first use; hosts without network fall back to an estimate
+                logger.warning("tiktoken encoding unavailable (%s), estimating token counts", e)
+        return self._encoding
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self.encoding is None:
+            return len(text) // 3 + 1
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def count_messages(self, messages):
+        return sum(self.count(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+    def truncate(self, text, max_tokens):
+        if not text:
+            return text
+        if self.encoding is None:
+            return text[:max_tokens * 3]
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[:max_tokens])
+
+
+token_counter = TokenCounter(settings.CHAT_MODEL)
+
+
+def turn_messages(question, answer):
+    return [
+        {"role": "user", "content": question},
+        {"role": "assistant", "content": answer},
+    ]
+
+
+def select_turns(turns, budget):
+    """
+    turns are (question, answer) pairs, newest first. Returns the newest turns that fit in the token budget
+    (in chronological order) and the number of older turns that were left out.
+    """
+    kept = []
+    used = 0
+    max_answer_tokens = settings.CHAT_CONTEXT_MAX_ANSWER_TOKENS
+    for question, answer in turns:
+        pair = turn_messages(
+            token_counter.truncate(question, settings.CHAT_MAX_QUESTION_TOKENS),
+            token_counter.truncate(answer, max_answer_tokens),
+        )
+        cost = token_counter.count_messages(pair)
+        if used + cost > budget:
+            break
+        kept.append(pair)
+        used += cost
+    dropped = len(turns) - len(kept)
+    return [m for pair in reversed(kept) for m in pair], dropped
+
+
+def previous_turns(message, limit):
+    """The latest answered (message, answer) pairs of the chat before this message, newest first."""
+    messages = (
+        Message.objects.filter(chat_history_id=message.chat_history_id, id__lt=message.id)
+        .order_by("-id")
+        .prefetch_related(Prefetch("answers", queryset=Answer.objects.order_by("-version")))[:limit]
+    )
+    turns = []
+    for msg in messages:
+        answers = list(msg.answers.all())
+        if answers and answers[0].answer:
+            turns.append((msg, answers[0]))
+    return turns
+
+
+class ConversationSummarizer:
+    """
+    Rolling summary of the turns that no longer fit in the context window, cached per chat.
+    The summary is only folded forward once `CHAT_CONTEXT_SUMMARY_STRIDE` uncovered turns have piled up, so it is
+    not recomputed on every message.
+    """
+
+    def __init__(self, complete):
+        # complete(messages, max_tokens) -> str; injected to avoid importing the LLM client here
+        self.complete = complete
+
+    @staticmethod
+    def cache_key(chat_history_id):
+        return f"chat_summary:{chat_history_id}"
+
+    @property
+    def cache(self):
+        return caches[settings.CHAT_ANSWER_CACHE_ALIAS]
+
+    def summary_for(self, message, newest_dropped_id):
+        key = self.cache_key(message.chat_history_id)
+        state = self.cache.get(key) or {"upto_id": 0, "summary": ""}
+        uncovered = Message.objects.filter(
+            chat_history_id=message.chat_history_id, id__gt=state["upto_id"], id__lte=newest_dropped_id
+        )
+        if state["summary"] and uncovered.count() < settings.CHAT_CONTEXT_SUMMARY_STRIDE:
+            return state["summary"]
+
+        turns = previous_turns(
+            Message(id=newest_dropped_id + 1, chat_history_id=message.chat_history_id),
+            settings.CHAT_CONTEXT_MAX_TURNS,
+        )
+        turns = [(m, a) for m, a in turns if m.id > state["upto_id"]]
+        if not turns:
+            return state["summary"]
+
+        transcript, _ = select_turns(
+            [(m.question, a.answer) for m, a in turns], settings.CHAT_CONTEXT_SUMMARY_INPUT_TOKENS
+        )
+        prompt = [
+            {"role": "system", "content": (
+                "Summarize the medical conversation below in a few sentences, in the language of the conversation. "
+                "Keep symptoms, diagnoses, medicines, doses and any facts about the patient."
+            )},
+        ]
+        if state["summary"]:
+            prompt.append({"role": "system", "content": f"Summary of the earlier conversation: {state['summary']}"})
+        prompt.extend(transcript)
+
+        try:
+            summary = self.complete(prompt, settings.CHAT_CONTEXT_SUMMARY_MAX_TOKENS)
+        except Exception as e:
+            logger.warning("Conversation summary failed for chat %s: %s", message.chat_history_id, e)
+            return state["summary"]
+
+        self.cache.set(key, {"upto_id": turns[0][0].id, "summary": summary}, settings.CHAT_ANSWER_CACHE_TTL)
+        return summary
+
+
+def build_history(message, summarizer=None):
+    """
+    Chat messages (an optional summary, then previous user/assistant turns) to send before the current question,
+    fitted into CHAT_CONTEXT_TOKEN_BUDGET. Returns an empty list for the first message of a chat.
+    """
+    if not message.chat_history_id:
+        return []
+    turns = previous_turns(message, settings.CHAT_CONTEXT_MAX_TURNS)
+    if not turns:
+        return []
+
+    budget = settings.CHAT_CONTEXT_TOKEN_BUDGET - token_counter.count(
+        token_counter.truncate(message.question, settings.CHAT_MAX_QUESTION_TOKENS)
+    )
+    if summarizer is not None:
+        budget -= settings.CHAT_CONTEXT_SUMMARY_MAX_TOKENS
+    history, dropped = select_turns([(m.question, a.answer) for m, a in turns], max(budget, 0))
+
+    if dropped and summarizer is not None:
+        newest_dropped_id = turns[len(turns) - dropped][0].id
+        summary = summarizer.summary_for(message, newest_dropped_id)
+        if summary:
+            history.insert(0, {"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+    return history
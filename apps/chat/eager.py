@@ -0,0 +1,86 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+from apps.chat import metrics
+from apps.chat.models import Answer, Message
+
+_executor = ThreadPoolExecutor(max_workers=settings.CHAT_EAGER_ANSWER_WORKERS, thread_name_prefix="eager-answer")
+# Running + queued generations; beyond this new messages fall back to on-demand generation.
+_slots = threading.BoundedSemaphore(settings.CHAT_EAGER_ANSWER_WORKERS + settings.CHAT_EAGER_ANSWER_QUEUE)
+
+
+def schedule_answer_generation(message_id):
+    """
+    Starts generating the answer of a freshly committed message in the background.
+    Returns False when eager answers are disabled or the executor is saturated.
+    """
+    if not settings.CHAT_EAGER_ANSWERS:
+        return False
+    if not _slots.acquire(blocking=False):
+        metrics.incr("eager_answers_rejected")
+        return False
+
+    _shared_cache().set(in_flight_key(message_id), True, settings.CHAT_EAGER_ANSWER_TIMEOUT)
+    try:
+        future = _executor.submit(_generate, message_id)
+    except RuntimeError:
+        # The executor is shutting down
+        _slots.release()
+        _shared_cache().delete(in_flight_key(message_id))
+        return False
+    future.add_done_callback(lambda f: _slots.release())
+    metrics.incr("eager_answers_scheduled")
+    return True
+
+
+def _shared_cache():
+    return caches[settings.CHAT_ANSWER_CACHE_ALIAS]
+
+
+def in_flight_key(message_id):
+    return f"chat:eager_answer:{message_id}"
+
+
+def in_flight(message_id):
+    """
+    Whether an eager generation of the message is queued or running in some worker. The mark expires after
+    CHAT_EAGER_ANSWER_TIMEOUT, so work lost with a restarted worker stops counting.
+    """
+    return _shared_cache().get(in_flight_key(message_id)) is not None
+
+
+def _generate(message_id):
+    from apps.chat.service import get_or_generate_answer, log_chatbot_error
+
+    try:
+        message = Message.objects.filter(pk=message_id).first()
+        if message is None:
+            return
+        get_or_generate_answer(message)
+    except Exception as e:
+        log_chatbot_error(e)
+    finally:
+        _shared_cache().delete(in_flight_key(message_id))
+        connection.close()
+
+
+def wait_for_answer(message_id, timeout, poll_interval=0.25):
+    """
+    Long-polls for the first answer of the message while its eager generation is in flight; returns None when the
+    timeout expires or nothing is generating it.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        answer = Answer.objects.filter(message_id=message_id).order_by('-version').first()
+        if answer is not None or time.monotonic() >= deadline or not in_flight(message_id):
+            return answer
+        time.sleep(poll_interval)
+
+
+def stats():
+    return metrics.get_counters("eager_answers_scheduled", "eager_answers_rejected")
@@ -0,0 +1,142 @@
+"""
+One Entitlement row per user holds the current tariff and the requests left of it. A successful payment replaces
+it (grant_payment), each message takes one request with a conditional UPDATE by primary key (consume_request), and
+reads of the tariff go through a per-process cache invalidated by a per-user version in the shared cache.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+from apps.chat.models import Entitlement, RequestCount
+from apps.prices_x_cards.models import Payment
+
+# Requests a user without a successful payment may send
+FREE_REQUESTS = 1
+
+
+def tariff_limit(product):
+    if product is None or not product.count_typing:
+        return FREE_REQUESTS
+    return product.count_typing
+
+
+def initial_entitlement(user_id):
+    """An unsaved entitlement derived from the payment and RequestCount history (users from before Entitlement)."""
+    payment = Payment.objects.filter(user_id=user_id, status='success').select_related('product_pocket').order_by(
+        '-created', '-id'
+    ).first()
+    product = payment.product_pocket if payment else None
+    limit = tariff_limit(product)
+    used = RequestCount.objects.filter(user_id=user_id).order_by('-id').values_list('request_count', flat=True).first()
+    return Entitlement(
+        user_id=user_id, product=product, payment=payment, request_limit=limit, remaining=max(limit - (used or 0), 0),
+        period_start=payment.created if payment else None,
+    )
+
+
+def ensure_entitlement(user_id):
+    entitlement = Entitlement.objects.filter(pk=user_id).first()
+    if entitlement is not None:
+        return entitlement
+    entitlement = initial_entitlement(user_id)
+    try:
+        with transaction.atomic():
+            entitlement.save(force_insert=True)
+    except IntegrityError:
+        entitlement = Entitlement.objects.get(pk=user_id)
+    return entitlement
+
+
+def consume_request(user_id):
+    """
+    Takes one request from the user's entitlement in a single UPDATE by primary key that only matches while requests
+    are left and the period has not ended, so concurrent messages cannot oversell. False when nothing is left.
+    """
+    for _ in range(2):
+        consumed = Entitlement.objects.filter(
+            Q(period_end__isnull=True) | Q(period_end__gt=now()), pk=user_id, remaining__gt=0
+        ).update(remaining=F('remaining') - 1)
+        if consumed:
+            return True
+        if Entitlement.objects.filter(pk=user_id).exists():
+            return False
+        ensure_entitlement(user_id)
+    return False
+
+
+def grant_payment(payment):
+    """Makes a successful payment's tariff the user's entitlement with a full quota; saving it again changes nothing."""
+    if payment.status != 'success' or payment.user_id is None:
+        return
+    product = payment.product_pocket
+    limit = tariff_limit(product)
+    values = {
+        'product': product, 'payment': payment, 'request_limit': limit, 'remaining': limit,
+        'period_start': payment.created or now(), 'period_end': None,
+    }
+    with transaction.atomic():
+        granted = Entitlement.objects.filter(pk=payment.user_id).exclude(payment=payment).update(
+            **values, version=F('version') + 1, updated=now()
+        )
+        if not granted and not Entitlement.objects.filter(pk=payment.user_id).exists():
+            try:
+                with transaction.atomic():
+                    Entitlement.objects.create(user_id=payment.user_id, **values)
+            except IntegrityError:
+                Entitlement.objects.filter(pk=payment.user_id).update(**values, version=F('version') + 1, updated=now())
+        transaction.on_commit(lambda: entitlement_cache.invalidate(payment.user_id))
+
+
+class EntitlementCache:
+    """
+    Per-process cache of entitlements for reads of the tariff (limit, product, priority); `remaining` of a cached
+    entitlement may lag behind, consume_request() is what enforces the quota. An entry is used while its row version
+    equals the user's version in the shared cache (CHAT_ENTITLEMENT_VERSION_CACHE_ALIAS), which grant_payment()
+    moves forward, and at most `ttl` seconds.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def shared_cache():
+        return caches[settings.CHAT_ENTITLEMENT_VERSION_CACHE_ALIAS]
+
+    @staticmethod
+    def version_key(user_id):
+        return f"chat:entitlement_version:{user_id}"
+
+    def get(self, user_id):
+        shared_version = self.shared_cache().get(self.version_key(user_id))
+        with self.lock:
+            entry = self.entries.get(user_id)
+        if entry is not None:
+            version, expires, entitlement = entry
+            if version == shared_version and time.monotonic() < expires:
+                return entitlement
+
+        entitlement = ensure_entitlement(user_id)
+        if shared_version is None:
+            self.shared_cache().add(self.version_key(user_id), entitlement.version, self.ttl)
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                self.entries.clear()
+            self.entries[user_id] = (entitlement.version, time.monotonic() + self.ttl, entitlement)
+        return entitlement
+
+    def invalidate(self, user_id):
+        version = Entitlement.objects.filter(pk=user_id).values_list('version', flat=True).first()
+        self.shared_cache().set(self.version_key(user_id), version, self.ttl)
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+
+entitlement_cache = EntitlementCache(settings.CHAT_ENTITLEMENT_CACHE_TTL, settings.CHAT_ENTITLEMENT_CACHE_SIZE)
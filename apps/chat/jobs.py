@@ -0,0 +1,107 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from apps.chat.models import GenerationJob
+from apps.chat.service import get_or_generate_answer, log_chatbot_error
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ['pending', 'running']
+
+
+def enqueue_answer_job(message):
+    """
+    Returns the active job of the message, creating one when there is none. A message has at most one active job
+    (chat_genjob_active_uniq), so concurrent calls get the same job.
+    """
+    job, created = GenerationJob.objects.get_or_create(message=message, status__in=ACTIVE_STATUSES)
+    return job
+
+
+def expired_jobs(now):
+    return GenerationJob.objects.filter(status='running', lease_until__lt=now)
+
+
+def claimable_jobs(now):
+    # Pending jobs whose retry delay has passed, and running jobs whose worker lost its lease,
+    # while they have attempts left
+    return GenerationJob.objects.filter(
+        Q(lease_until__isnull=True) | Q(lease_until__lt=now),
+        status__in=ACTIVE_STATUSES,
+        attempts__lt=settings.CHAT_JOB_MAX_ATTEMPTS,
+    )
+
+
+def fail_exhausted_jobs(now):
+    """Fails the running jobs whose lease expired on their last attempt (e.g. the job keeps killing its worker)."""
+    return expired_jobs(now).filter(attempts__gte=settings.CHAT_JOB_MAX_ATTEMPTS).update(
+        status='failed', lease_until=None, error="Lease expired on the last attempt.", updated=now,
+    )
+
+
+def claim_job(worker_id, lease_seconds=None):
+    """
+    Leases the oldest claimable job to the worker.
+    The claim is a conditional UPDATE, so two workers can never hold the same job and no row locks are needed.
+    """
+    lease_seconds = lease_seconds or settings.CHAT_JOB_LEASE_SECONDS
+    now = timezone.now()
+    fail_exhausted_jobs(now)
+    candidate_ids = list(claimable_jobs(now).order_by('created').values_list('id', flat=True)[:10])
+    for job_id in candidate_ids:
+        claimed = claimable_jobs(now).filter(pk=job_id).update(
+            status='running',
+            worker=worker_id,
+            lease_until=now + timedelta(seconds=lease_seconds),
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return GenerationJob.objects.select_related('message').get(pk=job_id)
+    return None
+
+
+def finish_job(job, **values):
+    """
+    Stores the outcome of a claimed job only while the worker still holds its lease; returns False when the lease
+    was lost (the job was taken over by another worker, whose outcome stands).
+    """
+    values['updated'] = timezone.now()
+    finished = GenerationJob.objects.filter(pk=job.pk, status='running', lease_until=job.lease_until).update(**values)
+    if finished:
+        for field, value in values.items():
+            setattr(job, field, value)
+    else:
+        logger.warning("Generation job %s lost its lease before it finished", job.pk)
+        job.refresh_from_db()
+    return bool(finished)
+
+
+def run_job(job):
+    try:
+        answer, created = get_or_generate_answer(job.message, fail_silently=False)
+    except Exception as e:
+        log_chatbot_error(e)
+        error = f"{type(e).__name__}: {e}"
+        if job.attempts >= settings.CHAT_JOB_MAX_ATTEMPTS:
+            finish_job(job, status='failed', error=error, lease_until=None)
+        else:
+            retry_at = timezone.now() + timedelta(seconds=settings.CHAT_JOB_RETRY_DELAY * job.attempts)
+            finish_job(job, status='pending', error=error, lease_until=retry_at)
+        return job
+
+    finish_job(job, answer=answer, status='done', lease_until=None, error=None)
+    return job
+
+
+def wait_for_job(job, timeout, poll_interval=0.5):
+    """Long-polls until the job is finished or the timeout expires."""
+    deadline = time.monotonic() + timeout
+    while job.status in ACTIVE_STATUSES and time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        job.refresh_from_db()
+    return job
@@ -0,0 +1,63 @@
+"""
+RequestCount is no longer written: the quota lives in Entitlement (apps.chat.entitlements), which a successful payment
+resets. The table only holds the usage of users from before Entitlement, read by initial_entitlement() when their
+Entitlement row is first created, and that reads the newest row. compact_request_counts reduces it to that row per
+user; the removed rows are summarized into the append-only RequestCountLedger.
+"""
+from django.db import transaction
+from django.db.models import Count
+
+from apps.chat.models import RequestCount, RequestCountLedger
+
+
+def ledger_entry(user_id, rows, reason):
+    """An unsaved ledger row describing `rows` (RequestCount instances, oldest first)."""
+    return RequestCountLedger(
+        user_id=user_id,
+        reason=reason,
+        rows_compacted=len(rows),
+        request_count_total=sum(row.request_count or 0 for row in rows),
+        first_created=rows[0].created,
+        last_created=rows[-1].created,
+        entries=[
+            {
+                "id": row.id,
+                "request_count": row.request_count,
+                "is_active": row.is_active,
+                "created": row.created.isoformat() if row.created else None,
+            }
+            for row in rows
+        ],
+    )
+
+
+def compact_user_request_counts(user_id):
+    """Keeps only the user's newest RequestCount row (the one readers use); returns the number of rows removed."""
+    with transaction.atomic():
+        rows = list(RequestCount.objects.select_for_update().filter(user_id=user_id).order_by('id'))
+        historic = rows[:-1]
+        if not historic:
+            return 0
+        ledger_entry(user_id, historic, 'compaction').save()
+        RequestCount.objects.filter(id__in=[row.id for row in historic]).delete()
+        RequestCount.objects.filter(pk=rows[-1].pk).update(is_active=True)
+    return len(historic)
+
+
+def compact_request_counts(batch_size=1000, limit=None):
+    """Compacts every user with more than one RequestCount row; returns (users, rows removed)."""
+    users = removed = 0
+    last_user_id = 0
+    while limit is None or users < limit:
+        user_ids = list(
+            RequestCount.objects.filter(user_id__gt=last_user_id).order_by('user_id').values('user_id')
+            .annotate(rows=Count('id')).filter(rows__gt=1).values_list('user_id', flat=True)[:batch_size]
+        )
+        if not user_ids:
+            break
+        for user_id in user_ids:
+            removed += compact_user_request_counts(user_id)
+        users += len(user_ids)
+        last_user_id = user_ids[-1]
+    return users, removed
+
@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import os
+import random
+import time
+
+import httpx
+import openai
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class LLMBackend:
+    """
+    Chat-completion backend. `messages` are in the OpenAI chat format; `stream`/`astream` yield text deltas.
+    Backends are selected with settings.CHAT_LLM and raise on upstream errors; `timeout` bounds a single call.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def complete(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        raise NotImplementedError
+
+    def stream(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        raise NotImplementedError
+
+    async def acomplete(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        raise NotImplementedError
+
+    async def astream(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        raise NotImplementedError
+        yield
+
+
+class OpenAIBackend(LLMBackend):
+
+    def __init__(self, model, api_key=None, base_url=None, **client_options):
+        super().__init__(model)
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        pool = settings.CHAT_LLM_POOL
+        limits = httpx.Limits(
+            max_connections=pool['MAX_CONNECTIONS'],
+            max_keepalive_connections=pool['MAX_KEEPALIVE_CONNECTIONS'],
+            keepalive_expiry=pool['KEEPALIVE_EXPIRY'],
+        )
+        timeout = httpx.Timeout(settings.CHAT_LLM_TIMEOUT, connect=pool['CONNECT_TIMEOUT'])
+        # Retries are done by apps.chat.resilience, which also knows the total deadline
+        client_options.setdefault('max_retries', 0)
+        self.client = openai.OpenAI(
+            api_key=api_key, base_url=base_url, timeout=timeout,
+            http_client=openai.DefaultHttpxClient(limits=limits, timeout=timeout), **client_options
+        )
+        self.async_client = openai.AsyncOpenAI(
+            api_key=api_key, base_url=base_url, timeout=timeout,
+            http_client=openai.DefaultAsyncHttpxClient(limits=limits, timeout=timeout), **client_options
+        )
+
+    @staticmethod
+    def request_options(timeout):
+        return {'timeout': timeout} if timeout is not None else {}
+
+    def complete(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **self.request_options(timeout)
+        )
+        return response.choices[0].message.content
+
+    def stream(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            **self.request_options(timeout)
+        )
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            stream.close()
+
+    async def acomplete(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        response = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **self.request_options(timeout)
+        )
+        return response.choices[0].message.content
+
+    async def astream(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        stream = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            **self.request_options(timeout)
+        )
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            await stream.close()
+
+
+FAKE_WORDS = (
+    "health", "rest", "water", "doctor", "symptoms", "dose", "tablet", "fever", "pain", "sleep", "diet",
+    "blood", "pressure", "vitamin", "treatment", "consult", "daily", "mild", "infection", "recovery",
+)
+
+
+class FakeBackend(LLMBackend):
+    """
+    Offline backend for load tests. The answer is derived from a hash of the messages, so the same prompt always
+    gets the same answer. Timing follows `latency` (seconds to the first token) and `tokens_per_second`;
+    each word counts as one token.
+    """
+
+    def __init__(self, model, latency=0.5, tokens_per_second=50.0, answer_tokens=120):
+        super().__init__(model)
+        self.latency = float(latency)
+        self.tokens_per_second = float(tokens_per_second)
+        self.answer_tokens = int(answer_tokens)
+
+    def tokens(self, messages, max_tokens):
+        digest = hashlib.sha256(repr(messages).encode()).digest()
+        rnd = random.Random(digest)
+        count = min(max_tokens, self.answer_tokens)
+        words = [rnd.choice(FAKE_WORDS) for _ in range(count)]
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    def token_delay(self):
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+
+    @staticmethod
+    def delay(seconds, timeout):
+        """The time to wait before answering, or before failing with TimeoutError when it exceeds `timeout`."""
+        if timeout is not None and seconds > timeout:
+            return timeout, True
+        return seconds, False
+
+    def complete(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        tokens = self.tokens(messages, max_tokens)
+        seconds, timed_out = self.delay(self.latency + len(tokens) * self.token_delay(), timeout)
+        time.sleep(seconds)
+        if timed_out:
+            raise TimeoutError("Fake LLM request timed out")
+        return "".join(tokens)
+
+    def stream(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        seconds, timed_out = self.delay(self.latency, timeout)
+        time.sleep(seconds)
+        if timed_out:
+            raise TimeoutError("Fake LLM request timed out")
+        for token in self.tokens(messages, max_tokens):
+            time.sleep(self.token_delay())
+            yield token
+
+    async def acomplete(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        tokens = self.tokens(messages, max_tokens)
+        seconds, timed_out = self.delay(self.latency + len(tokens) * self.token_delay(), timeout)
+        await asyncio.sleep(seconds)
+        if timed_out:
+            raise TimeoutError("Fake LLM request timed out")
+        return "".join(tokens)
+
+    async def astream(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        seconds, timed_out = self.delay(self.latency, timeout)
+        await asyncio.sleep(seconds)
+        if timed_out:
+            raise TimeoutError("Fake LLM request timed out")
+        for token in self.tokens(messages, max_tokens):
+            await asyncio.sleep(self.token_delay())
+            yield token
+
+
+def load_backend(config=None):
+    config = config or settings.CHAT_LLM
+    backend_class = import_string(config['BACKEND'])
+    backend = backend_class(model=config.get('MODEL', settings.CHAT_MODEL), **config.get('OPTIONS', {}))
+    # the scheduler goes inside the retries: a slot is held per attempt, not through the backoff sleeps
+    if config.get('SCHEDULED', True):
+        from apps.chat.scheduler import LLMScheduler, ScheduledBackend
+        backend = ScheduledBackend(backend, LLMScheduler(
+            "llm",
+            max_concurrency=settings.CHAT_LLM_MAX_CONCURRENCY,
+            max_queue=settings.CHAT_LLM_MAX_QUEUE,
+            queue_timeout=settings.CHAT_LLM_QUEUE_TIMEOUT,
+        ))
+    if config.get('RESILIENT', True):
+        from apps.chat.resilience import ResilientBackend
+        backend = ResilientBackend(backend)
+    return backend
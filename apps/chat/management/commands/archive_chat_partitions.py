@@ -0,0 +1,50 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.timezone import now
+
+from apps.chat.archive import archive_month
+from apps.chat.partitions import add_months, ensure_partitions, is_partitioned, month_partitions, month_start
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the monthly chat_message/chat_answer partitions of the coming months, then move months older than "
+        "CHAT_ARCHIVE_AFTER_MONTHS into gzipped JSONL files under CHAT_ARCHIVE_DIR and drop their partitions. "
+        "Archived chats are restored when they are opened. PostgreSQL only; run it monthly from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=None,
+                            help="Archive months older than this many months (default CHAT_ARCHIVE_AFTER_MONTHS).")
+        parser.add_argument('--ahead', type=int, default=None,
+                            help="Months of partitions to create ahead (default CHAT_PARTITION_MONTHS_AHEAD).")
+        parser.add_argument('--limit', type=int, default=None, help="Archive at most this many months.")
+        parser.add_argument('--batch-size', type=int, default=10000, help="Rows per export query.")
+        parser.add_argument('--dry-run', action='store_true', help="Only list the months that would be archived.")
+
+    def handle(self, *args, **options):
+        if not is_partitioned(connection, 'chat_message'):
+            raise CommandError("chat_message is not partitioned; this needs PostgreSQL with migration 0017 applied.")
+        months = settings.CHAT_ARCHIVE_AFTER_MONTHS if options['months'] is None else options['months']
+        ahead = settings.CHAT_PARTITION_MONTHS_AHEAD if options['ahead'] is None else options['ahead']
+        cutoff = add_months(month_start(now()), -months)
+        due = sorted(month for month in month_partitions(connection, 'chat_message') if month < cutoff)
+        if options['limit'] is not None:
+            due = due[:options['limit']]
+
+        if options['dry_run']:
+            self.stdout.write(f"Would archive: {', '.join(f'{month:%Y-%m}' for month in due) or 'nothing'}")
+            return
+        created = ensure_partitions(connection, ahead)
+        if created:
+            self.stdout.write(f"Created partitions {', '.join(created)}")
+        for month in due:
+            started = time.monotonic()
+            archive = archive_month(month, batch_size=options['batch_size'])
+            self.stdout.write(
+                f"Archived {month:%Y-%m}: {archive.messages_count} messages, {archive.answers_count} answers, "
+                f"{archive.chats.count()} chats, {time.monotonic() - started:.1f}s"
+            )
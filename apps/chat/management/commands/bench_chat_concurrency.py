@@ -0,0 +1,84 @@
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test a chat endpoint with a fixed number of concurrent clients and report throughput and latency.\n"
+        "Run it once against the sync stack and once against the ASGI stack, e.g.:\n"
+        "  gunicorn config.wsgi -w 4 -b 127.0.0.1:8000\n"
+        "  uvicorn config.asgi:application --workers 4 --port 8001\n"
+        "and compare /chat/message/answer/<id>/ with /chat/async/message/answer/<id>/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help="Full endpoint URL, e.g. http://127.0.0.1:8000/chat/message/answer/1/")
+        parser.add_argument('--token', required=True, help="JWT access token sent as 'Bearer <token>'.")
+        parser.add_argument('--method', default='GET', choices=['GET', 'POST'])
+        parser.add_argument('--data', default=None, help="JSON body for POST requests.")
+        parser.add_argument('--concurrency', type=int, default=100, help="Number of clients sending at once.")
+        parser.add_argument('--requests', type=int, default=500, help="Total number of requests.")
+        parser.add_argument('--timeout', type=float, default=120.0, help="Per-request timeout in seconds.")
+
+    def handle(self, *args, **options):
+        results = asyncio.run(self.run(options))
+        self.report(results, options)
+
+    async def run(self, options):
+        queue = asyncio.Queue()
+        for _ in range(options['requests']):
+            queue.put_nowait(None)
+
+        results = {'latencies': [], 'errors': {}, 'in_flight': 0, 'max_in_flight': 0}
+        limits = httpx.Limits(max_connections=options['concurrency'], max_keepalive_connections=options['concurrency'])
+        headers = {'Authorization': f"Bearer {options['token']}"}
+        body = json.loads(options['data']) if options['data'] else None
+
+        async with httpx.AsyncClient(limits=limits, timeout=options['timeout'], headers=headers) as client:
+            async def worker():
+                while not queue.empty():
+                    queue.get_nowait()
+                    results['in_flight'] += 1
+                    results['max_in_flight'] = max(results['max_in_flight'], results['in_flight'])
+                    started = time.perf_counter()
+                    try:
+                        response = await client.request(options['method'], options['url'], json=body)
+                        if response.status_code >= 400:
+                            key = str(response.status_code)
+                            results['errors'][key] = results['errors'].get(key, 0) + 1
+                        else:
+                            results['latencies'].append(time.perf_counter() - started)
+                    except httpx.HTTPError as e:
+                        key = type(e).__name__
+                        results['errors'][key] = results['errors'].get(key, 0) + 1
+                    finally:
+                        results['in_flight'] -= 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(options['concurrency'])))
+            results['elapsed'] = time.perf_counter() - started
+
+        return results
+
+    def report(self, results, options):
+        latencies = sorted(results['latencies'])
+        ok = len(latencies)
+        self.stdout.write(f"URL:             {options['method']} {options['url']}")
+        self.stdout.write(f"Concurrency:     {options['concurrency']}")
+        self.stdout.write(f"Completed:       {ok}/{options['requests']} in {results['elapsed']:.2f}s")
+        self.stdout.write(f"Throughput:      {ok / results['elapsed']:.1f} req/s")
+        if latencies:
+            def percentile(p):
+                return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+            self.stdout.write(f"Latency mean:    {statistics.mean(latencies) * 1000:.0f} ms")
+            self.stdout.write(f"Latency p50:     {percentile(0.50) * 1000:.0f} ms")
+            self.stdout.write(f"Latency p95:     {percentile(0.95) * 1000:.0f} ms")
+            self.stdout.write(f"Latency p99:     {percentile(0.99) * 1000:.0f} ms")
+        if results['errors']:
+            self.stdout.write(self.style.WARNING(f"Errors:          {results['errors']}"))
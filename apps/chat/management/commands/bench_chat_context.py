@@ -0,0 +1,84 @@
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.chat.context import select_turns, token_counter, turn_messages
+from apps.chat.models import Message
+
+
+SAMPLE_QUESTIONS = [
+    "У меня болит голова уже третий день, что делать?",
+    "Можно ли принимать ибупрофен вместе с парацетамолом?",
+    "What are the early symptoms of type 2 diabetes?",
+    "How much vitamin D should an adult take per day?",
+    "Boshim aylanyapti va ko‘nglim ayniyapti, bu nima bo‘lishi mumkin?",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the prompt size, build time and (with --call) LLM latency of the token-budgeted context "
+        "against naive concatenation of the whole chat history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chat', type=int, default=None, help="Use the turns of this chat instead of synthetic ones.")
+        parser.add_argument('--turns', type=int, default=60, help="Number of synthetic turns.")
+        parser.add_argument('--answer-chars', type=int, default=1200, help="Length of synthetic answers.")
+        parser.add_argument('--budget', type=int, default=None, help="Token budget, CHAT_CONTEXT_TOKEN_BUDGET by default.")
+        parser.add_argument('--repeat', type=int, default=20, help="Times to build each prompt.")
+        parser.add_argument('--call', action='store_true', help="Also send both prompts to the LLM backend.")
+
+    def handle(self, *args, **options):
+        turns = self.load_turns(options)
+        if not turns:
+            raise CommandError("No answered messages to build a context from.")
+        question = turns[0][0]
+        history_turns = turns[1:]
+        budget = options['budget'] or settings.CHAT_CONTEXT_TOKEN_BUDGET
+
+        def naive():
+            return [m for q, a in reversed(history_turns) for m in turn_messages(q, a)]
+
+        def budgeted():
+            return select_turns(history_turns, budget - token_counter.count(question))[0]
+
+        for name, build in (('naive', naive), ('budgeted', budgeted)):
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                history = build()
+                timings.append(time.perf_counter() - started)
+            self.stdout.write(
+                f"{name:>9}: {len(history) // 2} turns, {token_counter.count_messages(history)} prompt tokens, "
+                f"build {statistics.median(timings) * 1000:.2f} ms"
+            )
+            if options['call']:
+                self.call(name, question, history)
+
+    def load_turns(self, options):
+        """(question, answer) pairs, newest first."""
+        if options['chat']:
+            messages = Message.objects.filter(chat_history_id=options['chat']).order_by('-id').prefetch_related('answers')
+            return [
+                (m.question, max(m.answers.all(), key=lambda a: a.version).answer)
+                for m in messages if m.answers.all()
+            ]
+        rnd = random.Random(1)
+        return [
+            (rnd.choice(SAMPLE_QUESTIONS), " ".join(rnd.choice(SAMPLE_QUESTIONS) for _ in range(options['answer_chars'] // 50)))
+            for _ in range(options['turns'] + 1)
+        ]
+
+    def call(self, name, question, history):
+        from apps.chat.service import request_completion, detect_language
+        started = time.perf_counter()
+        try:
+            request_completion(question, detect_language(question), history)
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"{name:>9}: LLM call failed: {e}"))
+            return
+        self.stdout.write(f"{name:>9}: LLM call {time.perf_counter() - started:.2f} s")
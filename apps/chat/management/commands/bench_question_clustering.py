@@ -0,0 +1,182 @@
+import difflib
+import itertools
+import random
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.chat.clustering import QuestionClusterer
+
+TEMPLATES = [
+    "у меня {symptom} уже {duration}, что делать",
+    "можно ли принимать {drug} если у {person} {symptom}",
+    "{person} {symptom} {duration}, какой {drug} лучше",
+    "what should I do about {symptom_en} for {duration_en}",
+    "is it safe to take {drug} with {symptom_en}",
+    "can my {person_en} take {drug} for {symptom_en}",
+    "{symptom_uz} {duration_uz} davom etyapti, nima qilish kerak",
+    "{drug} ni {symptom_uz} bo‘lganda ichsa bo‘ladimi",
+]
+SLOTS = {
+    "symptom": ["болит голова", "высокая температура", "кашель", "насморк", "болит живот", "тошнота", "болит горло",
+                "давление", "бессонница", "сыпь", "болит спина", "изжога"],
+    "symptom_en": ["headache", "fever", "cough", "runny nose", "stomach ache", "nausea", "sore throat",
+                   "high blood pressure", "insomnia", "rash", "back pain", "heartburn"],
+    "symptom_uz": ["bosh og‘rig‘i", "isitma", "yo‘tal", "tumov", "qorin og‘rig‘i", "ko‘ngil aynishi",
+                   "tomoq og‘rig‘i", "qon bosimi", "uyqusizlik", "toshma"],
+    "duration": ["два дня", "неделю", "три дня", "месяц", "со вчерашнего дня", "несколько часов"],
+    "duration_en": ["two days", "a week", "three days", "a month", "since yesterday", "a few hours"],
+    "duration_uz": ["ikki kundan beri", "bir haftadan beri", "uch kundan beri", "bir oydan beri"],
+    "drug": ["ибупрофен", "парацетамол", "аспирин", "амоксициллин", "лоратадин", "омепразол", "нурофен",
+             "ibuprofen", "paracetamol", "aspirin", "amoxicillin", "loratadine"],
+    "person": ["ребенка", "мамы", "беременной", "пожилого человека", "меня"],
+    "person_en": ["child", "mother", "grandfather", "wife", "husband"],
+}
+FILLERS = ["пожалуйста", "подскажите", "please", "hi", "здравствуйте", "salom", "срочно", ""]
+
+
+def base_question(rnd):
+    template = rnd.choice(TEMPLATES)
+    return template.format(**{slot: rnd.choice(values) for slot, values in SLOTS.items()})
+
+
+def variant(rnd, question):
+    """A near-duplicate: typos, filler words, case and punctuation."""
+    chars = list(question)
+    for _ in range(rnd.randint(0, 3)):
+        i = rnd.randrange(len(chars))
+        operation = rnd.random()
+        if operation < 0.4:
+            del chars[i]
+        elif operation < 0.7 and i + 1 < len(chars):
+            chars[i], chars[i + 1] = chars[i + 1], chars[i]
+        else:
+            chars.insert(i, rnd.choice("аеиоуaeiou"))
+    text = "".join(chars)
+    filler = rnd.choice(FILLERS)
+    if filler:
+        text = f"{filler}, {text}" if rnd.random() < 0.5 else f"{text} {filler}"
+    if rnd.random() < 0.3:
+        text = text.capitalize()
+    return text + rnd.choice(["?", "??", "", "!", "."])
+
+
+def synthetic_questions(count, family_size, seed=1):
+    """(questions, family ids); every family is one base question and its near-duplicates."""
+    rnd = random.Random(seed)
+    families = max(count // family_size, 1)
+    bases = {}
+    while len(bases) < families:
+        bases.setdefault(base_question(rnd), len(bases))
+    bases = list(bases)
+    family_ids = [rnd.randrange(families) for _ in range(count)]
+    return [variant(rnd, bases[family]) for family in family_ids], family_ids
+
+
+def difflib_groups(questions):
+    """The grouping done by MessageStatisticView before clustering was precomputed."""
+    grouped = []
+    used = set()
+    for question in questions:
+        if question in used:
+            continue
+        group = [question]
+        used.add(question)
+        for similar in difflib.get_close_matches(question, questions, n=10, cutoff=0.7):
+            if similar != question and similar not in used:
+                group.append(similar)
+                used.add(similar)
+        grouped.append(group)
+    return grouped
+
+
+def same_group_pairs(labels):
+    members = defaultdict(list)
+    for i, label in enumerate(labels):
+        members[label].append(i)
+    return {pair for group in members.values() for pair in itertools.combinations(group, 2)}
+
+
+def purity(labels, truth):
+    """Share of questions whose cluster's most common family is their own family."""
+    by_cluster = defaultdict(Counter)
+    for label, family in zip(labels, truth):
+        by_cluster[label][family] += 1
+    return sum(counter.most_common(1)[0][1] for counter in by_cluster.values()) / len(labels)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the MinHash/LSH question clustering on synthetic near-duplicate questions against the difflib "
+        "grouping MessageStatisticView used before. difflib is quadratic, so it runs on a sample and its time at full "
+        "size is extrapolated."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1_000_000, help="Number of synthetic questions.")
+        parser.add_argument('--family-size', type=int, default=25, help="Average near-duplicates per question.")
+        parser.add_argument('--chunk', type=int, default=10000, help="Questions per clustering chunk.")
+        parser.add_argument('--difflib-sample', type=int, default=2000, help="Questions grouped with difflib.")
+        parser.add_argument('--threshold', type=float, default=settings.CHAT_CLUSTER_THRESHOLD)
+
+    def cluster(self, questions, chunk, threshold):
+        clusterer = QuestionClusterer(threshold=threshold)
+        labels = []
+        next_key = 1
+        for start in range(0, len(questions), chunk):
+            chunk_labels, new_clusters = clusterer.assign(questions[start:start + chunk])
+            real_keys = list(range(next_key, next_key + len(new_clusters)))
+            next_key += len(new_clusters)
+            mapping = clusterer.register(real_keys)
+            labels.extend(mapping.get(int(label), int(label)) for label in chunk_labels)
+        return labels
+
+    def handle(self, *args, **options):
+        count = options['count']
+        started = time.monotonic()
+        questions, truth = synthetic_questions(count, options['family_size'])
+        self.stdout.write(f"Generated {count} questions in {len(set(truth))} families "
+                          f"({time.monotonic() - started:.1f}s)")
+
+        started = time.monotonic()
+        labels = self.cluster(questions, options['chunk'], options['threshold'])
+        minhash_seconds = time.monotonic() - started
+        self.stdout.write(
+            f"MinHash/LSH: {minhash_seconds:.1f}s ({count / minhash_seconds:,.0f} questions/s), "
+            f"{len(set(labels))} clusters, purity {purity(labels, truth):.3f}"
+        )
+
+        sample = min(options['difflib_sample'], count)
+        sample_questions = questions[:sample]
+        started = time.monotonic()
+        groups = difflib_groups(sample_questions)
+        difflib_seconds = time.monotonic() - started
+        extrapolated = difflib_seconds * (count / sample) ** 2
+        self.stdout.write(
+            f"difflib on {sample}: {difflib_seconds:.1f}s, {len(groups)} groups; "
+            f"extrapolated to {count}: {extrapolated / 3600:,.1f} h"
+        )
+
+        # Agreement on the sample: pairs difflib puts together that MinHash also puts together, and vice versa
+        position = {}
+        for group_id, group in enumerate(groups):
+            for question in group:
+                position.setdefault(question, group_id)
+        difflib_pairs = same_group_pairs([position[question] for question in sample_questions])
+        minhash_pairs = same_group_pairs(self.cluster(sample_questions, options['chunk'], options['threshold']))
+        truth_pairs = same_group_pairs(truth[:sample])
+
+        def share(pairs, reference):
+            return len(pairs & reference) / len(reference) if reference else 1.0
+
+        self.stdout.write(
+            f"Sample agreement: MinHash finds {share(minhash_pairs, difflib_pairs):.3f} of difflib's pairs, "
+            f"difflib finds {share(difflib_pairs, minhash_pairs):.3f} of MinHash's pairs"
+        )
+        self.stdout.write(
+            f"Sample recall of true near-duplicate pairs: MinHash {share(minhash_pairs, truth_pairs):.3f}, "
+            f"difflib {share(difflib_pairs, truth_pairs):.3f}"
+        )
+        self.stdout.write(self.style.SUCCESS(f"Speed-up at {count}: {extrapolated / minhash_seconds:,.0f}x"))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apps.chat.clustering import load_clusterer, cluster_pending_messages, recount_clusters
+from apps.chat.models import Message, QuestionCluster
+
+
+class Command(BaseCommand):
+    help = (
+        "Assign new messages to near-duplicate question clusters (read by /chat/message/statistics/). "
+        "Only messages without a cluster are processed, so it can run from cron or continuously with --follow."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--limit', type=int, default=None, help="Stop after about this many messages.")
+        parser.add_argument('--follow', action='store_true', help="Keep running and cluster new messages.")
+        parser.add_argument('--interval', type=float, default=10.0, help="Seconds between passes with --follow.")
+        parser.add_argument('--recount', action='store_true',
+                            help="Recompute every cluster size first (after messages were deleted).")
+        parser.add_argument('--reset', action='store_true', help="Drop all clusters and cluster every message again.")
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            Message.objects.exclude(cluster=None).update(cluster=None)
+            QuestionCluster.objects.all().delete()
+        if options['recount']:
+            recount_clusters()
+
+        started = time.monotonic()
+        clusterer = load_clusterer(options['batch_size'])
+        self.stdout.write(f"Loaded {clusterer.index.size} clusters in {time.monotonic() - started:.1f}s")
+
+        while True:
+            started = time.monotonic()
+            clustered, created = cluster_pending_messages(clusterer, options['batch_size'], options['limit'])
+            if clustered or not options['follow']:
+                self.stdout.write(
+                    f"Clustered {clustered} messages, {created} new clusters, {time.monotonic() - started:.1f}s"
+                )
+            if not options['follow']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from apps.chat.ledger import compact_request_counts
+
+
+class Command(BaseCommand):
+    help = (
+        "Collapse every user's legacy RequestCount rows into the newest one (the row a first Entitlement is derived "
+        "from); the removed rows are summarized in the append-only RequestCountLedger. Safe to run while serving "
+        "and to repeat."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Users looked up per query.")
+        parser.add_argument('--limit', type=int, default=None, help="Stop after about this many users.")
+
+    def handle(self, *args, **options):
+        users, removed = compact_request_counts(batch_size=options['batch_size'], limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(f"Compacted {users} users, removed {removed} RequestCount rows."))
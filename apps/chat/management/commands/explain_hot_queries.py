@@ -0,0 +1,129 @@
+import random
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.timezone import now
+
+from apps.accounts.models import CustomUser
+from apps.chat.models import ChatHistory, Message, RequestCount
+from apps.prices_x_cards.models import Payment, ProductPocket
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic users, chats, messages, request counters and payments, then print the EXPLAIN plan and the "
+        "median time of the queries behind the chat and payment endpoints. The seed data is rolled back unless "
+        "--keep is given; without --seed the existing data is used."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true', help="Insert synthetic data first.")
+        parser.add_argument('--keep', action='store_true', help="Keep the seeded data instead of rolling it back.")
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--chats', type=int, default=20, help="Chats per user.")
+        parser.add_argument('--messages', type=int, default=25, help="Messages per chat.")
+        parser.add_argument('--payments', type=int, default=5, help="Payments per user.")
+        parser.add_argument('--repeat', type=int, default=20, help="Times each query is run for the timing.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['seed']:
+                    self.seed(options)
+                self.analyze()
+                self.report(options['repeat'])
+                if options['seed'] and not options['keep']:
+                    raise Rollback
+        except Rollback:
+            self.stdout.write("Seed data rolled back.")
+
+    def seed(self, options):
+        started = time.monotonic()
+        run = uuid.uuid4().hex[:8]
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f"explain-{run}-{i}", email=f"explain-{run}-{i}@example.com", password="!")
+            for i in range(options['users'])
+        ])
+        chats = ChatHistory.all_objects.bulk_create([
+            ChatHistory(user=user, is_active=k == options['chats'] - 1)
+            for user in users for k in range(options['chats'])
+        ], batch_size=1000)
+        for start in range(0, len(chats), 200):
+            Message.all_objects.bulk_create([
+                Message(chat_history=chat, question=f"question {chat.id}-{k}", first_message=k == 0)
+                for chat in chats[start:start + 200] for k in range(options['messages'])
+            ], batch_size=5000)
+        RequestCount.objects.bulk_create([
+            RequestCount(user=user, request_count=random.randint(0, 10)) for user in users for _ in range(3)
+        ], batch_size=1000)
+        product = ProductPocket.objects.create(title=f"explain-{run}", price=100, price_type='RUB', count_typing=50)
+        Payment.objects.bulk_create([
+            Payment(user=user, product_pocket=product, amount=100, order_id=uuid.uuid4().hex,
+                    status=random.choice(['pending', 'success', 'failed']))
+            for user in users for _ in range(options['payments'])
+        ], batch_size=1000)
+        self.stdout.write(
+            f"Seeded {len(users)} users, {len(chats)} chats, {len(chats) * options['messages']} messages "
+            f"in {time.monotonic() - started:.1f}s"
+        )
+
+    def analyze(self):
+        # Fresh planner statistics, otherwise the plans reflect the table sizes before seeding
+        if connection.vendor in ('postgresql', 'sqlite'):
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+    def hot_queries(self):
+        user = CustomUser.objects.filter(chat_histories__isnull=False).order_by('-id').first()
+        chat = ChatHistory.objects.filter(user=user).order_by('-created', '-id').first()
+        payment = Payment.objects.exclude(order_id=None).order_by('-id').first()
+        today = now().date()
+        return [
+            ("chat list", ChatHistory.objects.filter(user=user).order_by('-created', '-id')[:20]),
+            ("weekly chats", ChatHistory.objects.filter(user=user, created__date__gte=today - timedelta(days=6))
+             .order_by('-created', '-id')),
+            ("active chats", ChatHistory.objects.filter(user=user, is_active=True)),
+            ("message page", Message.objects.filter(chat_history=chat).order_by('-created', '-id')[:20]),
+            ("first message", Message.objects.filter(chat_history=chat, first_message=True).order_by('created')[:1]),
+            ("request count", RequestCount.objects.filter(user=user).order_by('-id')[:1]),
+            ("last payment", Payment.objects.filter(user=user, status='success').order_by('created')[:1]),
+            ("user priority", Payment.objects.filter(user=user, status='success').values('user')
+             .annotate(priority=Max('product_pocket__count_typing'))),
+            ("payment by order", Payment.objects.filter(order_id=payment.order_id if payment else None)),
+        ]
+
+    def report(self, repeat):
+        for name, queryset in self.hot_queries():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append(time.perf_counter() - started)
+            plan = queryset.explain()
+            full_scan = self.is_full_scan(plan)
+            self.stdout.write(
+                (self.style.WARNING if full_scan else self.style.SUCCESS)(
+                    f"{name}: {statistics.median(timings) * 1000:.2f} ms{' (full table scan)' if full_scan else ''}"
+                )
+            )
+            self.stdout.write("    " + plan.replace("\n", "\n    "))
+
+    @staticmethod
+    def is_full_scan(plan):
+        if connection.vendor == 'postgresql':
+            return "Seq Scan" in plan
+        if connection.vendor == 'sqlite':
+            return any(
+                " SCAN " in f" {line}" and " USING " not in line and "CONSTANT ROW" not in line
+                for line in plan.splitlines()
+            )
+        return False
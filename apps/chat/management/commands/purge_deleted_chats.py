@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apps.chat.purge import purge_deleted_chats
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove chats marked deleted (together with their messages, answers and generation jobs) using batched "
+        "raw DELETE statements. Can run from cron or continuously with --follow."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help="Rows per DELETE statement.")
+        parser.add_argument('--older-than', type=int, default=0,
+                            help="Only purge chats deleted at least this many seconds ago.")
+        parser.add_argument('--limit', type=int, default=None, help="Stop after about this many chats.")
+        parser.add_argument('--follow', action='store_true', help="Keep running and purge newly deleted chats.")
+        parser.add_argument('--interval', type=float, default=60.0, help="Seconds between passes with --follow.")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            chats, messages, answers = purge_deleted_chats(
+                options['batch_size'], options['older_than'], options['limit']
+            )
+            if chats or not options['follow']:
+                self.stdout.write(
+                    f"Purged {chats} chats, {messages} messages, {answers} answers, {time.monotonic() - started:.1f}s"
+                )
+            if not options['follow']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
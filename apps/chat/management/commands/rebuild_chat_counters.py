@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from apps.chat.statistics import rebuild_chat_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the denormalized counters of every ChatHistory (message_count, answered_count, "
+        "last_message_at, first_question_preview) from messages and answers (safe to run while serving)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        processed = rebuild_chat_counters(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt counters of {processed} chats."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.chat.statistics import rebuild_user_message_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute UserMessageCounter for every user from the messages table (safe to run while serving)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        processed = rebuild_user_message_counters(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt message counters of {processed} users."))
@@ -0,0 +1,55 @@
+import os
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apps.chat.jobs import claim_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Runs N concurrent workers that generate answers for queued GenerationJob rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Number of worker threads.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--lease', type=int, default=settings.CHAT_JOB_LEASE_SECONDS,
+                            help="Seconds a claimed job stays leased before another worker may take it over.")
+        parser.add_argument('--once', action='store_true', help="Exit as soon as the queue is empty.")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        threads = [
+            threading.Thread(target=self.work, args=(f"{prefix}:{i}", stop, options), daemon=True)
+            for i in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Started {len(threads)} answer workers ({prefix}).")
+
+        try:
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping, waiting for running jobs to finish...")
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def work(self, worker_id, stop, options):
+        try:
+            while not stop.is_set():
+                job = claim_job(worker_id, options['lease'])
+                if job is None:
+                    if options['once']:
+                        return
+                    stop.wait(options['poll_interval'])
+                    continue
+                job = run_job(job)
+                self.stdout.write(f"[{worker_id}] job {job.id} (message {job.message_id}): {job.status}")
+        finally:
+            connection.close()
@@ -0,0 +1,133 @@
+import json
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from apps.chat.llm import FakeBackend
+
+
+class FakeChatCompletionsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    backend = None
+    error_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+
+        if random.random() < self.error_rate:
+            status = random.choice([429, 500, 503])
+            self.send_json(status, {"error": {"message": "Simulated upstream error", "type": "server_error"}})
+            return
+
+        messages = request.get("messages", [])
+        max_tokens = request.get("max_tokens") or 500
+        model = request.get("model", self.backend.model)
+        completion_id = f"chatcmpl-fake-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        if not request.get("stream"):
+            content = self.backend.complete(messages, max_tokens=max_tokens)
+            completion_tokens = len(content.split())
+            prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in messages)
+            self.send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(delta, finish_reason=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+
+        try:
+            event({"role": "assistant", "content": ""})
+            for token in self.backend.stream(messages, max_tokens=max_tokens):
+                event({"content": token})
+            event({}, finish_reason="stop")
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local server that speaks the OpenAI chat-completions wire format (including streaming) and answers "
+        "with apps.chat.llm.FakeBackend. Point the app at it with "
+        "CHAT_LLM_OPTIONS='{\"base_url\": \"http://127.0.0.1:9000/v1\"}'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=9000)
+        parser.add_argument('--latency', type=float, default=0.5, help="Seconds before the first token.")
+        parser.add_argument('--tokens-per-second', type=float, default=50.0)
+        parser.add_argument('--answer-tokens', type=int, default=120, help="Length of every answer in tokens.")
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help="Share of requests answered with a 429/500/503 error.")
+
+    def handle(self, *args, **options):
+        handler = type("Handler", (FakeChatCompletionsHandler,), {
+            "backend": FakeBackend(
+                model="fake",
+                latency=options['latency'],
+                tokens_per_second=options['tokens_per_second'],
+                answer_tokens=options['answer_tokens'],
+            ),
+            "error_rate": options['error_rate'],
+        })
+        server = ThreadingHTTPServer((options['host'], options['port']), handler)
+        server.daemon_threads = True
+        self.stdout.write(f"Fake LLM server listening on http://{options['host']}:{options['port']}/v1")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
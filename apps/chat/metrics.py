@@ -0,0 +1,33 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+METRIC_KEY_PREFIX = 'chat:metrics:'
+
+
+def _cache():
+    return caches[settings.CHAT_METRICS_CACHE_ALIAS]
+
+
+def incr(name, delta=1):
+    cache = _cache()
+    key = METRIC_KEY_PREFIX + name
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+async def aincr(name, delta=1):
+    # BaseCache.aincr() is a non-atomic get + set, so concurrent tasks would lose increments
+    await sync_to_async(incr)(name, delta)
+
+
+def get_counters(*names):
+    values = _cache().get_many([METRIC_KEY_PREFIX + name for name in names])
+    return {name: values.get(METRIC_KEY_PREFIX + name, 0) for name in names}
+
+
+def ratio(part, total):
+    return round(part / total, 4) if total else 0.0
@@ -0,0 +1,23 @@
+from django.core.management import call_command
+from django.db import migrations
+
+ANSWER_CACHE_TABLE = 'chat_answer_cache'
+
+
+def create_answer_cache_table(apps, schema_editor):
+    call_command('createcachetable', ANSWER_CACHE_TABLE, database=schema_editor.connection.alias, verbosity=0)
+
+
+def drop_answer_cache_table(apps, schema_editor):
+    schema_editor.execute(f'DROP TABLE IF EXISTS {schema_editor.quote_name(ANSWER_CACHE_TABLE)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_remove_chathistory_request_count_requestcount'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_answer_cache_table, drop_answer_cache_table),
+    ]
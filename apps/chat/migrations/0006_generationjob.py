@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_answer_cache_table'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попытки')),
+                ('lease_until', models.DateTimeField(blank=True, null=True, verbose_name='Аренда до')),
+                ('worker', models.CharField(blank=True, max_length=100, null=True, verbose_name='Обработчик')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Ошибка')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('answer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.answer', verbose_name='Ответ')),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='generation_jobs', to='chat.message', verbose_name='Сообщение')),
+            ],
+            options={
+                'verbose_name': 'Задача генерации ответа',
+                'verbose_name_plural': 'Задачи генерации ответов',
+                'ordering': ['created'],
+                'indexes': [models.Index(fields=['status', 'lease_until'], name='chat_genjob_status_lease_idx')],
+            },
+        ),
+    ]
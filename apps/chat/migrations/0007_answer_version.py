@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:48
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def number_existing_answers(apps, schema_editor):
+    # Messages answered more than once get versions 1..n in creation order
+    Answer = apps.get_model('chat', 'Answer')
+    duplicated = (
+        Answer.objects.values('message_id').annotate(total=Count('id')).filter(total__gt=1)
+        .values_list('message_id', flat=True)
+    )
+    for message_id in duplicated.iterator():
+        answers = list(Answer.objects.filter(message_id=message_id).order_by('created', 'id'))
+        for version, answer in enumerate(answers, start=1):
+            answer.version = version
+        Answer.objects.bulk_update(answers, ['version'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_generationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='version',
+            field=models.PositiveIntegerField(default=1, verbose_name='Версия'),
+        ),
+        migrations.RunPython(number_existing_answers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='answer',
+            constraint=models.UniqueConstraint(fields=('message', 'version'), name='chat_answer_message_version_uniq'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_answer_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chathistory',
+            index=models.Index(fields=['user', '-created', '-id'], name='chat_history_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat_history', '-created', '-id'], name='chat_msg_history_created_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('chat', '0008_chat_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserMessageCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='message_counter', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('message_count', models.PositiveIntegerField(default=0, verbose_name='Количество сообщений')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Счётчик сообщений пользователя',
+                'verbose_name_plural': 'Счётчики сообщений пользователей',
+                'indexes': [models.Index(fields=['-message_count', 'user'], name='chat_usercounter_count_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_usermessagecounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionCluster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('representative', models.TextField(verbose_name='Типичный вопрос')),
+                ('signature', models.BinaryField(verbose_name='Сигнатура')),
+                ('size', models.PositiveIntegerField(default=0, verbose_name='Количество вопросов')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Кластер вопросов',
+                'verbose_name_plural': 'Кластеры вопросов',
+                'ordering': ['-size', 'id'],
+                'indexes': [models.Index(fields=['-size', 'id'], name='chat_cluster_size_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='cluster',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='messages', to='chat.questioncluster', verbose_name='Кластер вопроса'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('cluster__isnull', True)), fields=['id'], name='chat_msg_unclustered_idx'),
+        ),
+    ]
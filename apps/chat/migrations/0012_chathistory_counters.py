@@ -0,0 +1,44 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:11
+
+from django.db import migrations, models
+
+
+def fill_counters(apps, schema_editor):
+    """
+    Counts the existing messages and answers into the new columns. The rebuild runs on the current models, which
+    is safe here because its queries only touch columns that exist at this point.
+    """
+    from apps.chat.statistics import rebuild_chat_counters
+
+    rebuild_chat_counters()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0011_chathistory_deleted_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chathistory',
+            name='answered_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Сообщений с ответом'),
+        ),
+        migrations.AddField(
+            model_name='chathistory',
+            name='first_question_preview',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='Первый вопрос'),
+        ),
+        migrations.AddField(
+            model_name='chathistory',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Последнее сообщение'),
+        ),
+        migrations.AddField(
+            model_name='chathistory',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество сообщений'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0012_chathistory_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chathistory',
+            index=models.Index(fields=['user', 'is_active'], name='chat_history_user_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('first_message', True)), fields=['chat_history', '-created'], name='chat_msg_first_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requestcount',
+            index=models.Index(fields=['user', '-id'], name='chat_reqcount_user_id_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('chat', '0013_hot_query_indexes'),
+        ('prices_x_cards', '0009_payment_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Entitlement',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='entitlement', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('request_limit', models.PositiveIntegerField(default=1, verbose_name='Лимит запросов')),
+                ('remaining', models.PositiveIntegerField(default=1, verbose_name='Осталось запросов')),
+                ('period_start', models.DateTimeField(blank=True, null=True, verbose_name='Начало периода')),
+                ('period_end', models.DateTimeField(blank=True, null=True, verbose_name='Конец периода')),
+                ('version', models.PositiveIntegerField(default=1, verbose_name='Версия')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='prices_x_cards.payment', verbose_name='Платёж')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='prices_x_cards.productpocket', verbose_name='Тариф')),
+            ],
+            options={
+                'verbose_name': 'Тариф пользователя',
+                'verbose_name_plural': 'Тарифы пользователей',
+            },
+        ),
+    ]
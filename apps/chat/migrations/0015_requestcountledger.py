@@ -0,0 +1,36 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0014_entitlement'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestCountLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.CharField(choices=[('compaction', 'Сжатие истории'), ('payment', 'Новый платёж')], max_length=20, verbose_name='Причина')),
+                ('rows_compacted', models.PositiveIntegerField(verbose_name='Сжато строк')),
+                ('request_count_total', models.PositiveIntegerField(verbose_name='Сумма запросов')),
+                ('first_created', models.DateTimeField(blank=True, null=True, verbose_name='Первая строка')),
+                ('last_created', models.DateTimeField(blank=True, null=True, verbose_name='Последняя строка')),
+                ('entries', models.JSONField(default=list, verbose_name='Строки')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='request_count_ledger', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Журнал сжатия счётчиков запросов',
+                'verbose_name_plural': 'Журнал сжатия счётчиков запросов',
+                'ordering': ['-created'],
+                'indexes': [models.Index(fields=['user', '-created'], name='chat_reqledger_user_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0015_requestcountledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True, verbose_name='Месяц')),
+                ('name', models.CharField(max_length=100, verbose_name='Каталог архива')),
+                ('buckets', models.PositiveIntegerField(verbose_name='Количество файлов')),
+                ('messages_count', models.PositiveIntegerField(default=0, verbose_name='Сообщений')),
+                ('answers_count', models.PositiveIntegerField(default=0, verbose_name='Ответов')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Архив сообщений',
+                'verbose_name_plural': 'Архивы сообщений',
+                'ordering': ['month'],
+            },
+        ),
+        migrations.AddField(
+            model_name='chathistory',
+            name='has_archived_messages',
+            field=models.BooleanField(default=False, verbose_name='Есть сообщения в архиве'),
+        ),
+        migrations.AlterField(
+            model_name='answer',
+            name='message',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='answers', to='chat.message', verbose_name='Сообщение'),
+        ),
+        migrations.AlterField(
+            model_name='generationjob',
+            name='answer',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.answer', verbose_name='Ответ'),
+        ),
+        migrations.AlterField(
+            model_name='generationjob',
+            name='message',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='generation_jobs', to='chat.message', verbose_name='Сообщение'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedChat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_history', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archives', to='chat.chathistory', verbose_name='История чата')),
+                ('archive', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chats', to='chat.messagearchive', verbose_name='Архив')),
+            ],
+            options={
+                'verbose_name': 'Чат в архиве',
+                'verbose_name_plural': 'Чаты в архиве',
+                'constraints': [models.UniqueConstraint(fields=('chat_history', 'archive'), name='chat_archivedchat_uniq')],
+            },
+        ),
+    ]
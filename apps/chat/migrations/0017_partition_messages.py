@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.migrations.exceptions import IrreversibleError
+
+from apps.chat.partitions import PARTITIONED_TABLES, convert_to_partitioned
+
+
+def partition_tables(apps, schema_editor):
+    """Monthly range partitions of chat_message and chat_answer on PostgreSQL; other databases keep plain tables."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in PARTITIONED_TABLES:
+        convert_to_partitioned(schema_editor, table, settings.CHAT_PARTITION_MONTHS_AHEAD)
+
+
+def unpartition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        raise IrreversibleError("chat_message and chat_answer stay partitioned; restore a backup to undo this.")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0016_message_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_tables, unpartition_tables),
+    ]
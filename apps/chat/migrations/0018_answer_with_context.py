@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+def mark_context_answers(apps, schema_editor):
+    """
+    Existing answers to follow-up messages may have been generated with the chat history; which ones cannot be
+    told any more, so all of them are kept out of the semantic cache.
+    """
+    Answer = apps.get_model('chat', 'Answer')
+    Answer.objects.exclude(message__first_message=True).update(with_context=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0017_partition_messages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='with_context',
+            field=models.BooleanField(default=False, verbose_name='С учётом контекста'),
+        ),
+        migrations.RunPython(mark_context_answers, migrations.RunPython.noop),
+    ]
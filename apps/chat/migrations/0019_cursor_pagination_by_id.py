@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0018_answer_with_context'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='message',
+            name='chat_msg_history_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='chathistory',
+            index=models.Index(fields=['user', '-id'], name='chat_history_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat_history', '-id'], name='chat_msg_history_id_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+from apps.chat.partitions import create_unique_indexes, default_partition_name, is_partitioned, month_partitions
+
+
+def index_answer_partitions(apps, schema_editor):
+    """
+    Databases partitioned by an earlier 0017 carry chat_answer_message_version_uniq as a unique constraint on
+    (message_id, version, created), which enforces nothing; it is replaced by the per-partition unique indexes.
+    """
+    connection = schema_editor.connection
+    if not is_partitioned(connection, 'chat_answer'):
+        return
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE chat_answer DROP CONSTRAINT IF EXISTS {quote('chat_answer_message_version_uniq')}")
+        for partition in [*month_partitions(connection, 'chat_answer').values(), default_partition_name('chat_answer')]:
+            create_unique_indexes(cursor, 'chat_answer', partition)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0019_cursor_pagination_by_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_answer_partitions, migrations.RunPython.noop),
+    ]
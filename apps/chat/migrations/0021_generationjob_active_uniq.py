@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:59
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def fail_duplicate_jobs(apps, schema_editor):
+    """Keeps the oldest active job of each message; the others, left by racing enqueues, are failed."""
+    GenerationJob = apps.get_model('chat', 'GenerationJob')
+    active = GenerationJob.objects.filter(status__in=['pending', 'running'])
+    duplicates = active.values('message_id').annotate(jobs=Count('id'), keep_id=Min('id')).filter(jobs__gt=1)
+    for row in list(duplicates.order_by()):
+        active.filter(message_id=row['message_id']).exclude(id=row['keep_id']).update(
+            status='failed', lease_until=None, error=f"Duplicate of job {row['keep_id']}."
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0020_answer_partition_unique_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='generationjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'running'])), fields=('message',), name='chat_genjob_active_uniq'),
+        ),
+    ]
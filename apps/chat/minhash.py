@@ -0,0 +1,199 @@
+import zlib
+
+import numpy as np
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+class MinHasher:
+    """
+    MinHash signatures over character n-grams of an already normalized string.
+    The share of equal positions between two signatures estimates the Jaccard similarity of their n-gram sets.
+    """
+
+    def __init__(self, num_perm=64, ngram=3, seed=1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.ngram = ngram
+        self.a = rng.randint(1, 1 << 61, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 61, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text):
+        text = f" {text} "
+        if len(text) <= self.ngram:
+            return {text}
+        return {text[i:i + self.ngram] for i in range(len(text) - self.ngram + 1)}
+
+    def signature(self, text):
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in self.shingles(text)), dtype=np.uint64
+        )
+        permuted = (np.outer(self.a, hashes) + self.b[:, None]) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def signatures(self, texts):
+        """Signatures of many texts at once, one row per text; same values as signature()."""
+        shingle_hashes = []
+        offsets = []
+        for text in texts:
+            offsets.append(len(shingle_hashes))
+            shingle_hashes.extend(zlib.crc32(shingle.encode("utf-8")) for shingle in self.shingles(text))
+        if not offsets:
+            return np.zeros((0, self.num_perm), dtype=np.uint32)
+        hashes = np.asarray(shingle_hashes, dtype=np.uint64)
+        permuted = (np.outer(self.a, hashes) + self.b[:, None]) % MERSENNE_PRIME & MAX_HASH
+        return np.minimum.reduceat(permuted, np.asarray(offsets), axis=1).T.astype(np.uint32)
+
+
+class LSHIndex:
+    """
+    Banded LSH over MinHash signatures.
+
+    Every band keeps a sorted array of band hashes, so a lookup is one binary search per band and memory stays at
+    a few bytes per row and band even with millions of rows. New rows go into a small per-band dict and are merged
+    into the sorted arrays in batches, which keeps inserts cheap.
+    """
+
+    def __init__(self, num_perm=64, bands=16, merge_every=4096):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.merge_every = merge_every
+        self.band_multipliers = np.random.RandomState(7).randint(
+            1, 1 << 31, size=self.rows, dtype=np.uint64
+        ) | np.uint64(1)
+
+        self.size = 0
+        self.signatures = np.zeros((1024, num_perm), dtype=np.uint32)
+        self.keys = np.zeros(1024, dtype=np.int64)
+        self.tags = np.zeros(1024, dtype=np.uint8)
+
+        self.sorted_hashes = [np.zeros(0, dtype=np.uint32) for _ in range(bands)]
+        self.sorted_rows = [np.zeros(0, dtype=np.int32) for _ in range(bands)]
+        self.pending = [{} for _ in range(bands)]
+        self.pending_rows = []
+
+    def band_hashes(self, signatures):
+        signatures = np.atleast_2d(signatures).reshape(-1, self.bands, self.rows).astype(np.uint64)
+        return ((signatures * self.band_multipliers).sum(axis=2) & MAX_HASH).astype(np.uint32)
+
+    def _grow(self, needed):
+        capacity = len(self.keys)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self.signatures = np.resize(self.signatures, (capacity, self.num_perm))
+        self.keys = np.resize(self.keys, capacity)
+        self.tags = np.resize(self.tags, capacity)
+
+    def add(self, key, signature, tag=0):
+        self.add_many([key], np.atleast_2d(signature), [tag])
+
+    def add_many(self, keys, signatures, tags):
+        count = len(keys)
+        if not count:
+            return
+        start = self.size
+        self._grow(start + count)
+        self.signatures[start:start + count] = signatures
+        self.keys[start:start + count] = keys
+        self.tags[start:start + count] = tags
+        self.size += count
+
+        rows = np.arange(start, start + count, dtype=np.int32)
+        if count >= self.merge_every:
+            self._merge(rows, self.band_hashes(signatures))
+            return
+
+        hashes = self.band_hashes(signatures)
+        for band in range(self.bands):
+            bucket = self.pending[band]
+            for row, band_hash in zip(rows.tolist(), hashes[:, band].tolist()):
+                bucket.setdefault(band_hash, []).append(row)
+        self.pending_rows.extend(rows.tolist())
+        if len(self.pending_rows) >= self.merge_every:
+            self.flush()
+
+    def flush(self):
+        if not self.pending_rows:
+            return
+        rows = np.asarray(self.pending_rows, dtype=np.int32)
+        self.pending = [{} for _ in range(self.bands)]
+        self.pending_rows = []
+        self._merge(rows, self.band_hashes(self.signatures[rows]))
+
+    def _merge(self, rows, hashes):
+        for band in range(self.bands):
+            merged_hashes = np.concatenate([self.sorted_hashes[band], hashes[:, band]])
+            merged_rows = np.concatenate([self.sorted_rows[band], rows])
+            order = np.argsort(merged_hashes, kind="stable")
+            self.sorted_hashes[band] = merged_hashes[order]
+            self.sorted_rows[band] = merged_rows[order]
+
+    def candidates(self, signature):
+        hashes = self.band_hashes(signature)[0]
+        found = []
+        for band in range(self.bands):
+            band_hash = hashes[band]
+            sorted_hashes = self.sorted_hashes[band]
+            lo = np.searchsorted(sorted_hashes, band_hash, side="left")
+            hi = np.searchsorted(sorted_hashes, band_hash, side="right")
+            if hi > lo:
+                found.append(self.sorted_rows[band][lo:hi])
+            pending = self.pending[band].get(int(band_hash))
+            if pending:
+                found.append(np.asarray(pending, dtype=np.int32))
+        if not found:
+            return np.zeros(0, dtype=np.int32)
+        return np.unique(np.concatenate(found))
+
+    def query_many(self, signatures, threshold, max_bucket=8):
+        """
+        Vectorized query of many signatures against the merged rows (call flush() first to include pending ones).
+        Only the first `max_bucket` rows of every band bucket are compared.
+        Returns (keys, similarities) arrays; the key is -1 where nothing reaches the threshold.
+        """
+        count = len(signatures)
+        keys = np.full(count, -1, dtype=np.int64)
+        best = np.zeros(count, dtype=np.float32)
+        if not count or not self.size:
+            return keys, best
+        hashes = self.band_hashes(signatures)
+        offsets = np.arange(max_bucket)
+        for band in range(self.bands):
+            sorted_hashes = self.sorted_hashes[band]
+            if not len(sorted_hashes):
+                continue
+            lo = np.searchsorted(sorted_hashes, hashes[:, band], side="left")
+            hi = np.searchsorted(sorted_hashes, hashes[:, band], side="right")
+            positions = lo[:, None] + offsets
+            valid = positions < hi[:, None]
+            if not valid.any():
+                continue
+            rows = self.sorted_rows[band][np.where(valid, positions, 0)]
+            similarities = (self.signatures[rows] == signatures[:, None, :]).mean(axis=2)
+            similarities[~valid] = 0
+            column = similarities.argmax(axis=1)
+            band_best = similarities[np.arange(count), column]
+            improved = band_best > best
+            best[improved] = band_best[improved]
+            keys[improved] = self.keys[rows[np.arange(count), column]][improved]
+        keys[best < threshold] = -1
+        return keys, best
+
+    def query(self, signature, threshold, tag=None):
+        """Returns (key, similarity) of the most similar row at or above threshold, or None."""
+        rows = self.candidates(signature)
+        if tag is not None and len(rows):
+            rows = rows[self.tags[rows] == tag]
+        if not len(rows):
+            return None
+        similarities = (self.signatures[rows] == signature).mean(axis=1)
+        best = int(similarities.argmax())
+        if similarities[best] < threshold:
+            return None
+        return int(self.keys[rows[best]]), float(similarities[best])
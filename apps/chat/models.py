@@ -1,6 +1,27 @@
 from django.db import models
 from apps.accounts.models import CustomUser
-from apps.prices_x_cards.models import ProductPocket
+from apps.prices_x_cards.models import Payment, ProductPocket
+
+
+class NotDeletedManager(models.Manager):
+	"""
+	Default manager hiding rows of chats marked for deletion (ChatHistory.deleted_at); such rows are removed later
+	by the purge_deleted_chats command. `all_objects` still sees them.
+	"""
+
+	# Related managers (message.answers, ...) are built from this class without arguments and do not filter;
+	# they are only reached through an object that was already visible
+	deleted_at_lookup = None
+
+	def __init__(self, deleted_at_lookup=None):
+		super().__init__()
+		if deleted_at_lookup is not None:
+			self.deleted_at_lookup = deleted_at_lookup
+
+	def get_queryset(self):
+		if self.deleted_at_lookup is None:
+			return super().get_queryset()
+		return super().get_queryset().filter(**{f"{self.deleted_at_lookup}__isnull": True})
 
 
 class ChatHistory(models.Model):
@@ -8,8 +29,17 @@ class ChatHistory(models.Model):
 	                         null=True, blank=True)
 	created = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания", null=True, blank=True)
 	is_active = models.BooleanField(default=True, verbose_name="Активный статус", null=True, blank=True)
+	deleted_at = models.DateTimeField(verbose_name="Дата удаления", null=True, blank=True)
+	# Denormalized from messages and answers by signals (apps.chat.statistics), see rebuild_chat_counters
+	message_count = models.PositiveIntegerField(default=0, verbose_name="Количество сообщений")
+	answered_count = models.PositiveIntegerField(default=0, verbose_name="Сообщений с ответом")
+	last_message_at = models.DateTimeField(verbose_name="Последнее сообщение", null=True, blank=True)
+	first_question_preview = models.CharField(max_length=100, verbose_name="Первый вопрос", null=True, blank=True)
+	# Some messages were moved to a cold archive (apps.chat.archive) and are restored when the chat is opened
+	has_archived_messages = models.BooleanField(default=False, verbose_name="Есть сообщения в архиве")
 
-	objects = models.Manager()
+	objects = NotDeletedManager("deleted_at")
+	all_objects = models.Manager()
 
 	def __str__(self):
 		return f"{self.user.username}: {self.id}"
@@ -18,6 +48,35 @@ class ChatHistory(models.Model):
 		verbose_name = "История чата"
 		verbose_name_plural = "Истории чатов"
 		ordering = ["-created"]
+		indexes = [
+			models.Index(fields=["user", "-created", "-id"], name="chat_history_user_created_idx"),
+			models.Index(fields=["user", "-id"], name="chat_history_user_id_idx"),
+			models.Index(fields=["user", "is_active"], name="chat_history_user_active_idx"),
+			models.Index(fields=["deleted_at", "id"], condition=models.Q(deleted_at__isnull=False),
+			             name="chat_history_deleted_idx"),
+		]
+
+
+class QuestionCluster(models.Model):
+	representative = models.TextField(verbose_name="Типичный вопрос")
+	# MinHash signature of the representative (apps.chat.minhash), raw uint32 bytes
+	signature = models.BinaryField(verbose_name="Сигнатура")
+	size = models.PositiveIntegerField(default=0, verbose_name="Количество вопросов")
+	created = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+	updated = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+	objects = models.Manager()
+
+	def __str__(self):
+		return f"{self.representative[:50]} ({self.size})"
+
+	class Meta:
+		verbose_name = "Кластер вопросов"
+		verbose_name_plural = "Кластеры вопросов"
+		ordering = ["-size", "id"]
+		indexes = [
+			models.Index(fields=["-size", "id"], name="chat_cluster_size_idx"),
+		]
 
 
 class Message(models.Model):
@@ -26,8 +85,11 @@ class Message(models.Model):
 	question = models.TextField(verbose_name="Вопрос", null=True, blank=True)
 	first_message = models.BooleanField(default=True, verbose_name="Первое сообщение", null=True, blank=True)
 	created = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания", null=True, blank=True)
+	cluster = models.ForeignKey(QuestionCluster, on_delete=models.SET_NULL, related_name="messages",
+	                            verbose_name="Кластер вопроса", null=True, blank=True)
 
-	objects = models.Manager()
+	objects = NotDeletedManager("chat_history__deleted_at")
+	all_objects = models.Manager()
 
 	def __str__(self):
 		return f"Сообщение {self.chat_history}"
@@ -36,14 +98,26 @@ class Message(models.Model):
 		verbose_name = "Сообщение"
 		verbose_name_plural = "Сообщения"
 		ordering = ["-created"]
+		indexes = [
+			models.Index(fields=["chat_history", "-id"], name="chat_msg_history_id_idx"),
+			models.Index(fields=["id"], condition=models.Q(cluster__isnull=True), name="chat_msg_unclustered_idx"),
+			models.Index(fields=["chat_history", "-created"], condition=models.Q(first_message=True),
+			             name="chat_msg_first_idx"),
+		]
 
 
 class Answer(models.Model):
-	message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name="answers", verbose_name="Сообщение")
+	# No database constraint: on PostgreSQL chat_message is partitioned and its ids alone are not a unique key
+	message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name="answers", verbose_name="Сообщение",
+	                            db_constraint=False)
 	answer = models.TextField(verbose_name="Ответ", null=True, blank=True)
+	version = models.PositiveIntegerField(default=1, verbose_name="Версия")
+	# Generated with earlier turns of the chat as context, so it is not reused for other questions (semantic cache)
+	with_context = models.BooleanField(default=False, verbose_name="С учётом контекста")
 	created = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания", null=True, blank=True)
 
-	objects = models.Manager()
+	objects = NotDeletedManager("message__chat_history__deleted_at")
+	all_objects = models.Manager()
 
 	def __str__(self):
 		return f"Ответ {self.id} - {self.message.id}"
@@ -52,6 +126,9 @@ class Answer(models.Model):
 		verbose_name = "Ответ"
 		verbose_name_plural = "Ответы"
 		ordering = ["created"]
+		constraints = [
+			models.UniqueConstraint(fields=["message", "version"], name="chat_answer_message_version_uniq"),
+		]
 
 
 class RequestCount(models.Model):
@@ -69,4 +146,170 @@ class RequestCount(models.Model):
 		verbose_name = "Количество запросов"
 		verbose_name_plural = "Количество запросов"
 		ordering = ["-created"]
+		indexes = [
+			models.Index(fields=["user", "-id"], name="chat_reqcount_user_id_idx"),
+		]
+
+
+class RequestCountLedger(models.Model):
+	"""Append-only record of RequestCount rows removed by compaction (apps.chat.ledger); rows are never changed."""
+	REASON_CHOICES = [
+		('compaction', 'Сжатие истории'),
+		('payment', 'Новый платёж'),
+	]
 
+	user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="request_count_ledger",
+	                         verbose_name="Пользователь")
+	reason = models.CharField(max_length=20, choices=REASON_CHOICES, verbose_name="Причина")
+	rows_compacted = models.PositiveIntegerField(verbose_name="Сжато строк")
+	request_count_total = models.PositiveIntegerField(verbose_name="Сумма запросов")
+	first_created = models.DateTimeField(verbose_name="Первая строка", null=True, blank=True)
+	last_created = models.DateTimeField(verbose_name="Последняя строка", null=True, blank=True)
+	# [{"id", "request_count", "is_active", "created"}, ...] of the removed rows, oldest first
+	entries = models.JSONField(default=list, verbose_name="Строки")
+	created = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+
+	objects = models.Manager()
+
+	def __str__(self):
+		return f"{self.user_id}: {self.rows_compacted} ({self.reason})"
+
+	def save(self, *args, **kwargs):
+		if not self._state.adding:
+			raise ValueError("RequestCountLedger is append-only.")
+		super().save(*args, **kwargs)
+
+	def delete(self, *args, **kwargs):
+		raise ValueError("RequestCountLedger is append-only.")
+
+	class Meta:
+		verbose_name = "Журнал сжатия счётчиков запросов"
+		verbose_name_plural = "Журнал сжатия счётчиков запросов"
+		ordering = ["-created"]
+		indexes = [
+			models.Index(fields=["user", "-created"], name="chat_reqledger_user_idx"),
+		]
+
+
+class Entitlement(models.Model):
+	"""The user's current tariff and what is left of it; one row per user, see apps.chat.entitlements."""
+	user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True,
+	                            related_name="entitlement", verbose_name="Пользователь")
+	product = models.ForeignKey(ProductPocket, on_delete=models.SET_NULL, related_name="+", verbose_name="Тариф",
+	                            null=True, blank=True)
+	payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, related_name="+", verbose_name="Платёж",
+	                            null=True, blank=True)
+	request_limit = models.PositiveIntegerField(default=1, verbose_name="Лимит запросов")
+	remaining = models.PositiveIntegerField(default=1, verbose_name="Осталось запросов")
+	period_start = models.DateTimeField(verbose_name="Начало периода", null=True, blank=True)
+	# None: the tariff lasts until it is used up or replaced by the next payment
+	period_end = models.DateTimeField(verbose_name="Конец периода", null=True, blank=True)
+	# Bumped whenever the tariff changes (not on every request), see EntitlementCache
+	version = models.PositiveIntegerField(default=1, verbose_name="Версия")
+	updated = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+	objects = models.Manager()
+
+	def __str__(self):
+		return f"{self.user_id}: {self.remaining}/{self.request_limit}"
+
+	class Meta:
+		verbose_name = "Тариф пользователя"
+		verbose_name_plural = "Тарифы пользователей"
+
+
+class GenerationJob(models.Model):
+	STATUS_CHOICES = [
+		('pending', 'В очереди'),
+		('running', 'Выполняется'),
+		('done', 'Готово'),
+		('failed', 'Ошибка'),
+	]
+
+	message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name="generation_jobs",
+	                            verbose_name="Сообщение", db_constraint=False)
+	answer = models.ForeignKey(Answer, on_delete=models.SET_NULL, related_name="+", verbose_name="Ответ",
+	                           null=True, blank=True, db_constraint=False)
+	status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name="Статус")
+	attempts = models.PositiveIntegerField(default=0, verbose_name="Попытки")
+	lease_until = models.DateTimeField(verbose_name="Аренда до", null=True, blank=True)
+	worker = models.CharField(max_length=100, verbose_name="Обработчик", null=True, blank=True)
+	error = models.TextField(verbose_name="Ошибка", null=True, blank=True)
+	created = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+	updated = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+	objects = models.Manager()
+
+	def __str__(self):
+		return f"Задача {self.id} - {self.message_id} ({self.status})"
+
+	class Meta:
+		verbose_name = "Задача генерации ответа"
+		verbose_name_plural = "Задачи генерации ответов"
+		ordering = ["created"]
+		constraints = [
+			# One pending or running job per message, see apps.chat.jobs.enqueue_answer_job
+			models.UniqueConstraint(fields=["message"], condition=models.Q(status__in=["pending", "running"]),
+			                        name="chat_genjob_active_uniq"),
+		]
+		indexes = [
+			models.Index(fields=["status", "lease_until"], name="chat_genjob_status_lease_idx"),
+		]
+
+
+class UserMessageCounter(models.Model):
+	user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True,
+	                            related_name="message_counter", verbose_name="Пользователь")
+	message_count = models.PositiveIntegerField(default=0, verbose_name="Количество сообщений")
+	updated = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+	objects = models.Manager()
+
+	def __str__(self):
+		return f"{self.user_id}: {self.message_count}"
+
+	class Meta:
+		verbose_name = "Счётчик сообщений пользователя"
+		verbose_name_plural = "Счётчики сообщений пользователей"
+		indexes = [
+			models.Index(fields=["-message_count", "user"], name="chat_usercounter_count_idx"),
+		]
+
+
+class MessageArchive(models.Model):
+	"""One archived month of chat_message/chat_answer partitions: gzipped JSONL files in CHAT_ARCHIVE_DIR/<name>."""
+	month = models.DateField(unique=True, verbose_name="Месяц")
+	name = models.CharField(max_length=100, verbose_name="Каталог архива")
+	buckets = models.PositiveIntegerField(verbose_name="Количество файлов")
+	messages_count = models.PositiveIntegerField(default=0, verbose_name="Сообщений")
+	answers_count = models.PositiveIntegerField(default=0, verbose_name="Ответов")
+	created = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+
+	objects = models.Manager()
+
+	def __str__(self):
+		return f"{self.month:%Y-%m}: {self.messages_count}"
+
+	class Meta:
+		verbose_name = "Архив сообщений"
+		verbose_name_plural = "Архивы сообщений"
+		ordering = ["month"]
+
+
+class ArchivedChat(models.Model):
+	"""A chat with messages in an archive; removed once they are restored."""
+	chat_history = models.ForeignKey(ChatHistory, on_delete=models.CASCADE, related_name="archives",
+	                                 verbose_name="История чата")
+	archive = models.ForeignKey(MessageArchive, on_delete=models.CASCADE, related_name="chats", verbose_name="Архив")
+
+	objects = models.Manager()
+
+	def __str__(self):
+		return f"{self.chat_history_id} in {self.archive_id}"
+
+	class Meta:
+		verbose_name = "Чат в архиве"
+		verbose_name_plural = "Чаты в архиве"
+		constraints = [
+			models.UniqueConstraint(fields=["chat_history", "archive"], name="chat_archivedchat_uniq"),
+		]
@@ -0,0 +1,34 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class MessageCursorPagination(CursorPagination):
+	"""
+	Keyset pagination, newest first: `next` loads older messages. Rows inserted meanwhile never shift a page
+	and no COUNT(*) is run. Keyed on the id alone: ids follow the insertion order and are unique and non-null,
+	whereas `created` is nullable and DRF would page through ties of it with an offset. Backed by the
+	(chat_history, -id) index.
+	"""
+	ordering = '-id'
+	page_size = 50
+	page_size_query_param = 'page_size'
+	max_page_size = 200
+
+
+class ChatHistoryCursorPagination(CursorPagination):
+	"""Newest chats first, keyed on the id like MessageCursorPagination. Backed by the (user, -id) index."""
+	ordering = '-id'
+	page_size = 20
+	page_size_query_param = 'page_size'
+	max_page_size = 100
+
+
+class UserStatisticPagination(PageNumberPagination):
+	page_size = 50
+	page_size_query_param = 'page_size'
+	max_page_size = 200
+
+
+class QuestionClusterPagination(PageNumberPagination):
+	page_size = 50
+	page_size_query_param = 'page_size'
+	max_page_size = 200
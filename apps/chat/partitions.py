@@ -0,0 +1,184 @@
+"""
+On PostgreSQL chat_message and chat_answer are partitioned by range of `created`, one partition per month
+(<table>_pYYYYMM) plus <table>_default for rows outside every month. The primary key is (id, created) since a key of
+a partitioned table has to contain the partition column; ids still come from one sequence per table and stay unique.
+Migration 0017_partition_messages converts the tables, archive_chat_partitions keeps months ahead created and
+moves old ones to the archive (apps.chat.archive). Nothing here applies to other databases.
+
+A unique constraint of a partitioned table has to include `created` as well, and (message_id, version, created)
+would enforce nothing. Each partition gets a unique index on the columns of PARTITION_UNIQUE_KEYS instead, so a key
+is unique within a month. Across months it is kept unique by the writers: answer versions are only numbered under
+the message row lock (service.save_answer). On PostgreSQL chat_answer_message_version_uniq therefore exists as these
+per-partition indexes, not as a constraint of chat_answer.
+"""
+import re
+from datetime import date
+
+from django.utils.timezone import now
+
+PARTITIONED_TABLES = ('chat_message', 'chat_answer')
+# The unique keys of the tables, enforced per partition
+PARTITION_UNIQUE_KEYS = {
+    'chat_answer': [('message_id', 'version')],
+}
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y%m}"
+
+
+def default_partition_name(table):
+    return f"{table}_default"
+
+
+def bound(month):
+    # Built from a date, so it is safe to inline; partition bounds cannot be query parameters
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def is_partitioned(connection, table):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [table])
+        return cursor.fetchone() is not None
+
+
+def month_partitions(connection, table):
+    """{month: partition name} of the month partitions attached to the table."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s)",
+            [table],
+        )
+        names = [name for name, in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        match = re.fullmatch(re.escape(table) + r"_p(\d{4})(\d{2})", name)
+        if match:
+            partitions[date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+
+def create_unique_indexes(cursor, table, partition):
+    quote = cursor.db.ops.quote_name
+    for columns in PARTITION_UNIQUE_KEYS.get(table, ()):
+        name = f"{partition}_{'_'.join(columns)}_uniq"
+        key = ", ".join(quote(column) for column in columns)
+        cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {quote(name)} ON {quote(partition)} ({key})")
+
+
+def create_month_partition(cursor, table, month):
+    """
+    Adds the month's partition. Rows of that month already in the default partition (restored from the archive or
+    written before the partition existed) are moved into it first, otherwise PostgreSQL refuses to attach it.
+    """
+    quote = cursor.db.ops.quote_name
+    name, default = partition_name(table, month), default_partition_name(table)
+    start, end = bound(month), bound(add_months(month, 1))
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [default])
+    has_default = cursor.fetchone()[0]
+    if has_default:
+        cursor.execute(f"SELECT 1 FROM {quote(default)} WHERE created >= {start} AND created < {end} LIMIT 1")
+    if not has_default or cursor.fetchone() is None:
+        cursor.execute(f"CREATE TABLE {quote(name)} PARTITION OF {quote(table)} FOR VALUES FROM ({start}) TO ({end})")
+        create_unique_indexes(cursor, table, name)
+        return
+    cursor.execute(f"CREATE TABLE {quote(name)} (LIKE {quote(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    create_unique_indexes(cursor, table, name)
+    cursor.execute(
+        f"WITH moved AS (DELETE FROM {quote(default)} WHERE created >= {start} AND created < {end} RETURNING *) "
+        f"INSERT INTO {quote(name)} SELECT * FROM moved"
+    )
+    cursor.execute(f"ALTER TABLE {quote(table)} ATTACH PARTITION {quote(name)} FOR VALUES FROM ({start}) TO ({end})")
+
+
+def ensure_partitions(connection, months_ahead, since=None, tables=PARTITIONED_TABLES):
+    """Creates the missing month partitions from `since` (default: this month) to `months_ahead` months ahead."""
+    first = month_start(since or now())
+    last = add_months(month_start(now()), months_ahead)
+    created = []
+    with connection.cursor() as cursor:
+        for table in tables:
+            existing = month_partitions(connection, table)
+            month = first
+            while month <= last:
+                if month not in existing:
+                    create_month_partition(cursor, table, month)
+                    created.append(partition_name(table, month))
+                month = add_months(month, 1)
+    return created
+
+
+def drop_partition(cursor, table, month):
+    quote = cursor.db.ops.quote_name
+    name = partition_name(table, month)
+    cursor.execute(f"ALTER TABLE {quote(table)} DETACH PARTITION {quote(name)}")
+    cursor.execute(f"DROP TABLE {quote(name)}")
+
+
+def convert_to_partitioned(schema_editor, table, months_ahead):
+    """
+    Rebuilds a plain table as a partitioned one with the same columns, indexes, constraints and foreign keys;
+    unique constraints become the per-partition indexes of PARTITION_UNIQUE_KEYS. The rows are copied in one
+    statement, so on a large table this needs a maintenance window. Rows without `created` get the epoch and land
+    in the default partition.
+    """
+    connection = schema_editor.connection
+    quote = connection.ops.quote_name
+    old = f"{table}_unpartitioned"
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {quote(table)} RENAME TO {quote(old)}")
+        cursor.execute(f"UPDATE {quote(old)} SET created = to_timestamp(0) WHERE created IS NULL")
+        cursor.execute(
+            "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype IN ('p', 'u', 'f')",
+            [old],
+        )
+        constraints = cursor.fetchall()
+        if any(kind == 'u' for _, kind, _ in constraints) and table not in PARTITION_UNIQUE_KEYS:
+            raise ValueError(f"{table} has unique constraints; list them in PARTITION_UNIQUE_KEYS.")
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s",
+            [old],
+        )
+        indexes = [(name, sql) for name, sql in cursor.fetchall() if name not in {c[0] for c in constraints}]
+        cursor.execute(f"SELECT min(created) FROM {quote(old)} WHERE created > to_timestamp(0)")
+        first_created = cursor.fetchone()[0]
+
+        cursor.execute(
+            f"CREATE TABLE {quote(table)} (LIKE {quote(old)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            f"PARTITION BY RANGE (created)"
+        )
+        # A serial default would still point at the sequence of the old table
+        cursor.execute(f"ALTER TABLE {quote(table)} ALTER COLUMN id DROP DEFAULT")
+        ensure_partitions(connection, months_ahead, since=first_created, tables=[table])
+        cursor.execute(f"CREATE TABLE {quote(default_partition_name(table))} PARTITION OF {quote(table)} DEFAULT")
+        create_unique_indexes(cursor, table, default_partition_name(table))
+        cursor.execute(f"INSERT INTO {quote(table)} SELECT * FROM {quote(old)}")
+        cursor.execute(f"SELECT max(id) FROM {quote(old)}")
+        max_id = cursor.fetchone()[0]
+        cursor.execute(f"DROP TABLE {quote(old)}")
+
+        sequence = f"{table}_id_seq"
+        cursor.execute(f"CREATE SEQUENCE {quote(sequence)} AS bigint OWNED BY {quote(table)}.id")
+        if max_id:
+            cursor.execute("SELECT setval(%s, %s)", [sequence, max_id])
+        cursor.execute(f"ALTER TABLE {quote(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}'::regclass)")
+
+        cursor.execute(f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(table + '_pkey')} PRIMARY KEY (id, created)")
+        for name, sql in indexes:
+            cursor.execute(re.sub(rf" ON (ONLY )?(\S+\.)?{re.escape(old)} ", f" ON {quote(table)} ", sql, count=1))
+        for name, kind, definition in constraints:
+            if kind == 'f':
+                cursor.execute(f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}")
@@ -0,0 +1,91 @@
+"""
+Deleting chats in two steps. A request only marks the chats deleted (one UPDATE), which hides them, their
+messages and answers from every read through the default managers. purge_deleted_chats later removes the rows
+with batched raw DELETE statements instead of the ORM cascade, which loads and deletes every object one by one.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils.timezone import now
+
+from apps.chat.clustering import recount_clusters
+from apps.chat.models import Answer, ArchivedChat, ChatHistory, GenerationJob, Message
+from apps.chat.statistics import change_message_counter, invalidate_weekly_stats
+
+
+def soft_delete_chats(chats):
+    """Marks the chats of the queryset deleted; returns the number of chats marked."""
+    with transaction.atomic():
+        per_user = list(
+            chats.filter(deleted_at__isnull=True).order_by().values('user_id').annotate(
+                messages_count=Sum('message_count')
+            )
+        )
+        marked = chats.filter(deleted_at__isnull=True).update(deleted_at=now())
+        for row in per_user:
+            change_message_counter(row['user_id'], -row['messages_count'])
+    for row in per_user:
+        invalidate_weekly_stats(row['user_id'])
+    return marked
+
+
+def delete_rows(model, column, ids):
+    """DELETE FROM <table> WHERE <column> IN (...) without loading the rows; returns the number deleted."""
+    if not ids:
+        return 0
+    quote = connection.ops.quote_name
+    placeholders = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {quote(model._meta.db_table)} WHERE {quote(column)} IN ({placeholders})", list(ids)
+        )
+        return cursor.rowcount
+
+
+def purge_chats(chat_ids, batch_size):
+    """Removes the chats with their messages, answers and generation jobs; returns (messages, answers) deleted."""
+    messages_deleted = answers_deleted = 0
+    cluster_ids = set()
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Message.all_objects.filter(chat_history_id__in=chat_ids).order_by('id')
+                .values_list('id', 'cluster_id')[:batch_size]
+            )
+            if not rows:
+                # Their archived rows stay in the archive files, only the references go
+                delete_rows(ArchivedChat, 'chat_history_id', chat_ids)
+                delete_rows(ChatHistory, 'id', chat_ids)
+                break
+            message_ids = [message_id for message_id, _ in rows]
+            cluster_ids.update(cluster_id for _, cluster_id in rows if cluster_id is not None)
+            delete_rows(GenerationJob, 'message_id', message_ids)
+            answers_deleted += delete_rows(Answer, 'message_id', message_ids)
+            messages_deleted += delete_rows(Message, 'id', message_ids)
+    if cluster_ids:
+        recount_clusters(cluster_ids)
+    return messages_deleted, answers_deleted
+
+
+def purge_deleted_chats(batch_size=None, older_than=0, limit=None):
+    """
+    Hard-deletes chats marked deleted at least `older_than` seconds ago, `batch_size` rows per statement;
+    returns (chats, messages, answers) deleted.
+    """
+    batch_size = batch_size or settings.CHAT_PURGE_BATCH_SIZE
+    cutoff = now() - timedelta(seconds=older_than)
+    chats = messages = answers = 0
+    while limit is None or chats < limit:
+        chat_ids = list(
+            ChatHistory.all_objects.filter(deleted_at__isnull=False, deleted_at__lte=cutoff)
+            .order_by('deleted_at', 'id').values_list('id', flat=True)[:batch_size]
+        )
+        if not chat_ids:
+            break
+        purged_messages, purged_answers = purge_chats(chat_ids, batch_size)
+        chats += len(chat_ids)
+        messages += purged_messages
+        answers += purged_answers
+    return chats, messages, answers
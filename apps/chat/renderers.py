@@ -0,0 +1,14 @@
+from rest_framework.renderers import BaseRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets content negotiation accept `Accept: text/event-stream` (sent by EventSource).
+    The view returns a StreamingHttpResponse, so nothing is rendered here.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
@@ -0,0 +1,247 @@
+import asyncio
+import contextvars
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+from django.conf import settings
+
+from apps.chat.llm import LLMBackend
+from apps.chat.metrics import incr, get_counters
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Per-process breaker. Opens after `failure_threshold` consecutive upstream failures and rejects calls for
+    `reset_timeout` seconds; then a single trial call is let through and closes it again on success. A trial that
+    ends any other way (a failure, an error that is not retried, a cancellation) opens it for another period.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return
+        incr(f"{self.name}_circuit_rejected")
+        raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("%s circuit closed", self.name)
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_aborted(self):
+        """The call ended without success or a recorded failure; a half-open trial must not keep its slot."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                logger.warning("%s circuit trial call did not succeed, opened again", self.name)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("%s circuit opened after %s failures", self.name, self.failures)
+                    incr(f"{self.name}_circuit_opened")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+def is_retryable(exc):
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code == 429 or exc.status_code >= 500
+    return isinstance(exc, (openai.APIConnectionError, TimeoutError))
+
+
+def retry_after(exc):
+    """Seconds requested by a 429/503 Retry-After header, if any."""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ResilientBackend(LLMBackend):
+    """
+    Wraps another backend with per-attempt and total deadlines, jittered exponential backoff on 429/5xx,
+    timeouts and connection errors, and a circuit breaker. Streams are only retried before the first delta.
+
+    The HTTP client only bounds each read, so a completion is awaited with the attempt timeout from a worker
+    thread, and a stream is cut with TimeoutError once the total deadline passes between two deltas.
+    """
+
+    def __init__(self, backend, name="llm"):
+        super().__init__(backend.model)
+        self.backend = backend
+        self.name = name
+        self.attempt_timeout = settings.CHAT_LLM_TIMEOUT
+        self.total_timeout = settings.CHAT_LLM_TOTAL_TIMEOUT
+        self.max_retries = settings.CHAT_LLM_MAX_RETRIES
+        self.backoff_base = settings.CHAT_LLM_BACKOFF_BASE
+        self.backoff_max = settings.CHAT_LLM_BACKOFF_MAX
+        self.breaker = CircuitBreaker(name, settings.CHAT_LLM_BREAKER_THRESHOLD, settings.CHAT_LLM_BREAKER_RESET)
+        # an abandoned call keeps its worker until the client gives up, so size it like the connection pool
+        self._calls = ThreadPoolExecutor(settings.CHAT_LLM_POOL['MAX_CONNECTIONS'], thread_name_prefix=name)
+
+    def backoff(self, attempt, exc):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        requested = retry_after(exc)
+        if requested is not None:
+            delay = max(delay, min(requested, self.backoff_max))
+        return delay
+
+    def attempts(self):
+        """
+        Yields (attempt, timeout) while another attempt fits in the total deadline. The caller reports a failed
+        attempt by calling `failed(attempt, exc)`, which sleeps the backoff or re-raises.
+        """
+        deadline = time.monotonic() + self.total_timeout
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"{self.name} total deadline of {self.total_timeout}s exceeded")
+            self.breaker.before_call()
+            yield attempt, min(self.attempt_timeout, remaining), deadline
+
+    def on_failure(self, attempt, exc, deadline):
+        """Records a failed attempt and returns the backoff to sleep, or re-raises when it should not be retried."""
+        if not is_retryable(exc):
+            self.breaker.record_aborted()
+            raise exc
+        self.breaker.record_failure()
+        delay = self.backoff(attempt, exc)
+        if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+            incr(f"{self.name}_failures")
+            raise exc
+        incr(f"{self.name}_retries")
+        logger.warning("%s attempt %s failed (%s: %s), retrying in %.2fs",
+                       self.name, attempt + 1, type(exc).__name__, exc, delay)
+        return delay
+
+    def deadline_exceeded(self):
+        incr(f"{self.name}_failures")
+        return TimeoutError(f"{self.name} total deadline of {self.total_timeout}s exceeded")
+
+    def complete(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        for attempt, attempt_timeout, deadline in self.attempts():
+            call = self._calls.submit(
+                contextvars.copy_context().run,
+                self.backend.complete, messages, max_tokens, temperature, timeout=attempt_timeout
+            )
+            try:
+                result = call.result(attempt_timeout)
+            except Exception as e:
+                call.cancel()
+                time.sleep(self.on_failure(attempt, e, deadline))
+                continue
+            except BaseException:
+                self.breaker.record_aborted()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def stream(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        for attempt, attempt_timeout, deadline in self.attempts():
+            stream = self.backend.stream(messages, max_tokens, temperature, timeout=attempt_timeout)
+            try:
+                first = next(stream, None)
+            except Exception as e:
+                stream.close()
+                time.sleep(self.on_failure(attempt, e, deadline))
+                continue
+            except BaseException:
+                stream.close()
+                self.breaker.record_aborted()
+                raise
+            self.breaker.record_success()
+            try:
+                if first is not None:
+                    yield first
+                for delta in stream:
+                    if time.monotonic() > deadline:
+                        raise self.deadline_exceeded()
+                    yield delta
+            finally:
+                stream.close()
+            return
+
+    async def acomplete(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        for attempt, attempt_timeout, deadline in self.attempts():
+            try:
+                result = await asyncio.wait_for(
+                    self.backend.acomplete(messages, max_tokens, temperature, timeout=attempt_timeout),
+                    attempt_timeout
+                )
+            except Exception as e:
+                await asyncio.sleep(self.on_failure(attempt, e, deadline))
+                continue
+            except BaseException:
+                # asyncio.CancelledError included
+                self.breaker.record_aborted()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def astream(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        for attempt, attempt_timeout, deadline in self.attempts():
+            stream = self.backend.astream(messages, max_tokens, temperature, timeout=attempt_timeout)
+            try:
+                first = await asyncio.wait_for(anext(stream, None), attempt_timeout)
+            except Exception as e:
+                await stream.aclose()
+                await asyncio.sleep(self.on_failure(attempt, e, deadline))
+                continue
+            except BaseException:
+                await stream.aclose()
+                self.breaker.record_aborted()
+                raise
+            self.breaker.record_success()
+            try:
+                if first is not None:
+                    yield first
+                while True:
+                    try:
+                        delta = await asyncio.wait_for(anext(stream, None), deadline - time.monotonic())
+                    except TimeoutError:
+                        raise self.deadline_exceeded() from None
+                    if delta is None:
+                        break
+                    yield delta
+            finally:
+                await stream.aclose()
+            return
+
+    def stats(self):
+        names = [f"{self.name}_{counter}" for counter in ("retries", "failures", "circuit_opened", "circuit_rejected")]
+        stats = self.backend.stats() if hasattr(self.backend, 'stats') else {}
+        stats.update(get_counters(*names))
+        stats[f"{self.name}_circuit_state"] = self.breaker.state
+        return stats
@@ -0,0 +1,229 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import math
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.exceptions import Throttled
+
+from apps.chat.entitlements import entitlement_cache
+from apps.chat.llm import LLMBackend
+from apps.chat.metrics import incr, get_counters, ratio
+
+FREE_PRIORITY = 1
+# Every paid tariff ranks above FREE_PRIORITY, larger tariffs higher
+PAID_PRIORITY = FREE_PRIORITY + 1
+
+# Priority of the LLM calls made by the current request/task; set with `priority()`
+current_priority = contextvars.ContextVar("llm_priority", default=FREE_PRIORITY)
+
+
+def user_priority(user_id):
+    """Queue priority of a user: PAID_PRIORITY plus their paid tariff's limit, FREE_PRIORITY without a tariff."""
+    if user_id is None:
+        return FREE_PRIORITY
+    entitlement = entitlement_cache.get(user_id)
+    return PAID_PRIORITY + entitlement.request_limit if entitlement.product_id else FREE_PRIORITY
+
+
+@contextlib.contextmanager
+def priority(value):
+    token = current_priority.set(value)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "granted", "cancelled", "event", "loop", "future")
+
+    def __init__(self, priority, seq, loop=None):
+        self.priority = priority
+        self.seq = seq
+        self.granted = False
+        self.cancelled = False
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def __lt__(self, other):
+        return (-self.priority, self.seq) < (-other.priority, other.seq)
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class LLMScheduler:
+    """
+    Per-process admission control for upstream LLM calls, shared by threads and event loops.
+    At most `max_concurrency` calls run at once; up to `max_queue` callers wait, highest priority first
+    (FIFO within a priority). A full queue or a wait longer than `queue_timeout` raises Throttled (HTTP 429).
+    A released slot is handed straight to the next waiter so it cannot be taken by a newcomer.
+    """
+
+    def __init__(self, name, max_concurrency, max_queue, queue_timeout):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.depth = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        # moving average of a call's duration, used to estimate Retry-After
+        self._avg_call_seconds = 1.0
+
+    def retry_after(self):
+        per_slot = (self.depth + 1) / max(self.max_concurrency, 1)
+        return max(1, math.ceil(per_slot * self._avg_call_seconds))
+
+    def throttle(self, reason):
+        incr(f"{self.name}_queue_{reason}")
+        raise Throttled(wait=self.retry_after(), detail="Сервис перегружен, попробуйте позже.")
+
+    def _enqueue(self, loop=None):
+        """Takes a free slot (returns None) or returns a queued waiter."""
+        with self._lock:
+            if self.active < self.max_concurrency and not self.depth:
+                self.active += 1
+                return None
+            if self.depth >= self.max_queue:
+                waiter = False
+            else:
+                waiter = _Waiter(current_priority.get(), next(self._seq), loop)
+                heapq.heappush(self._waiters, waiter)
+                self.depth += 1
+        if waiter is False:
+            self.throttle("rejected")
+        return waiter
+
+    def _abandon(self, waiter):
+        """Removes a waiter that stopped waiting; returns True when it was granted a slot in the meantime."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            self.depth -= 1
+            return False
+
+    def _admitted(self, started):
+        waited = time.monotonic() - started
+        incr(f"{self.name}_queue_admitted")
+        incr(f"{self.name}_queue_wait_ms", int(waited * 1000))
+
+    def acquire(self):
+        started = time.monotonic()
+        waiter = self._enqueue()
+        if waiter is not None:
+            waiter.event.wait(self.queue_timeout)
+            if not self._abandon(waiter):
+                self.throttle("timeouts")
+        self._admitted(started)
+
+    async def aacquire(self):
+        started = time.monotonic()
+        waiter = self._enqueue(asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except asyncio.CancelledError:
+                if self._abandon(waiter):
+                    self.release()
+                raise
+            except TimeoutError:
+                if not self._abandon(waiter):
+                    self.throttle("timeouts")
+        self._admitted(started)
+
+    def release(self, duration=None):
+        if duration is not None:
+            self._avg_call_seconds = 0.9 * self._avg_call_seconds + 0.1 * duration
+        with self._lock:
+            while self._waiters:
+                waiter = heapq.heappop(self._waiters)
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True
+                self.depth -= 1
+                waiter.wake()
+                return
+            self.active -= 1
+
+    @contextlib.contextmanager
+    def slot(self):
+        self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    @contextlib.asynccontextmanager
+    async def aslot(self):
+        await self.aacquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self):
+        counters = get_counters(*(f"{self.name}_queue_{counter}"
+                                  for counter in ("admitted", "rejected", "timeouts", "wait_ms")))
+        admitted = counters[f"{self.name}_queue_admitted"]
+        counters[f"{self.name}_queue_avg_wait_ms"] = ratio(counters.pop(f"{self.name}_queue_wait_ms"), admitted)
+        counters[f"{self.name}_queue_depth"] = self.depth
+        counters[f"{self.name}_active"] = self.active
+        return counters
+
+
+class ScheduledBackend(LLMBackend):
+    """Runs every call of the wrapped backend, including a whole stream, inside a scheduler slot."""
+
+    def __init__(self, backend, scheduler):
+        super().__init__(backend.model)
+        self.backend = backend
+        self.scheduler = scheduler
+
+    def complete(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        with self.scheduler.slot():
+            return self.backend.complete(messages, max_tokens, temperature, timeout=timeout)
+
+    def stream(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        with self.scheduler.slot():
+            stream = self.backend.stream(messages, max_tokens, temperature, timeout=timeout)
+            try:
+                yield from stream
+            finally:
+                stream.close()
+
+    async def acomplete(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        async with self.scheduler.aslot():
+            return await self.backend.acomplete(messages, max_tokens, temperature, timeout=timeout)
+
+    async def astream(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        async with self.scheduler.aslot():
+            stream = self.backend.astream(messages, max_tokens, temperature, timeout=timeout)
+            try:
+                async for delta in stream:
+                    yield delta
+            finally:
+                await stream.aclose()
+
+    def stats(self):
+        stats = self.backend.stats() if hasattr(self.backend, 'stats') else {}
+        return {**stats, **self.scheduler.stats()}
@@ -0,0 +1,114 @@
+import threading
+import time
+
+from django.conf import settings
+
+from apps.chat import metrics
+from apps.chat.cache import normalize_question
+from apps.chat.minhash import MinHasher, LSHIndex
+from apps.chat.models import Answer
+
+LANGUAGE_TAGS = {"ru": 1, "en": 2, "uz": 3}
+
+
+class SemanticAnswerCache:
+    """
+    Near-duplicate tier behind the exact AnswerCache.
+
+    Past questions are indexed by MinHash/LSH over character n-grams. A lookup returns the stored answer of the most
+    similar past question in the same language when the estimated similarity reaches the threshold.
+    Each process builds its index in a background thread from the Answer table and then catches up incrementally
+    with answers saved since (by any worker), so lookups never wait for a full rebuild. Answers generated with
+    conversation history (Answer.with_context) answer that conversation, not the question alone, and are skipped.
+    """
+
+    def __init__(self, detect_language, excluded_answers=()):
+        self.detect_language = detect_language
+        self.excluded_answers = set(excluded_answers)
+        self.hasher = MinHasher(num_perm=settings.CHAT_SEMANTIC_CACHE_NUM_PERM)
+        self.index = LSHIndex(num_perm=settings.CHAT_SEMANTIC_CACHE_NUM_PERM, bands=settings.CHAT_SEMANTIC_CACHE_BANDS)
+        self.lock = threading.RLock()
+        self.ready = False
+        self.building = False
+        self.last_answer_id = 0
+        self.last_sync = 0.0
+
+    def signature(self, question):
+        return self.hasher.signature(normalize_question(question))
+
+    def mark_stale(self):
+        self.last_sync = 0.0
+
+    def ensure_ready(self):
+        if self.ready:
+            if time.monotonic() - self.last_sync >= settings.CHAT_SEMANTIC_CACHE_SYNC_INTERVAL:
+                self.sync()
+            return True
+        with self.lock:
+            if not self.building:
+                self.building = True
+                threading.Thread(target=self._build, name="semantic-answer-cache", daemon=True).start()
+        return False
+
+    def _build(self):
+        from django.db import connection
+        try:
+            self.sync()
+            self.ready = True
+        finally:
+            self.building = False
+            connection.close()
+
+    def sync(self):
+        batch_size = settings.CHAT_SEMANTIC_CACHE_BATCH_SIZE
+        with self.lock:
+            while True:
+                rows = list(
+                    Answer.objects.filter(id__gt=self.last_answer_id, with_context=False)
+                    .order_by("id")
+                    .values_list("id", "message__question", "answer")[:batch_size]
+                )
+                if not rows:
+                    break
+                keys, signatures, tags = [], [], []
+                for answer_id, question, answer in rows:
+                    language = self.detect_language(question or "")
+                    if language not in LANGUAGE_TAGS or not answer or answer in self.excluded_answers:
+                        continue
+                    keys.append(answer_id)
+                    signatures.append(self.signature(question))
+                    tags.append(LANGUAGE_TAGS[language])
+                if keys:
+                    self.index.add_many(keys, signatures, tags)
+                self.last_answer_id = rows[-1][0]
+                if len(rows) < batch_size:
+                    break
+            self.last_sync = time.monotonic()
+
+    def get(self, question, language):
+        if not settings.CHAT_SEMANTIC_CACHE_ENABLED or language not in LANGUAGE_TAGS:
+            return None
+        if not self.ensure_ready():
+            return None
+
+        with self.lock:
+            match = self.index.query(
+                self.signature(question), settings.CHAT_SEMANTIC_CACHE_THRESHOLD, tag=LANGUAGE_TAGS[language]
+            )
+        answer = None
+        if match:
+            answer = Answer.objects.filter(pk=match[0]).values_list("answer", flat=True).first()
+        metrics.incr("semantic_cache_hits" if answer is not None else "semantic_cache_misses")
+        return answer
+
+    @staticmethod
+    def stats():
+        counters = metrics.get_counters("semantic_cache_hits", "semantic_cache_misses")
+        lookups = counters["semantic_cache_hits"] + counters["semantic_cache_misses"]
+        return {
+            **counters,
+            "semantic_cache_hit_rate": metrics.ratio(counters["semantic_cache_hits"], lookups),
+            "semantic_cache_saved_spend": round(
+                counters["semantic_cache_hits"] * settings.CHAT_ESTIMATED_COST_PER_COMPLETION, 4
+            ),
+        }
@@ -1,13 +1,29 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from apps.chat.models import Message, ChatHistory, Answer
+from apps.chat.models import Message, ChatHistory, Answer, GenerationJob
 from apps.accounts.serializers import CustomUserDetailSerializer
 from apps.prices_x_cards.models import Payment
 
 from apps.chat.service import chatbot_response, ChatService
 
 
+def answers_prefetch(prefix=''):
+    """Prefetches every answer version of the messages, newest first, into `answers_by_version`."""
+    return Prefetch(
+        f'{prefix}answers',
+        queryset=Answer.objects.order_by('-version'),
+        to_attr='answers_by_version'
+    )
+
+
+def latest_answer_of(message):
+    if hasattr(message, 'answers_by_version'):
+        return message.answers_by_version[0] if message.answers_by_version else None
+    return Answer.objects.filter(message=message).order_by('-version').first()
+
+
 class ChatHistoryCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChatHistory
@@ -16,22 +32,46 @@ class ChatHistoryCreateSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         user = self.context.get('request').user
 
-        chat_history_user_is_active_change = ChatHistory.objects.filter(user=user).update(is_active=False)
+        chat_history_user_is_active_change = ChatHistory.objects.filter(user=user, is_active=True).update(
+            is_active=False
+        )
         chat_history = ChatHistory.objects.create(**validated_data, user=user, is_active=True)
         return chat_history
 
 
+class ChatHistorySummarySerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    created = serializers.DateTimeField()
+    is_active = serializers.BooleanField()
+    message_count = serializers.IntegerField()
+    answered_count = serializers.IntegerField()
+    last_message_at = serializers.DateTimeField(allow_null=True)
+    first_question = serializers.CharField(allow_null=True)
+
+
+class ChatHistoryListSerializer(serializers.ModelSerializer):
+    """Rendered from the chat row alone: the counters are denormalized on ChatHistory."""
+
+    class Meta:
+        model = ChatHistory
+        fields = ["id", "user", "created", "is_active", "message_count", "answered_count", "last_message_at",
+                  "first_question_preview"]
+
+
 class MessageListUserSerializer(serializers.ModelSerializer):
     chat_history = ChatHistoryCreateSerializer(read_only=True)
     answer = serializers.SerializerMethodField()
 
     class Meta:
         model = Message
-        fields = ["id", "question", "created", "chat_history"]
+        fields = ["id", "question", "answer", "created", "chat_history"]
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('chat_history').prefetch_related(answers_prefetch())
 
     def get_answer(self, obj):
-        get_answer = Answer.objects.select_related('message').filter(message=obj).first()
-        serializer = AnswerSerializer(get_answer, context={'request': self.context.get('request')})
+        serializer = AnswerSerializer(latest_answer_of(obj), context={'request': self.context.get('request')})
         return serializer.data
 
 
@@ -74,7 +114,15 @@ class ChatHistorySerializer(serializers.ModelSerializer):
 class AnswerSerializer(serializers.ModelSerializer):
     class Meta:
         model = Answer
-        fields = ["id", "answer", "created"]
+        fields = ["id", "answer", "version", "created"]
+
+
+class GenerationJobSerializer(serializers.ModelSerializer):
+    answer = AnswerSerializer(read_only=True)
+
+    class Meta:
+        model = GenerationJob
+        fields = ["id", "message", "status", "attempts", "answer", "error", "created", "updated"]
 
 
 class MessageSerializer(serializers.ModelSerializer):
@@ -85,8 +133,7 @@ class MessageSerializer(serializers.ModelSerializer):
         fields = ["id", "question",  "answer", "created"]
 
     def get_answer(self, obj):
-        get_answer = Answer.objects.select_related('message').filter(message=obj).first()
-        serializer = AnswerSerializer(get_answer, context={'request': self.context.get('request')})
+        serializer = AnswerSerializer(latest_answer_of(obj), context={'request': self.context.get('request')})
         return serializer.data
 
 
@@ -99,12 +146,19 @@ class ChatHistoryDetailSerializer(serializers.ModelSerializer):
         model = ChatHistory
         fields = ["id", "user", "created", "is_active", "message_list", "first_msg"]
 
+    def messages_of(self, obj):
+        if hasattr(obj, 'message_list_prefetched'):
+            return obj.message_list_prefetched
+        return list(Message.objects.filter(chat_history=obj).prefetch_related(answers_prefetch()))
+
     def get_message_list(self, obj):
-        messages = Message.objects.filter(chat_history=obj)
-        serializer = MessageSerializer(messages, many=True, context={'request': self.context.get('request')})
+        serializer = MessageSerializer(self.messages_of(obj), many=True, context={'request': self.context.get('request')})
         return serializer.data
 
     def get_first_msg(self, obj):
-        first_msg = Message.objects.filter(chat_history=obj, first_message=True).first()
+        if hasattr(obj, 'first_msg_prefetched'):
+            first_msg = obj.first_msg_prefetched
+        else:
+            first_msg = next((message for message in self.messages_of(obj) if message.first_message), None)
         serializer = MessageSerializer(first_msg, context={'request': self.context.get('request')})
         return serializer.data
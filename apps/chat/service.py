@@ -1,30 +1,96 @@
 from pathlib import Path
+import logging
 import os
 
-import openai
-from functools import lru_cache
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.db import transaction
-from rest_framework.exceptions import ValidationError
+from django.db.models import Exists, OuterRef
+from rest_framework.exceptions import Throttled, ValidationError
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 
-from apps.chat.models import ChatHistory, Message, RequestCount
-from apps.prices_x_cards.models import Payment
+from apps.chat.cache import AnswerCache
+from apps.chat.context import ConversationSummarizer, build_history, token_counter
+from apps.chat.eager import schedule_answer_generation
+from apps.chat.entitlements import consume_request, entitlement_cache
+from apps.chat.llm import load_backend
+from apps.chat.models import ChatHistory, Message, Answer
+from apps.chat.resilience import CircuitOpenError
+from apps.chat.scheduler import priority, user_priority
+from apps.chat.semantic_cache import SemanticAnswerCache
+from apps.chat.singleflight import SingleFlight
 from dotenv import load_dotenv
 from apps.chat.load_env import load_env
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 
 
-client = openai.OpenAI(
-	api_key=OPENAI_API_KEY)
+llm = load_backend()
+
+# Bump whenever SYSTEM_PROMPT or build_chat_messages() changes so cached answers are not reused.
+PROMPT_VERSION = "v1"
+
+answer_cache = AnswerCache(model=settings.CHAT_MODEL, prompt_version=PROMPT_VERSION)
+
+answer_flight = SingleFlight("answer")
+
+# Concurrent answer generation for the same message, see get_or_generate_answer(). Eager generation runs in the
+# worker that took the message, so with it on, a request in any other worker has to find its lock to wait for it.
+message_flight = SingleFlight(
+    "message_answer", distributed=lambda: settings.CHAT_SINGLEFLIGHT_DISTRIBUTED or settings.CHAT_EAGER_ANSWERS
+)
+
+
+def cached_response(user_message, language, refresh=False):
+	"""With refresh, cached answers are skipped and replaced by a new completion."""
+	if not refresh:
+		answer = answer_cache.get(user_message, language)
+		if answer is not None:
+			return answer
+
+		answer = semantic_cache.get(user_message, language)
+		if answer is not None:
+			answer_cache.set(user_message, language, answer)
+			return answer
+
+	def complete_and_cache():
+		result = request_completion(user_message, language)
+		answer_cache.set(user_message, language, result)
+		return result
+
+	return answer_flight.do(
+		answer_cache.make_key(user_message, language),
+		complete_and_cache,
+		lookup=None if refresh else lambda: answer_cache.peek(user_message, language)
+	)
+
+
+async def acached_response(user_message, language, refresh=False):
+	if not refresh:
+		answer = await answer_cache.aget(user_message, language)
+		if answer is not None:
+			return answer
+
+		answer = await sync_to_async(semantic_cache.get)(user_message, language)
+		if answer is not None:
+			await answer_cache.aset(user_message, language, answer)
+			return answer
 
+	async def complete_and_cache():
+		result = await arequest_completion(user_message, language)
+		await answer_cache.aset(user_message, language, result)
+		return result
 
-@lru_cache(maxsize=100)
-def cached_response(user_message, language):
-	return chatbot_response_core(user_message, language)
+	return await answer_flight.ado(
+		answer_cache.make_key(user_message, language),
+		complete_and_cache,
+		lookup=None if refresh else lambda: answer_cache.apeek(user_message, language)
+	)
 
 
 def detect_language(text):
@@ -42,104 +108,292 @@ def detect_language(text):
 	return None
 
 
-def chatbot_response_core(user_message, language):
+SYSTEM_PROMPT = (
+    "You are a medical assistant that only answers questions related to health, diseases, and medicines. "
+    "You respond in Russian, English, or Uzbek, based on the user's input language. "
+    "If the question is not related to health, return the specified rejection message in the correct language."
+)
+
+
+def build_chat_messages(user_message, language, history=()):
+    user_message = token_counter.truncate(user_message, settings.CHAT_MAX_QUESTION_TOKENS)
+    prompt = (
+        f"First, determine if the following question is related to health, diseases, or medicines. "
+        f"If it is not, respond with: "
+        f"'I can only answer questions related to health, diseases, and medicines.' (in English), "
+        f"'Я могу отвечать только на вопросы, связанные со здоровьем, болезнями и лекарствами.' (in Russian), "
+        f"or 'Men faqat sog‘liq, kasallik va dori-darmon haqidagi savollarga javob bera olaman.' (in Uzbek), "
+        f"depending on the language '{language}'. "
+        f"If it is related, provide an accurate and helpful answer in the same language as the input. "
+        f"Question: {user_message}"
+    )
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        *history,
+        {"role": "user", "content": prompt}
+    ]
+
+
+def error_response(language):
+    if language == "ru":
+        return "Извините, произошла ошибка. Пожалуйста, попробуйте снова."
+    elif language == "uz":
+        return "Kechirasiz, xato yuz berdi. Iltimos, qayta urinib ko‘ring."
+    else:
+        return "Sorry, an error occurred. Please try again."
+
+
+def unsupported_language_response(language):
+    if language == "ru":
+        return "Пожалуйста, пишите только на русском, английском или узбекском языке."
+    elif language == "uz":
+        return "Iltimos, faqat rus, ingliz yoki o‘zbek tilida yozing."
+    else:
+        return "Please write only in Russian, English, or Uzbek."
+
+
+semantic_cache = SemanticAnswerCache(
+    detect_language,
+    excluded_answers=[
+        response(language)
+        for response in (error_response, unsupported_language_response)
+        for language in ("ru", "en", "uz")
+    ]
+)
+
+
+def log_chatbot_error(e):
+    if isinstance(e, CircuitOpenError):
+        logger.warning("Chatbot request rejected: %s", e)
+        return
+    logger.error("Chatbot request failed: %s: %s", type(e).__name__, e, exc_info=e)
+
+
+def request_completion(user_message, language, history=()):
+    return llm.complete(build_chat_messages(user_message, language, history), max_tokens=500, temperature=0.7)
+
+
+async def arequest_completion(user_message, language, history=()):
+    return await llm.acomplete(build_chat_messages(user_message, language, history), max_tokens=500, temperature=0.7)
+
+
+def request_summary(messages, max_tokens):
+    return llm.complete(messages, max_tokens=max_tokens, temperature=0)
+
+
+summarizer = ConversationSummarizer(request_summary)
+
+
+def conversation_history(message):
+    """Previous turns of the message's chat to send along with it, or an empty list."""
+    if not settings.CHAT_CONTEXT_ENABLED:
+        return []
+    return build_history(message, summarizer if settings.CHAT_CONTEXT_SUMMARIZE else None)
+
+
+def chatbot_response_stream(user_message, refresh=False, history=()):
+    """
+    Yields the answer as text deltas from the LLM backend's stream.
+    Raises on upstream errors so the caller can decide what to persist.
+    With refresh, cached answers are skipped and replaced by the new one.
+    Answers given with conversation history depend on it and bypass the caches.
+    """
+    language = detect_language(user_message)
+
+    if language not in ["ru", "en", "uz"]:
+        yield unsupported_language_response(language)
+        return
+
+    cached_answer = None
+    if not refresh and not history:
+        cached_answer = answer_cache.get(user_message, language)
+        if cached_answer is None:
+            cached_answer = semantic_cache.get(user_message, language)
+            if cached_answer is not None:
+                answer_cache.set(user_message, language, cached_answer)
+    if cached_answer is not None:
+        yield cached_answer
+        return
+
+    chunks = []
+    stream = llm.stream(build_chat_messages(user_message, language, history), max_tokens=500, temperature=0.7)
     try:
-        prompt = (
-            f"First, determine if the following question is related to health, diseases, or medicines. "
-            f"If it is not, respond with: "
-            f"'I can only answer questions related to health, diseases, and medicines.' (in English), "
-            f"'Я могу отвечать только на вопросы, связанные со здоровьем, болезнями и лекарствами.' (in Russian), "
-            f"or 'Men faqat sog‘liq, kasallik va dori-darmon haqidagi savollarga javob bera olaman.' (in Uzbek), "
-            f"depending on the language '{language}'. "
-            f"If it is related, provide an accurate and helpful answer in the same language as the input. "
-            f"Question: {user_message}"
-        )
+        for delta in stream:
+            chunks.append(delta)
+            yield delta
+    finally:
+        stream.close()
 
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a medical assistant that only answers questions related to health, diseases, and medicines. "
-                        "You respond in Russian, English, or Uzbek, based on the user's input language. "
-                        "If the question is not related to health, return the specified rejection message in the correct language."
-                    )
-                },
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=500,
-            temperature=0.7
-        )
-        return response.choices[0].message.content
-
-    except Exception as e:
-        import traceback
-        print("=" * 50)
-        print("❌ Xatolik yuz berdi:")
-        print("Xatolik turi:", type(e).__name__)
-        print("Xatolik matni:", str(e))
-        print("Traceback:")
-        traceback.print_exc()
-        print("=" * 50)
-
-        if language == "ru":
-            return "Извините, произошла ошибка. Пожалуйста, попробуйте снова."
-        elif language == "uz":
-            return "Kechirasiz, xato yuz berdi. Iltimos, qayta urinib ko‘ring."
-        else:
-            return "Sorry, an error occurred. Please try again."
-
-
-def chatbot_response(user_message):
+    if not history:
+        answer_cache.set(user_message, language, "".join(chunks))
+
+
+def chatbot_response(user_message, fail_silently=True, refresh=False, history=()):
 	language = detect_language(user_message)
 
 	if language not in ["ru", "en", "uz"]:
-		if language == "ru":
-			return "Пожалуйста, пишите только на русском, английском или узбекском языке."
-		elif language == "uz":
-			return "Iltimos, faqat rus, ingliz yoki o‘zbek tilida yozing."
-		else:
-			return "Please write only in Russian, English, or Uzbek."
+		return unsupported_language_response(language)
+
+	try:
+		if history:
+			return request_completion(user_message, language, history)
+		return cached_response(user_message, language, refresh=refresh)
+	except Throttled:
+		raise
+	except Exception as e:
+		if not fail_silently:
+			raise
+		log_chatbot_error(e)
+		return error_response(language)
+
+
+async def achatbot_response(user_message, fail_silently=True, refresh=False, history=()):
+	language = detect_language(user_message)
 
-	return cached_response(user_message, language)
+	if language not in ["ru", "en", "uz"]:
+		return unsupported_language_response(language)
+
+	try:
+		if history:
+			return await arequest_completion(user_message, language, history)
+		return await acached_response(user_message, language, refresh=refresh)
+	except Throttled:
+		raise
+	except Exception as e:
+		if not fail_silently:
+			raise
+		log_chatbot_error(e)
+		return error_response(language)
+
+
+def message_priority(message):
+	"""LLM queue priority of the owner of the message's chat."""
+	user_id = ChatHistory.objects.filter(pk=message.chat_history_id).values_list('user_id', flat=True).first()
+	return user_priority(user_id)
+
+
+def latest_answer(message_id):
+	return Answer.objects.filter(message_id=message_id).order_by('-version').first()
+
+
+async def alatest_answer(message_id):
+	return await Answer.objects.filter(message_id=message_id).order_by('-version').afirst()
+
+
+def get_or_generate_answer(message, regenerate=False, fail_silently=True):
+	"""
+	Returns (answer, created). An existing answer is returned as is. Otherwise the answer is generated with no
+	transaction open, since the LLM call may take up to its deadline, and stored with save_answer(). Concurrent
+	requests for the same message share one LLM call through message_flight (across workers as well with
+	CHAT_SINGLEFLIGHT_DISTRIBUTED or CHAT_EAGER_ANSWERS), and when another request stored an answer first, that one
+	is returned.
+	With regenerate, a new answer version is always generated.
+	"""
+	created = []
+
+	def generate():
+		if not regenerate:
+			existing = latest_answer(message.id)
+			if existing is not None:
+				return existing
+		with priority(message_priority(message)):
+			history = conversation_history(message)
+			answer_text = chatbot_response(
+				message.question, fail_silently=fail_silently, refresh=regenerate, history=history
+			)
+		answer, stored = save_answer(message, answer_text, regenerate=regenerate, with_context=bool(history))
+		created.append(stored)
+		return answer
+
+	if regenerate:
+		return generate(), created[0]
+	answer = latest_answer(message.id)
+	if answer is not None:
+		return answer, False
+	answer = message_flight.do(message.id, generate, lookup=lambda: latest_answer(message.id))
+	# Only the request whose generate() ran can have created it; the others waited for its answer
+	return answer, bool(created) and created[0]
+
+
+async def aget_or_generate_answer(message, regenerate=False, fail_silently=True):
+	"""Async get_or_generate_answer(); the LLM call is awaited, the database work runs in threads."""
+	created = []
+
+	async def generate():
+		if not regenerate:
+			existing = await alatest_answer(message.id)
+			if existing is not None:
+				return existing
+		with priority(await sync_to_async(message_priority)(message)):
+			history = await sync_to_async(conversation_history)(message)
+			answer_text = await achatbot_response(
+				message.question, fail_silently=fail_silently, refresh=regenerate, history=history
+			)
+		answer, stored = await sync_to_async(save_answer)(
+			message, answer_text, regenerate=regenerate, with_context=bool(history)
+		)
+		created.append(stored)
+		return answer
+
+	if regenerate:
+		return await generate(), created[0]
+	answer = await alatest_answer(message.id)
+	if answer is not None:
+		return answer, False
+	answer = await message_flight.ado(message.id, generate, lookup=lambda: alatest_answer(message.id))
+	return answer, bool(created) and created[0]
+
+
+def save_answer(message, answer_text, regenerate=False, with_context=False):
+	"""
+	Stores a generated answer; only this short write holds the message row lock, which serializes the version
+	numbers (on PostgreSQL it is also what keeps them unique across answer partitions, see apps.chat.partitions).
+	Returns (answer, created); when another request stored an answer first, that one wins.
+	with_context marks answers generated with conversation history, which the semantic cache does not index.
+	"""
+	with transaction.atomic():
+		# all_objects: the soft-delete filter outer-joins the chat, and PostgreSQL cannot lock through that join
+		Message.all_objects.select_for_update().filter(pk=message.pk).first()
+		latest = latest_answer(message.id)
+		if latest is not None and not regenerate:
+			return latest, False
+		answer = Answer.objects.create(
+			message=message,
+			answer=answer_text,
+			version=latest.version + 1 if latest else 1,
+			with_context=with_context
+		)
+	return answer, True
 
 
 class ChatService:
     @staticmethod
     def create_chat_history_and_message(user, message_content, chat_history_id):
-        chat_history = ChatHistory.objects.filter(pk=chat_history_id).first()
+        chat_history = ChatHistory.objects.filter(pk=chat_history_id).annotate(
+            has_first_message=Exists(Message.objects.filter(chat_history=OuterRef('pk'), first_message=True))
+        ).first()
         if not chat_history:
             raise ValidationError("История чата не найдена.")
 
-        request_count = RequestCount.objects.filter(user=user).order_by('-id').first()
-        if not request_count:
-            request_count = RequestCount.objects.create(user=user, request_count=0)
-
-        payment = Payment.objects.filter(user=user, status='success').last()
-
-        if not payment and request_count.request_count > 0:
-            raise ValidationError("Вы уже использовали бесплатный запрос. Для продолжения приобретите тариф.")
-
-        allowed_typing_count = 1 if not payment else payment.product_pocket.count_typing
-
         with transaction.atomic():
-            first_message = Message.objects.filter(
-                chat_history=chat_history, first_message=True
-            ).last()
-
-            if request_count.request_count < allowed_typing_count:
+            if consume_request(user.pk):
                 message = Message.objects.create(
                     chat_history=chat_history,
                     question=message_content,
-                    first_message=not bool(first_message)
+                    first_message=not chat_history.has_first_message
                 )
-            else:
-                chat_history.is_active = False
-                chat_history.save()
-                raise ValidationError('Лимит чатов для тарифа исчерпан.')
+                transaction.on_commit(lambda: schedule_answer_generation(message.id))
+                return message
 
-            request_count.request_count += 1
-            request_count.save()
+        # Only reached when the quota is used up
+        if entitlement_cache.get(user.pk).product_id is None:
+            raise ValidationError("Вы уже использовали бесплатный запрос. Для продолжения приобретите тариф.")
+        ChatHistory.objects.filter(pk=chat_history.pk).update(is_active=False)
+        raise ValidationError('Лимит чатов для тарифа исчерпан.')
 
-            return message
+    @staticmethod
+    async def acreate_chat_history_and_message(user, message_content, chat_history_id):
+        # transaction.atomic() is not supported in async code, so the whole check-and-write runs in a thread.
+        return await sync_to_async(ChatService.create_chat_history_and_message)(
+            user, message_content, chat_history_id
+        )
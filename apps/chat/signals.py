@@ -0,0 +1,67 @@
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from apps.chat.entitlements import grant_payment
+from apps.chat.models import Answer, ChatHistory, Message
+from apps.chat.statistics import change_message_counter, count_new_answer, count_new_message, deleted_with, \
+    invalidate_weekly_stats, refresh_chat_counters
+from apps.prices_x_cards.models import Payment
+
+
+@receiver(post_save, sender=Answer)
+def answer_saved(sender, instance, created, **kwargs):
+    from apps.chat.service import semantic_cache
+
+    if created:
+        semantic_cache.mark_stale()
+        count_new_answer(instance)
+
+
+@receiver(post_delete, sender=Answer)
+def answer_deleted(sender, instance, origin=None, **kwargs):
+    # Answers deleted with their message or chat are accounted for by the message or chat
+    if not deleted_with(origin, Message, ChatHistory):
+        chat_ids = Message.all_objects.filter(pk=instance.message_id).values_list('chat_history_id', flat=True)
+        refresh_chat_counters(chat_ids)
+
+
+@receiver(post_save, sender=ChatHistory)
+@receiver(post_delete, sender=ChatHistory)
+def chat_history_changed(sender, instance, **kwargs):
+    invalidate_weekly_stats(instance.user_id)
+
+
+@receiver(pre_delete, sender=ChatHistory)
+def chat_history_deleting(sender, instance, **kwargs):
+    # Messages deleted with their chat are subtracted here at once rather than one by one;
+    # chats marked deleted were already subtracted by soft_delete_chats
+    # The instance may be stale: counters are only ever changed by UPDATE
+    message_count = ChatHistory.objects.filter(pk=instance.pk).values_list('message_count', flat=True).first()
+    if message_count:
+        change_message_counter(instance.user_id, -message_count)
+
+
+@receiver(post_save, sender=Message)
+def message_saved(sender, instance, created, **kwargs):
+    if created and instance.chat_history_id:
+        user_id = instance.chat_history.user_id
+        invalidate_weekly_stats(user_id)
+        change_message_counter(user_id, 1)
+        count_new_message(instance)
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, origin=None, **kwargs):
+    if not deleted_with(origin, ChatHistory):
+        refresh_chat_counters([instance.chat_history_id])
+        # Messages of chats marked deleted are no longer counted
+        user_id = ChatHistory.objects.filter(pk=instance.chat_history_id).values_list('user_id', flat=True).first()
+        if user_id is not None:
+            invalidate_weekly_stats(user_id)
+            change_message_counter(user_id, -1)
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, raw=False, **kwargs):
+    if not raw and instance.status == 'success':
+        grant_payment(instance)
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from apps.chat import metrics
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller runs the function and the others wait for its
+    result instead of repeating the work. Threads and asyncio tasks are coalesced within the process.
+
+    With CHAT_SINGLEFLIGHT_DISTRIBUTED, the in-process leader also takes a lock in a shared cache. Leaders in other
+    workers then poll `lookup` (for example the answer cache) until the lock holder has published the result,
+    instead of calling upstream themselves. `distributed`, a callable, decides this per flight instead of the setting.
+    """
+
+    def __init__(self, name, distributed=None):
+        self.name = name
+        self.distributed = distributed or (lambda: settings.CHAT_SINGLEFLIGHT_DISTRIBUTED)
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.async_calls = {}
+
+    def do(self, key, fn, lookup=None):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            metrics.incr(f"{self.name}_coalesced")
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_leader(key, fn, lookup)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+
+    async def ado(self, key, coro_fn, lookup=None):
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        with self.lock:
+            future = self.async_calls.get(flight_key)
+            leader = future is None
+            if leader:
+                future = self.async_calls[flight_key] = loop.create_future()
+
+        if not leader:
+            await metrics.aincr(f"{self.name}_coalesced")
+            return await asyncio.shield(future)
+
+        try:
+            result = await self._arun_leader(key, coro_fn, lookup)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting for it
+            future.exception()
+            raise
+        finally:
+            with self.lock:
+                del self.async_calls[flight_key]
+
+    def in_flight(self, key):
+        """Whether a call for the key runs in this process or, when distributed, holds the lock in another one."""
+        with self.lock:
+            if key in self.calls or any(flight_key == key for _, flight_key in self.async_calls):
+                return True
+        return self.distributed() and self._lock_cache().get(self._lock_key(key)) is not None
+
+    @staticmethod
+    def _lock_cache():
+        return caches[settings.CHAT_SINGLEFLIGHT_LOCK_CACHE_ALIAS]
+
+    def _lock_key(self, key):
+        return f"singleflight:{self.name}:{key}"
+
+    def _run_leader(self, key, fn, lookup):
+        if lookup is None or not self.distributed():
+            return fn()
+
+        cache = self._lock_cache()
+        lock_key = self._lock_key(key)
+        timeout = settings.CHAT_SINGLEFLIGHT_LOCK_TIMEOUT
+        deadline = time.monotonic() + timeout
+        while not cache.add(lock_key, os.getpid(), timeout):
+            result = lookup()
+            if result is not None:
+                metrics.incr(f"{self.name}_coalesced_remote")
+                return result
+            if time.monotonic() >= deadline:
+                # The lock holder died or is too slow; do the work ourselves
+                return fn()
+            time.sleep(settings.CHAT_SINGLEFLIGHT_POLL_INTERVAL)
+
+        try:
+            result = lookup()
+            if result is not None:
+                return result
+            return fn()
+        finally:
+            cache.delete(lock_key)
+
+    async def _arun_leader(self, key, coro_fn, lookup):
+        if lookup is None or not self.distributed():
+            return await coro_fn()
+
+        cache = self._lock_cache()
+        lock_key = self._lock_key(key)
+        timeout = settings.CHAT_SINGLEFLIGHT_LOCK_TIMEOUT
+        deadline = time.monotonic() + timeout
+        while not await cache.aadd(lock_key, os.getpid(), timeout):
+            result = await lookup()
+            if result is not None:
+                await metrics.aincr(f"{self.name}_coalesced_remote")
+                return result
+            if time.monotonic() >= deadline:
+                return await coro_fn()
+            await asyncio.sleep(settings.CHAT_SINGLEFLIGHT_POLL_INTERVAL)
+
+        try:
+            result = await lookup()
+            if result is not None:
+                return result
+            return await coro_fn()
+        finally:
+            await cache.adelete(lock_key)
+
+    def stats(self):
+        return metrics.get_counters(f"{self.name}_coalesced", f"{self.name}_coalesced_remote")
@@ -0,0 +1,192 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, Max, OuterRef, Q, QuerySet, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Substr, TruncDay
+from django.utils.timezone import now
+
+from apps.accounts.models import CustomUser
+from apps.chat.models import Answer, ChatHistory, Message, UserMessageCounter
+
+WEEKLY_DAYS = 7
+QUESTION_PREVIEW_LENGTH = 100
+
+
+def day_label(days_ago):
+    if days_ago == 0:
+        return "today"
+    if days_ago == 1:
+        return "yesterday"
+    return f"{days_ago}_days_ago"
+
+
+def weekly_stats_cache():
+    return caches[settings.CHAT_WEEKLY_STATS_CACHE_ALIAS]
+
+
+def weekly_stats_cache_key(user_id, today=None):
+    today = today or now().date()
+    return f"chat:weekly_stats:{user_id}:{today.isoformat()}"
+
+
+def invalidate_weekly_stats(user_id):
+    if user_id is not None:
+        weekly_stats_cache().delete(weekly_stats_cache_key(user_id))
+
+
+def weekly_chat_summaries(user_id):
+    """
+    The user's chats of the last 7 days as lightweight summaries, bucketed by day:
+    [{"today": [...]}, {"yesterday": [...]}, {"2_days_ago": [...]}, ...].
+    One query over the user's chats (counters are denormalized on ChatHistory), cached per user until a chat or
+    message of the user changes.
+    """
+    today = now().date()
+    key = weekly_stats_cache_key(user_id, today)
+    result = weekly_stats_cache().get(key)
+    if result is not None:
+        return result
+
+    rows = (
+        ChatHistory.objects
+        .filter(user_id=user_id, created__date__gte=today - timedelta(days=WEEKLY_DAYS - 1))
+        .annotate(day=TruncDay('created'), first_question=F('first_question_preview'))
+        .order_by('-created', '-id')
+        .values('id', 'created', 'is_active', 'day', 'message_count', 'answered_count', 'last_message_at',
+                'first_question')
+    )
+
+    buckets = [[] for _ in range(WEEKLY_DAYS)]
+    for row in rows:
+        days_ago = (today - row.pop('day').date()).days
+        if 0 <= days_ago < WEEKLY_DAYS:
+            buckets[days_ago].append(row)
+
+    from apps.chat.serializers import ChatHistorySummarySerializer
+    result = [
+        {day_label(days_ago): ChatHistorySummarySerializer(chats, many=True).data}
+        for days_ago, chats in enumerate(buckets)
+    ]
+    weekly_stats_cache().set(key, result, settings.CHAT_WEEKLY_STATS_CACHE_TTL)
+    return result
+
+
+def change_message_counter(user_id, delta):
+    """Adds `delta` (may be negative) to the user's message counter, creating the row on first use."""
+    if user_id is None or not delta:
+        return
+    counter = UserMessageCounter.objects.filter(user_id=user_id)
+    if counter.update(message_count=Greatest(F('message_count') + delta, Value(0))):
+        return
+    try:
+        with transaction.atomic():
+            UserMessageCounter.objects.create(user_id=user_id, message_count=max(delta, 0))
+    except IntegrityError:
+        counter.update(message_count=Greatest(F('message_count') + delta, Value(0)))
+
+
+def user_message_counts(source='aggregate'):
+    """
+    Users annotated with `messages_count`, groups prefetched.
+    `aggregate` counts messages in the query; `counters` reads UserMessageCounter (see rebuild_user_message_counters),
+    which scales to large user tables.
+    """
+    users = CustomUser.objects.prefetch_related('groups')
+    if source == 'counters':
+        return users.annotate(messages_count=Coalesce('message_counter__message_count', 0))
+    return users.annotate(messages_count=Coalesce(
+        Sum('chat_histories__message_count', filter=Q(chat_histories__deleted_at__isnull=True)), 0
+    ))
+
+
+def rebuild_user_message_counters(batch_size=1000):
+    """Recomputes every user's counter from the messages table; returns the number of users processed."""
+    processed = 0
+    last_id = 0
+    while True:
+        users = list(
+            CustomUser.objects.filter(id__gt=last_id).order_by('id')
+            .annotate(messages_count=Count(
+                'chat_histories__messages', filter=Q(chat_histories__deleted_at__isnull=True)
+            ))
+            .values_list('id', 'messages_count')[:batch_size]
+        )
+        if not users:
+            return processed
+        UserMessageCounter.objects.bulk_create(
+            [UserMessageCounter(user_id=user_id, message_count=count) for user_id, count in users],
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['message_count', 'updated'],
+        )
+        processed += len(users)
+        last_id = users[-1][0]
+
+
+def chat_counter_values():
+    """UPDATE values recomputing the denormalized counters of ChatHistory rows from their messages and answers."""
+    messages = Message.all_objects.filter(chat_history=OuterRef('pk')).order_by().values('chat_history')
+    answered = messages.filter(Exists(Answer.all_objects.filter(message=OuterRef('pk'))))
+    first_question = Message.all_objects.filter(
+        chat_history=OuterRef('pk'), first_message=True
+    ).order_by('created', 'id').values('question')[:1]
+    return {
+        'message_count': Coalesce(Subquery(messages.annotate(count=Count('id')).values('count')), 0),
+        'answered_count': Coalesce(Subquery(answered.annotate(count=Count('id')).values('count')), 0),
+        'last_message_at': Subquery(messages.annotate(last=Max('created')).values('last')),
+        'first_question_preview': Substr(Subquery(first_question), 1, QUESTION_PREVIEW_LENGTH),
+    }
+
+
+def refresh_chat_counters(chat_ids):
+    """Recomputes the counters of the given chats in one UPDATE (after messages or answers were deleted)."""
+    chat_ids = [chat_id for chat_id in chat_ids if chat_id is not None]
+    if chat_ids:
+        ChatHistory.all_objects.filter(pk__in=chat_ids).update(**chat_counter_values())
+
+
+def rebuild_chat_counters(batch_size=1000):
+    """Recomputes the counters of every chat, `batch_size` chats per UPDATE; returns the number of chats processed."""
+    processed = 0
+    last_id = 0
+    while True:
+        chat_ids = list(
+            ChatHistory.all_objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not chat_ids:
+            return processed
+        ChatHistory.all_objects.filter(id__gte=chat_ids[0], id__lte=chat_ids[-1]).update(**chat_counter_values())
+        processed += len(chat_ids)
+        last_id = chat_ids[-1]
+
+
+def count_new_message(message):
+    """Adds a just created message to its chat's counters in one UPDATE."""
+    created = Value(message.created)
+    changes = {
+        'message_count': F('message_count') + 1,
+        'last_message_at': Greatest(Coalesce('last_message_at', created), created),
+    }
+    if message.first_message:
+        changes['first_question_preview'] = Coalesce(
+            'first_question_preview', Value((message.question or '')[:QUESTION_PREVIEW_LENGTH])
+        )
+    ChatHistory.all_objects.filter(pk=message.chat_history_id).update(**changes)
+
+
+def count_new_answer(answer):
+    """Counts the message as answered when this is its first answer; regenerated versions change nothing."""
+    if Answer.all_objects.filter(message_id=answer.message_id).exclude(pk=answer.pk).exists():
+        return
+    chat = Message.all_objects.filter(pk=answer.message_id).values_list('chat_history_id', 'chat_history__user_id')
+    for chat_id, user_id in chat[:1]:
+        ChatHistory.all_objects.filter(pk=chat_id).update(answered_count=F('answered_count') + 1)
+        invalidate_weekly_stats(user_id)
+
+
+def deleted_with(origin, *models):
+    """Whether a delete signal comes from deleting an instance or queryset of one of `models` (cascade)."""
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return origin_model in models
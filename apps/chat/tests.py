@@ -1,3 +1,804 @@
-from django.test import TestCase
+import asyncio
+import json
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.accounts.models import CustomUser
+from apps.chat import eager, metrics
+from apps.chat.archive import BucketWriter, archive_month, restore_archived_chat
+from apps.chat.entitlements import EntitlementCache, consume_request, entitlement_cache
+from apps.chat.jobs import claim_job, enqueue_answer_job, run_job
+from apps.chat.llm import FakeBackend, LLMBackend, load_backend
+from apps.chat.models import (
+    Answer, ArchivedChat, ChatHistory, Entitlement, GenerationJob, Message, MessageArchive, RequestCount
+)
+from apps.chat.partitions import PARTITIONED_TABLES, create_month_partition, is_partitioned
+from apps.chat.purge import purge_deleted_chats
+from apps.chat.resilience import CircuitBreaker, CircuitOpenError, ResilientBackend
+from apps.chat.scheduler import FREE_PRIORITY, LLMScheduler, ScheduledBackend, priority, user_priority
+from apps.chat.semantic_cache import LANGUAGE_TAGS, SemanticAnswerCache
+from apps.chat.service import detect_language, get_or_generate_answer, message_flight, save_answer
+from apps.chat.singleflight import SingleFlight
+from apps.chat.statistics import weekly_stats_cache_key
+from apps.prices_x_cards.models import Payment, ProductPocket
+
+FAKE_LLM = {
+    'BACKEND': 'apps.chat.llm.FakeBackend',
+    'OPTIONS': {'latency': 0, 'tokens_per_second': 0, 'answer_tokens': 5},
+}
+
+
+def fake_llm():
+    return load_backend(FAKE_LLM)
+
+
+class ChatTestMixin:
+    """A user with an authenticated API client, the offline LLM backend and empty caches."""
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(
+            override_settings(CHAT_EAGER_ANSWERS=False, CHAT_SEMANTIC_CACHE_ENABLED=False, CHAT_CONTEXT_ENABLED=False)
+        )
+        for cache in caches.all():
+            cache.clear()
+        self.llm = self.enterContext(mock.patch('apps.chat.service.llm', fake_llm()))
+        self.user = CustomUser.objects.create_user(username='user', email='user@example.com', password='password')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def create_chat(self, messages=0, answers=True, user=None):
+        chat = ChatHistory.objects.create(user=user or self.user, is_active=True)
+        for k in range(messages):
+            message = Message.objects.create(chat_history=chat, question=f"headache question {k}", first_message=k == 0)
+            if answers:
+                Answer.objects.create(message=message, answer=f"answer {k}", version=1)
+        return chat
+
+
+def sse_events(response):
+    """[(event, data)] of a text/event-stream response."""
+    events = []
+    for block in b"".join(response.streaming_content).decode().split("\n\n"):
+        if not block:
+            continue
+        event = None
+        for line in block.split("\n"):
+            field, _, value = line.partition(": ")
+            if field == 'event':
+                event = value
+            elif field == 'data':
+                events.append((event, json.loads(value)))
+    return events
+
+
+class AnswerStreamTests(ChatTestMixin, TestCase):
+
+    def test_stream_sends_deltas_then_done_with_the_stored_answer(self):
+        chat = self.create_chat()
+        message = Message.objects.create(chat_history=chat, question="What helps with a headache?")
+
+        response = self.api.get(f'/chat/message/answer/{message.id}/stream/')
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = sse_events(response)
+        deltas = [data['delta'] for event, data in events if event is None]
+        self.assertTrue(deltas)
+        self.assertEqual(events[-1][0], 'done')
+        answer = Answer.objects.get(message=message)
+        self.assertEqual(events[-1][1], {'answer_id': answer.id})
+        self.assertEqual("".join(deltas), answer.answer)
+
+    def test_stream_replays_an_existing_answer(self):
+        chat = self.create_chat(messages=1)
+        message = chat.messages.get()
+
+        events = sse_events(self.api.get(f'/chat/message/answer/{message.id}/stream/'))
+
+        answer = message.answers.get()
+        self.assertEqual(events, [(None, {'delta': answer.answer}), ('done', {'answer_id': answer.id})])
+
+    def test_answer_stored_meanwhile_replaces_the_streamed_text(self):
+        message = Message.objects.create(chat_history=self.create_chat(), question="What helps with a headache?")
+
+        def stream(*args, **kwargs):
+            yield "streamed "
+            save_answer(message, "eager answer")
+            yield "text"
+
+        with mock.patch('apps.chat.views.chatbot_response_stream', stream):
+            events = sse_events(self.api.get(f'/chat/message/answer/{message.id}/stream/'))
+
+        answer = Answer.objects.get(message=message)
+        self.assertEqual(answer.answer, "eager answer")
+        self.assertEqual(events[-2:], [('replace', {'answer': "eager answer"}), ('done', {'answer_id': answer.id})])
+
+    def test_answer_in_flight_elsewhere_is_replayed_instead_of_streamed(self):
+        message = Message.objects.create(chat_history=self.create_chat(), question="What helps with a headache?")
+        caches[settings.CHAT_ANSWER_CACHE_ALIAS].set(eager.in_flight_key(message.id), True, 60)
+
+        with mock.patch('apps.chat.views.chatbot_response_stream') as stream:
+            events = sse_events(self.api.get(f'/chat/message/answer/{message.id}/stream/'))
+
+        stream.assert_not_called()
+        answer = Answer.objects.get(message=message)
+        self.assertEqual(events, [(None, {'delta': answer.answer}), ('done', {'answer_id': answer.id})])
+
+
+class AsyncAnswerTests(ChatTestMixin, TestCase):
+
+    def get(self, message, query=''):
+        token = AccessToken.for_user(self.user)
+        return self.client.get(f'/chat/async/message/answer/{message.id}/{query}', HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_answer_is_created_once_and_regenerated_on_request(self):
+        message = Message.objects.create(chat_history=self.create_chat(), question="What helps with a headache?")
+
+        statuses = [self.get(message).status_code, self.get(message).status_code]
+        regenerated = self.get(message, '?regenerate=true')
+
+        self.assertEqual(statuses, [201, 200])
+        self.assertEqual(regenerated.status_code, 201)
+        self.assertEqual(regenerated.json()['answer']['version'], 2)
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def wait_for_waiters(self, count):
+        deadline = time.monotonic() + 5
+        while metrics.get_counters('test_coalesced')['test_coalesced'] < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def run_concurrently(self, flight, fn, callers=3):
+        results, errors = [], []
+
+        def call():
+            try:
+                results.append(flight.do('key', fn))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        return threads, results, errors
+
+    def test_concurrent_callers_share_one_call(self):
+        flight, release, calls = SingleFlight('test'), threading.Event(), []
+
+        def fn():
+            calls.append(1)
+            release.wait(5)
+            return 'answer'
+
+        threads, results, errors = self.run_concurrently(flight, fn)
+        self.wait_for_waiters(2)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['answer'] * 3)
+        self.assertEqual(errors, [])
+        self.assertEqual(flight.calls, {})
+
+    def test_waiters_get_the_leaders_error_and_the_key_is_released(self):
+        flight, release = SingleFlight('test'), threading.Event()
+
+        def fail():
+            release.wait(5)
+            raise ValueError('upstream failed')
+
+        threads, results, errors = self.run_concurrently(flight, fail)
+        self.wait_for_waiters(2)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 3)
+        self.assertTrue(all(isinstance(e, ValueError) for e in errors))
+        self.assertEqual(flight.do('key', lambda: 'retried'), 'retried')
+
+
+class IdempotentAnswerTests(ChatTestMixin, TransactionTestCase):
+
+    def slow_completion(self, calls, in_transaction):
+        def complete(user_message, language, history=()):
+            calls.append(user_message)
+            in_transaction.append(connection.in_atomic_block)
+            time.sleep(0.2)
+            return f"answer to {user_message}"
+        return complete
+
+    def test_concurrent_requests_store_one_answer_without_a_transaction_open(self):
+        message = Message.objects.create(chat_history=self.create_chat(), question="What helps with a headache?")
+        calls, in_transaction, results = [], [], []
+
+        def request():
+            try:
+                results.append(get_or_generate_answer(Message.objects.get(pk=message.pk)))
+            finally:
+                connection.close()
+
+        with mock.patch('apps.chat.service.request_completion', self.slow_completion(calls, in_transaction)):
+            threads = [threading.Thread(target=request) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(in_transaction, [False])
+        answer = Answer.objects.get(message=message)
+        self.assertEqual([created for _, created in results].count(True), 1)
+        self.assertEqual({result.id for result, _ in results}, {answer.id})
+
+    def test_existing_answer_is_returned_and_regenerate_adds_a_version(self):
+        message = self.create_chat(messages=1).messages.get()
+        calls = []
+
+        with mock.patch('apps.chat.service.request_completion', self.slow_completion(calls, [])):
+            existing, created = get_or_generate_answer(message)
+            self.assertEqual((existing.version, created, calls), (1, False, []))
+
+            regenerated, created = get_or_generate_answer(message, regenerate=True)
+
+        self.assertTrue(created)
+        self.assertEqual(regenerated.version, 2)
+        self.assertEqual(len(calls), 1)
+
+    @override_settings(CHAT_EAGER_ANSWERS=True, CHAT_SINGLEFLIGHT_POLL_INTERVAL=0.01)
+    def test_request_waits_for_the_eager_generation_of_another_worker(self):
+        message = Message.objects.create(chat_history=self.create_chat(), question="What helps with a headache?")
+        lock_cache = caches[settings.CHAT_SINGLEFLIGHT_LOCK_CACHE_ALIAS]
+        # The worker that took the message holds the lock while its eager generation runs
+        lock_cache.add(message_flight._lock_key(message.id), 'other worker', 60)
+
+        def eager_answer_stored():
+            try:
+                save_answer(Message.objects.get(pk=message.pk), "eager answer")
+            finally:
+                connection.close()
+
+        calls = []
+        with mock.patch('apps.chat.service.request_completion', self.slow_completion(calls, [])):
+            timer = threading.Timer(0.2, eager_answer_stored)
+            timer.start()
+            answer, created = get_or_generate_answer(message)
+            timer.join()
+
+        self.assertEqual((answer.answer, created, calls), ("eager answer", False, []))
+
+    def test_save_answer_keeps_the_first_answer(self):
+        message = Message.objects.create(chat_history=self.create_chat(), question="What helps with a headache?")
+
+        first, created_first = save_answer(message, "first")
+        second, created_second = save_answer(message, "second")
+
+        self.assertEqual((created_first, created_second), (True, False))
+        self.assertEqual(second.id, first.id)
+        self.assertEqual(Answer.objects.filter(message=message).count(), 1)
+
+
+class ContextAnswerTests(ChatTestMixin, TestCase):
+
+    def test_answers_generated_with_history_are_flagged(self):
+        chat = self.create_chat()
+        first = Message.objects.create(chat_history=chat, question="What helps with a headache?")
+        follow_up = Message.objects.create(chat_history=chat, question="And at night?", first_message=False)
+
+        with override_settings(CHAT_CONTEXT_ENABLED=True, CHAT_CONTEXT_SUMMARIZE=False):
+            first_answer, _ = get_or_generate_answer(first)
+            follow_up_answer, _ = get_or_generate_answer(follow_up)
+
+        self.assertFalse(first_answer.with_context)
+        self.assertTrue(follow_up_answer.with_context)
+
+    def test_semantic_cache_skips_answers_with_context(self):
+        chat = self.create_chat()
+        plain = Message.objects.create(chat_history=chat, question="What helps with a headache at night?")
+        save_answer(plain, "Rest and water.")
+        follow_up = Message.objects.create(
+            chat_history=chat, question="What helps with a sore throat at night?", first_message=False
+        )
+        save_answer(follow_up, "As I said above, the same.", with_context=True)
+
+        cache = SemanticAnswerCache(detect_language)
+        cache.sync()
+
+        def lookup(question):
+            return cache.index.query(cache.signature(question), 0.8, tag=LANGUAGE_TAGS['en'])
+
+        self.assertEqual(lookup(plain.question)[0], plain.answers.get().id)
+        self.assertFalse(lookup(follow_up.question))
+
+
+class ScriptedBackend(LLMBackend):
+    """Raises or returns the scripted outcomes in order; async calls wait on `release` first."""
+
+    def __init__(self, *outcomes):
+        super().__init__('scripted')
+        self.outcomes = list(outcomes)
+        self.release = None
+
+    def outcome(self):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    def complete(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        return self.outcome()
+
+    async def acomplete(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        await self.release.wait()
+        return self.outcome()
+
+
+@override_settings(CHAT_LLM_MAX_RETRIES=0, CHAT_LLM_BREAKER_THRESHOLD=1, CHAT_LLM_BREAKER_RESET=60)
+class CircuitBreakerTests(SimpleTestCase):
+
+    def open_breaker(self, *outcomes):
+        backend = ResilientBackend(ScriptedBackend(TimeoutError("upstream timed out"), *outcomes), name="test")
+        with self.assertRaises(TimeoutError):
+            backend.complete([])
+        self.assertEqual(backend.breaker.state, CircuitBreaker.OPEN)
+        return backend
+
+    @staticmethod
+    def let_reset_timeout_pass(backend):
+        backend.breaker.opened_at -= backend.breaker.reset_timeout
+
+    def test_trial_ending_in_an_error_that_is_not_retried_opens_the_breaker_again(self):
+        backend = self.open_breaker(ValueError("bad request"), "answer")
+        self.let_reset_timeout_pass(backend)
+
+        with self.assertRaises(ValueError):
+            backend.complete([])
+
+        self.assertEqual(backend.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            backend.complete([])
+        self.let_reset_timeout_pass(backend)
+        self.assertEqual(backend.complete([]), "answer")
+        self.assertEqual(backend.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_cancelled_trial_opens_the_breaker_again(self):
+        backend = self.open_breaker("answer")
+        self.let_reset_timeout_pass(backend)
+
+        async def cancel_trial():
+            backend.backend.release = asyncio.Event()
+            trial = asyncio.ensure_future(backend.acomplete([]))
+            await asyncio.sleep(0)
+            trial.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await trial
+
+        asyncio.run(cancel_trial())
+
+        self.assertEqual(backend.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            backend.complete([])
+
+
+
+class SlowBackend(LLMBackend):
+    """Ignores the per-read timeout like a server that keeps trickling bytes."""
+
+    def complete(self, messages, max_tokens=500, temperature=0.7, timeout=None):
+        time.sleep(1)
+        return "late answer"
+
+
+@override_settings(CHAT_LLM_TIMEOUT=0.1, CHAT_LLM_TOTAL_TIMEOUT=0.3, CHAT_LLM_MAX_RETRIES=0)
+class DeadlineTests(SimpleTestCase):
+
+    def test_completion_is_bounded_by_the_attempt_timeout(self):
+        backend = ResilientBackend(SlowBackend('slow'), name="test")
+        started = time.monotonic()
+
+        with self.assertRaises(TimeoutError):
+            backend.complete([])
+
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_stream_is_cut_at_the_total_deadline(self):
+        backend = ResilientBackend(FakeBackend('fake', latency=0, tokens_per_second=20, answer_tokens=50), name="test")
+        deltas = []
+
+        with self.assertRaises(TimeoutError):
+            for delta in backend.stream([]):
+                deltas.append(delta)
+
+        self.assertTrue(0 < len(deltas) < 50)
+
+    def test_scheduler_slot_is_taken_per_attempt(self):
+        backend = load_backend(FAKE_LLM)
+
+        self.assertIsInstance(backend, ResilientBackend)
+        self.assertIsInstance(backend.backend, ScheduledBackend)
+        self.assertIn('llm_queue_depth', backend.stats())
+
+class SchedulerTests(ChatTestMixin, TestCase):
+
+    def test_full_queue_answers_429_with_retry_after(self):
+        message = Message.objects.create(chat_history=self.create_chat(), question="What helps with a headache?")
+        full = LLMScheduler("test", max_concurrency=0, max_queue=0, queue_timeout=1)
+
+        with mock.patch('apps.chat.service.llm', ScheduledBackend(FakeBackend('fake', latency=0), full)):
+            response = self.api.get(f'/chat/message/answer/{message.id}/')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(int(response['Retry-After']) >= 1)
+        self.assertFalse(Answer.objects.filter(message=message).exists())
+
+    def test_released_slot_goes_to_the_highest_priority_waiter(self):
+        scheduler = LLMScheduler("test", max_concurrency=1, max_queue=2, queue_timeout=5)
+        scheduler.acquire()
+        admitted = []
+
+        def wait(name, value):
+            with priority(value):
+                scheduler.acquire()
+            admitted.append(name)
+            scheduler.release()
+
+        threads = [threading.Thread(target=wait, args=('low', 1)), threading.Thread(target=wait, args=('high', 50))]
+        for thread in threads:
+            thread.start()
+            while scheduler.depth < threads.index(thread) + 1:
+                time.sleep(0.01)
+        scheduler.release()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(admitted, ['high', 'low'])
+        self.assertEqual((scheduler.active, scheduler.depth), (0, 0))
+
+    def test_every_paid_tariff_outranks_free_users(self):
+        product = ProductPocket.objects.create(title="Mini", count_typing=1)
+        Payment.objects.create(user=self.user, product_pocket=product, status='success', amount=10)
+
+        self.assertGreater(user_priority(self.user.pk), FREE_PRIORITY)
+        self.assertEqual(user_priority(None), FREE_PRIORITY)
+
+
+class WeeklyStatsTests(ChatTestMixin, TestCase):
+
+    def summaries(self):
+        return self.api.get('/chat/chat_history/statistics/').json()[0]['today']
+
+    def test_new_message_invalidates_the_shared_summaries(self):
+        chat = self.create_chat(messages=1)
+        self.assertEqual(self.summaries()[0]['message_count'], 1)
+        shared = caches[settings.CHAT_WEEKLY_STATS_CACHE_ALIAS]
+        self.assertIsNotNone(shared.get(weekly_stats_cache_key(self.user.pk)))
+
+        Message.objects.create(chat_history=chat, question="Another question")
+
+        self.assertIsNone(shared.get(weekly_stats_cache_key(self.user.pk)))
+        self.assertEqual(self.summaries()[0]['message_count'], 2)
+
+class QueryCountTests(ChatTestMixin, TestCase):
+    """The number of queries of a chat page does not grow with its messages."""
+
+    def assert_constant_queries(self, url, queries):
+        for messages in (5, 50):
+            chat = self.create_chat(messages=messages)
+            with self.subTest(messages=messages), self.assertNumQueries(queries):
+                response = self.api.get(url.format(chat.id))
+            self.assertEqual(response.status_code, 200)
+
+    def test_chat_history_detail(self):
+        self.assert_constant_queries('/chat/detail/{}/', 6)
+
+    def test_message_list(self):
+        self.assert_constant_queries('/chat/message/{}/', 3)
+
+
+class CursorPaginationTests(ChatTestMixin, TestCase):
+
+    def test_pages_cover_messages_with_equal_or_missing_created(self):
+        chat = self.create_chat(messages=7)
+        ids = list(Message.objects.filter(chat_history=chat).order_by('-id').values_list('id', flat=True))
+        Message.objects.filter(id__in=ids[3:]).update(created=timezone.now())
+        # created is part of the primary key of the partitioned table on PostgreSQL
+        if not is_partitioned(connection, 'chat_message'):
+            Message.objects.filter(id__in=ids[:3]).update(created=None)
+
+        seen, url = [], f'/chat/message/{chat.id}/?page_size=2'
+        while url:
+            page = self.api.get(url).json()
+            seen += [message['id'] for message in page['results']]
+            url = page['next']
+
+        self.assertEqual(seen, ids)
+
+
+class ArchiveTests(ChatTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(override_settings(CHAT_ARCHIVE_DIR=str(self.directory)))
+        self.chat = self.create_chat(messages=1)
+
+    def archive_chat(self):
+        """Writes one message of the chat with its answer to an archive the way archive_month() does."""
+        archive = MessageArchive.objects.create(
+            month=date(2020, 1, 1), name="2020-01", buckets=4, messages_count=1, answers_count=1
+        )
+        (self.directory / archive.name).mkdir()
+        writer = BucketWriter(self.directory / archive.name, archive.buckets)
+        writer.write('messages', self.chat.id, json.dumps({
+            'id': 9001, 'chat_history_id': self.chat.id, 'question': "archived question", 'first_message': False,
+            'created': "2020-01-05T10:00:00+00:00", 'cluster_id': 12345,
+        }))
+        writer.write('answers', self.chat.id, json.dumps({
+            'id': 9002, 'message_id': 9001, 'answer': "archived answer", 'version': 1, 'with_context': False,
+            'created': "2020-01-05T10:00:05+00:00",
+        }))
+        writer.close()
+        ArchivedChat.objects.create(chat_history=self.chat, archive=archive)
+        ChatHistory.objects.filter(pk=self.chat.pk).update(has_archived_messages=True)
+        self.chat.refresh_from_db()
+        return archive
+
+    def test_restore_inserts_the_archived_rows_once(self):
+        self.archive_chat()
+
+        self.assertEqual(restore_archived_chat(self.chat), 1)
+        self.assertEqual(restore_archived_chat(self.chat), 0)
+
+        message = Message.objects.get(pk=9001)
+        self.assertEqual((message.created.year, message.cluster_id), (2020, None))
+        self.assertEqual(message.answers.get().answer, "archived answer")
+        self.assertFalse(ChatHistory.objects.get(pk=self.chat.pk).has_archived_messages)
+        self.assertFalse(ArchivedChat.objects.exists())
+
+    def test_missing_archive_keeps_the_chat_archived(self):
+        archive = self.archive_chat()
+        shutil.rmtree(self.directory / archive.name)
+
+        with self.assertLogs('apps.chat.archive', 'ERROR'):
+            self.assertEqual(restore_archived_chat(self.chat), 0)
+
+        self.assertTrue(ChatHistory.objects.get(pk=self.chat.pk).has_archived_messages)
+
+    def test_opening_an_archived_chat_restores_it_in_the_background(self):
+        self.archive_chat()
+
+        with mock.patch('apps.chat.archive._executor') as executor, self.captureOnCommitCallbacks(execute=True):
+            pages = [self.api.get(f'/chat/detail/{self.chat.id}/').json() for _ in range(2)]
+
+        executor.submit.assert_called_once_with(mock.ANY, self.chat.id)
+        self.assertEqual([page['archived'] for page in pages], [True, True])
+        self.assertNotIn(9001, [message['id'] for message in pages[0]['message_list']])
+
+        restore_archived_chat(self.chat)
+        page = self.api.get(f'/chat/message/{self.chat.id}/').json()
+        self.assertFalse(page['archived'])
+        self.assertIn(9001, [message['id'] for message in page['results']])
+
+    def test_archived_month_is_restored(self):
+        if not is_partitioned(connection, 'chat_message'):
+            self.skipTest("archive_month needs the partitioned tables of PostgreSQL")
+        month = date(2020, 1, 1)
+        with connection.cursor() as cursor:
+            for table in PARTITIONED_TABLES:
+                create_month_partition(cursor, table, month)
+        message = Message.objects.create(chat_history=self.chat, question="old question", first_message=False)
+        answer = Answer.objects.create(message=message, answer="old answer")
+        old = timezone.make_aware(datetime(2020, 1, 5))
+        Message.objects.filter(pk=message.pk).update(created=old)
+        Answer.objects.filter(pk=answer.pk).update(created=old)
+        # The deferred foreign key checks of the test transaction would keep the partition from being dropped
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        archive_month(month, buckets=4)
+
+        self.assertFalse(Message.objects.filter(pk=message.pk).exists())
+        self.chat.refresh_from_db()
+        self.assertTrue(self.chat.has_archived_messages)
+        self.assertEqual(restore_archived_chat(self.chat), 1)
+        restored = Message.objects.get(pk=message.pk)
+        self.assertEqual((restored.created, restored.answers.get().answer), (old, "old answer"))
+
+class SoftDeleteTests(ChatTestMixin, TestCase):
+
+    def test_deleted_chat_is_hidden_then_purged(self):
+        kept, deleted = self.create_chat(messages=2), self.create_chat(messages=3)
+
+        response = self.api.delete(f'/chat/detail/{deleted.id}/')
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.api.get(f'/chat/detail/{deleted.id}/').status_code, 404)
+        self.assertEqual([chat['id'] for chat in self.api.get('/chat/list/').json()['results']], [kept.id])
+        self.assertFalse(Message.objects.filter(chat_history_id=deleted.id).exists())
+        self.assertFalse(Answer.objects.filter(message__chat_history_id=deleted.id).exists())
+        self.assertEqual(Message.all_objects.filter(chat_history_id=deleted.id).count(), 3)
+
+        self.assertEqual(purge_deleted_chats(), (1, 3, 3))
+
+        self.assertFalse(ChatHistory.all_objects.filter(id=deleted.id).exists())
+        self.assertFalse(Message.all_objects.filter(chat_history_id=deleted.id).exists())
+        self.assertEqual(Answer.objects.filter(message__chat_history=kept).count(), 2)
+
+
+class QuotaTests(ChatTestMixin, TestCase):
+
+    def send(self, chat, text="What helps with a headache?"):
+        return self.api.post(f'/chat/{chat.id}/', {'message': text}, format='json')
+
+    def test_free_request_is_used_once(self):
+        chat = self.create_chat()
+
+        self.assertEqual(self.send(chat).status_code, 200)
+        response = self.send(chat)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("бесплатный запрос", response.content.decode())
+        self.assertEqual(Message.objects.filter(chat_history=chat).count(), 1)
+        self.assertEqual(Entitlement.objects.get(pk=self.user.pk).remaining, 0)
+
+    def test_tariff_limit_closes_the_chat_when_used_up(self):
+        product = ProductPocket.objects.create(title="Start", count_typing=2)
+        Payment.objects.create(user=self.user, product_pocket=product, status='success', amount=100)
+        chat = self.create_chat()
+
+        statuses = [self.send(chat).status_code for _ in range(3)]
+
+        self.assertEqual(statuses, [200, 200, 400])
+        self.assertEqual(Message.objects.filter(chat_history=chat).count(), 2)
+        chat.refresh_from_db()
+        self.assertFalse(chat.is_active)
+
+    def test_expired_period_takes_no_request(self):
+        Entitlement.objects.create(user=self.user, request_limit=5, remaining=5,
+                                   period_end=timezone.now() - timedelta(days=1))
+
+        self.assertFalse(consume_request(self.user.pk))
+        self.assertEqual(Entitlement.objects.get(pk=self.user.pk).remaining, 5)
+
+
+class EntitlementTests(ChatTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.product = ProductPocket.objects.create(title="Start", count_typing=5)
+
+    def test_payment_grants_a_full_quota_once(self):
+        self.assertTrue(consume_request(self.user.pk))
+        self.assertIsNone(entitlement_cache.get(self.user.pk).product_id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            payment = Payment.objects.create(user=self.user, product_pocket=self.product, status='success')
+        consume_request(self.user.pk)
+        payment.save()
+
+        entitlement = Entitlement.objects.get(pk=self.user.pk)
+        self.assertEqual((entitlement.request_limit, entitlement.remaining, entitlement.version), (5, 4, 2))
+        self.assertEqual(entitlement_cache.get(self.user.pk).product_id, self.product.id)
+
+    def test_users_from_before_entitlements_keep_their_usage(self):
+        Payment.objects.create(user=self.user, product_pocket=self.product, status='success')
+        Entitlement.objects.filter(pk=self.user.pk).delete()
+        RequestCount.objects.create(user=self.user, request_count=3)
+
+        entitlement = entitlement_cache.get(self.user.pk)
+
+        self.assertEqual((entitlement.product_id, entitlement.remaining), (self.product.id, 2))
+
+    def test_payment_invalidates_the_entitlements_cached_by_other_workers(self):
+        other_worker = EntitlementCache(ttl=300, max_entries=10)
+        self.assertIsNone(other_worker.get(self.user.pk).product_id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.create(user=self.user, product_pocket=self.product, status='success')
+        # the other worker's per-process default cache still holds the version it read
+        caches['default'].set(EntitlementCache.version_key(self.user.pk), 1)
+
+        self.assertEqual(other_worker.get(self.user.pk).product_id, self.product.id)
+
+
+class GenerationJobTests(ChatTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.message = Message.objects.create(chat_history=self.create_chat(), question="What helps with a headache?")
+
+    def test_message_has_one_active_job(self):
+        job = enqueue_answer_job(self.message)
+
+        self.assertEqual(enqueue_answer_job(self.message), job)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            GenerationJob.objects.create(message=self.message)
+
+    def test_claimed_job_is_answered(self):
+        enqueue_answer_job(self.message)
+
+        job = run_job(claim_job('worker'))
+
+        self.assertEqual((job.status, job.attempts), ('done', 1))
+        self.assertEqual(job.answer, Answer.objects.get(message=self.message))
+
+    @override_settings(CHAT_JOB_MAX_ATTEMPTS=2)
+    def test_expired_lease_on_the_last_attempt_fails_the_job(self):
+        job = enqueue_answer_job(self.message)
+        GenerationJob.objects.filter(pk=job.pk).update(
+            status='running', attempts=2, lease_until=timezone.now() - timedelta(seconds=1)
+        )
+
+        self.assertIsNone(claim_job('worker'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def test_worker_that_lost_its_lease_keeps_the_new_outcome(self):
+        enqueue_answer_job(self.message)
+        job = claim_job('slow', lease_seconds=1)
+        # The lease expired and another worker took the job over
+        GenerationJob.objects.filter(pk=job.pk).update(lease_until=timezone.now() - timedelta(seconds=1))
+        claim_job('fast')
+
+        job = run_job(job)
+
+        self.assertEqual((job.status, job.worker, job.answer_id), ('running', 'fast', None))
+
+
+class EagerAnswerTests(ChatTestMixin, TestCase):
+
+    def send(self):
+        chat = self.create_chat()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.api.post(f'/chat/{chat.id}/', {'message': "What helps with a headache?"}, format='json')
+        return Message.objects.get(pk=response.json()['message_id'])
+
+    def test_wait_generates_the_answer_when_eager_answers_are_disabled(self):
+        message = self.send()
+
+        response = self.api.get(f'/chat/message/answer/{message.id}/wait/?timeout=5')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['id'], Answer.objects.get(message=message).id)
+
+    @override_settings(CHAT_EAGER_ANSWERS=True)
+    def test_wait_generates_the_answer_when_the_executor_rejected_it(self):
+        rejected = metrics.get_counters('eager_answers_rejected')['eager_answers_rejected']
+        with mock.patch.object(eager, '_slots', threading.BoundedSemaphore(1)) as slots:
+            slots.acquire()
+            message = self.send()
+
+        self.assertEqual(metrics.get_counters('eager_answers_rejected')['eager_answers_rejected'], rejected + 1)
+        self.assertFalse(eager.in_flight(message.id))
+        response = self.api.get(f'/chat/message/answer/{message.id}/wait/?timeout=5')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Answer.objects.filter(message=message).exists())
+
+    def test_wait_leaves_an_answer_in_flight_to_its_worker(self):
+        message = self.send()
+        caches[settings.CHAT_ANSWER_CACHE_ALIAS].set(eager.in_flight_key(message.id), True, 60)
+
+        response = self.api.get(f'/chat/message/answer/{message.id}/wait/?timeout=0')
+
+        self.assertEqual((response.status_code, response.json()), (202, {'status': 'pending'}))
+        self.assertFalse(Answer.objects.filter(message=message).exists())
@@ -1,9 +1,11 @@
 from django.urls import path
 
+from apps.chat.async_views import AsyncTypingView, AsyncMessageDetailListView
 from apps.chat.views import (
 	TypingView, ChatHistoryDetailView, MessageDetailListView, ChatHistoryStatisticByWeekendView,
 	ChatHistoryRemovedView, PaymentStatisticView, MessageStatisticView, UserStatisticView,
-	ChatHistoryCreateView, MessageListUserView
+	ChatHistoryCreateView, MessageListUserView, MessageAnswerStreamView, ChatMetricsView, AnswerJobCreateView,
+	AnswerJobDetailView, MessageAnswerWaitView, ChatHistoryListView
 
 )
 
@@ -12,13 +14,22 @@ urlpatterns = [
 	path('<int:id>/', TypingView.as_view(), name='chat-history-list-create'),
 	path('detail/<int:id>/', ChatHistoryDetailView.as_view(), name='chat-history-detail'),
 	path('message/answer/<int:id>/', MessageDetailListView.as_view(), name='message-detail'),
+	path('message/answer/<int:id>/stream/', MessageAnswerStreamView.as_view(), name='message-answer-stream'),
+	path('message/answer/<int:id>/wait/', MessageAnswerWaitView.as_view(), name='message-answer-wait'),
+	path('message/answer/<int:id>/jobs/', AnswerJobCreateView.as_view(), name='message-answer-job-create'),
+	path('jobs/<int:id>/', AnswerJobDetailView.as_view(), name='answer-job-detail'),
 	path('chat_history/statistics/', ChatHistoryStatisticByWeekendView.as_view(), name='chat-history-statistics'),
 	path('chat_history/removed/', ChatHistoryRemovedView.as_view(), name='chat-history-removed'),
 	path('payment/statistics/', PaymentStatisticView.as_view(), name='payment-statistics'),
 	path('message/statistics/', MessageStatisticView.as_view(), name='message-statistics'),
 	path('user/statistics/', UserStatisticView.as_view(), name='user-statistics'),
+	path('metrics/', ChatMetricsView.as_view(), name='chat-metrics'),
 
 	path('create/', ChatHistoryCreateView.as_view(), name='chat-history-create'),
+	path('list/', ChatHistoryListView.as_view(), name='chat-history-list'),
 	path('message/<int:id>/', MessageListUserView.as_view(), name='message-list-user'),
 
+	path('async/<int:id>/', AsyncTypingView.as_view(), name='chat-history-list-create-async'),
+	path('async/message/answer/<int:id>/', AsyncMessageDetailListView.as_view(), name='message-detail-async'),
+
 ]
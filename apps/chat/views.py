@@ -1,25 +1,40 @@
-import difflib
+import itertools
+import json
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from django.db.models.functions import TruncMonth, TruncDay
-from django.db.models import Sum
-from datetime import timedelta
+from django.db.models import Prefetch
+from datetime import date, timedelta
 
 from django.shortcuts import get_object_or_404
 from django.utils.timezone import now
+from rest_framework.exceptions import Throttled
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.views import APIView
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-from apps.accounts.models import CustomUser
 from apps.accounts.serializers import CustomUserDetailSerializer
-from apps.chat.models import Message, ChatHistory, Answer
+from django.conf import settings
+
+from apps.chat import eager
+from apps.chat.archive import schedule_restore
+from apps.chat.jobs import enqueue_answer_job, wait_for_job
+from apps.chat.models import Message, ChatHistory, Answer, GenerationJob, QuestionCluster
 from apps.chat.serializers import ChatHistorySerializer, ChatHistoryDetailSerializer, ChatHistoryCreateSerializer, \
-    MessageListUserSerializer
-from apps.chat.service import chatbot_response
-from apps.prices_x_cards.models import Payment
+    MessageListUserSerializer, GenerationJobSerializer, AnswerSerializer, ChatHistoryListSerializer, answers_prefetch
+from apps.chat.pagination import MessageCursorPagination, ChatHistoryCursorPagination, UserStatisticPagination, \
+    QuestionClusterPagination
+from apps.chat.purge import soft_delete_chats
+from apps.chat.renderers import EventStreamRenderer
+from apps.chat.scheduler import priority
+from apps.chat.statistics import weekly_chat_summaries, user_message_counts
+from apps.chat.service import get_or_generate_answer, latest_answer, save_answer, chatbot_response_stream, detect_language, error_response, \
+    log_chatbot_error, answer_cache, semantic_cache, answer_flight, conversation_history, llm, message_priority, \
+    message_flight
+from apps.prices_x_cards.statistics import payment_revenue
 
 
 class ChatHistoryCreateView(APIView):
@@ -33,14 +48,62 @@ class ChatHistoryCreateView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+CURSOR_PARAMETERS = [
+    openapi.Parameter(
+        name='cursor',
+        in_=openapi.IN_QUERY,
+        type=openapi.TYPE_STRING,
+        description="Opaque cursor taken from the `next` (older) or `previous` (newer) link"
+    ),
+    openapi.Parameter(
+        name='page_size',
+        in_=openapi.IN_QUERY,
+        type=openapi.TYPE_INTEGER,
+        description="Number of items per page"
+    ),
+]
+
+
+class ChatHistoryListView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="List the chat histories of the authenticated user, newest first. "
+                              "Cursor paginated: follow `next` to load older chats.",
+        tags=['Chat History'],
+        manual_parameters=CURSOR_PARAMETERS,
+        responses={200: ChatHistoryListSerializer(many=True)}
+    )
+    def get(self, request, *args, **kwargs):
+        chat_histories = ChatHistory.objects.filter(user=request.user)
+        paginator = ChatHistoryCursorPagination()
+        page = paginator.paginate_queryset(chat_histories, request, view=self)
+        serializer = ChatHistoryListSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
+
 class MessageListUserView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @swagger_auto_schema(
+        operation_description="List the messages of a chat history with their latest answers, newest first. "
+                              "Cursor paginated: follow `next` to load older messages. While older messages are "
+                              "restored from the archive in the background `archived` is true and only the messages "
+                              "in the database are listed; load the chat again later.",
+        tags=['Messages'],
+        manual_parameters=CURSOR_PARAMETERS,
+        responses={200: MessageListUserSerializer(many=True)}
+    )
     def get(self, request, *args, **kwargs):
         chat_history = get_object_or_404(ChatHistory, id=kwargs['id'])
-        messages = Message.objects.filter(chat_history=chat_history)
-        serializer = MessageListUserSerializer(messages, many=True, context={'request': request})
-        return Response(serializer.data)
+        archived = schedule_restore(chat_history)
+        messages = MessageListUserSerializer.setup_eager_loading(Message.objects.filter(chat_history=chat_history))
+        paginator = MessageCursorPagination()
+        page = paginator.paginate_queryset(messages, request, view=self)
+        serializer = MessageListUserSerializer(page, many=True, context={'request': request})
+        response = paginator.get_paginated_response(serializer.data)
+        response.data['archived'] = archived
+        return response
 
 
 class TypingView(APIView):
@@ -97,10 +160,8 @@ class ChatHistoryRemovedView(APIView):
         }
     )
     def get(self, request, *args, **kwargs):
-        chat_history = ChatHistory.objects.select_related('user').filter(user=request.user)
-        chat_history.delete()
-        messages = Message.objects.select_related('chat_history').filter(chat_history__user=request.user)
-        messages.delete()
+        # Hidden at once, removed in the background by purge_deleted_chats
+        soft_delete_chats(ChatHistory.objects.filter(user=request.user))
         return Response({"message": "Chat history deleted successfully."}, status=status.HTTP_204_NO_CONTENT)
 
 
@@ -108,8 +169,12 @@ class ChatHistoryDetailView(APIView):
     permission_classes = [IsAuthenticated]
 
     @swagger_auto_schema(
-        operation_description="Retrieve details of a specific chat history by ID.",
+        operation_description="Retrieve details of a specific chat history by ID. `message_list` holds one page "
+                              "of messages, newest first; `next` loads older messages. While older messages are "
+                              "restored from the archive in the background `archived` is true and only the messages "
+                              "in the database are listed; load the chat again later.",
         tags=['Chat History'],
+        manual_parameters=CURSOR_PARAMETERS,
         responses={
             200: ChatHistoryDetailSerializer(many=False),
             404: openapi.Response(
@@ -125,9 +190,20 @@ class ChatHistoryDetailView(APIView):
     )
     def get(self, request, *args, **kwargs):
         chat_history_id = kwargs['id']
-        chat_history = get_object_or_404(ChatHistory, id=chat_history_id)
-        serializer = ChatHistoryDetailSerializer(chat_history, context={'request': request})
-        return Response(serializer.data)
+        chat_history = get_object_or_404(
+            ChatHistory.objects.select_related('user').prefetch_related('user__groups'), id=chat_history_id
+        )
+        archived = schedule_restore(chat_history)
+        messages = Message.objects.filter(chat_history=chat_history).prefetch_related(answers_prefetch())
+        paginator = MessageCursorPagination()
+        chat_history.message_list_prefetched = paginator.paginate_queryset(messages, request, view=self)
+        chat_history.first_msg_prefetched = messages.filter(first_message=True).first()
+
+        data = ChatHistoryDetailSerializer(chat_history, context={'request': request}).data
+        data['next'] = paginator.get_next_link()
+        data['previous'] = paginator.get_previous_link()
+        data['archived'] = archived
+        return Response(data)
 
     @swagger_auto_schema(
         operation_description="Delete a specific chat history and its associated messages by ID.",
@@ -156,9 +232,7 @@ class ChatHistoryDetailView(APIView):
     def delete(self, request, *args, **kwargs):
         chat_history_id = kwargs['id']
         chat_history = get_object_or_404(ChatHistory, id=chat_history_id)
-        messages = Message.objects.select_related('chat_history').filter(chat_history=chat_history)
-        messages.delete()
-        chat_history.delete()
+        soft_delete_chats(ChatHistory.objects.filter(pk=chat_history.pk))
         return Response({"message": "Chat history deleted successfully."}, status=status.HTTP_204_NO_CONTENT)
 
 
@@ -166,15 +240,46 @@ class MessageDetailListView(APIView):
     permission_classes = [IsAuthenticated]
 
     @swagger_auto_schema(
-        operation_description="Generate and store an answer for a specific message by ID using a chatbot.",
+        operation_description="Generate and store an answer for a specific message by ID using a chatbot. "
+                              "If the message already has an answer it is returned without calling the chatbot; "
+                              "pass `regenerate=true` to generate a new answer version.",
         tags=['Messages'],
+        manual_parameters=[
+            openapi.Parameter(
+                name='regenerate',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_BOOLEAN,
+                default=False,
+                description="Generate a new answer version even if the message is already answered"
+            )
+        ],
         responses={
+            200: openapi.Response(
+                description="The message was already answered.",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'msg': openapi.Schema(type=openapi.TYPE_STRING, example="Already answered"),
+                        'answer': openapi.Schema(type=openapi.TYPE_OBJECT, description="Answer details")
+                    }
+                )
+            ),
             201: openapi.Response(
                 description="Answer successfully added.",
                 schema=openapi.Schema(
                     type=openapi.TYPE_OBJECT,
                     properties={
-                        'msg': openapi.Schema(type=openapi.TYPE_STRING, example="Successfull added")
+                        'msg': openapi.Schema(type=openapi.TYPE_STRING, example="Successfull added"),
+                        'answer': openapi.Schema(type=openapi.TYPE_OBJECT, description="Answer details")
+                    }
+                )
+            ),
+            429: openapi.Response(
+                description="Too many answers are being generated; retry after the `Retry-After` header.",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'detail': openapi.Schema(type=openapi.TYPE_STRING)
                     }
                 )
             ),
@@ -192,19 +297,247 @@ class MessageDetailListView(APIView):
     def get(self, request, *args, **kwargs):
         message_id = kwargs['id']
         msg_data = get_object_or_404(Message, id=message_id)
-        get_answer = chatbot_response(msg_data.question)
-        create_answer_to_msg = Answer.objects.create(
-            message=msg_data,
-            answer=get_answer
-        )
-        return Response({'msg': "Successfull added"}, status=status.HTTP_201_CREATED)
+        regenerate = request.query_params.get('regenerate') in ('1', 'true', 'True')
+        answer, created = get_or_generate_answer(msg_data, regenerate=regenerate)
+        serializer = AnswerSerializer(answer, context={'request': request})
+        if created:
+            return Response({'msg': "Successfull added", 'answer': serializer.data}, status=status.HTTP_201_CREATED)
+        return Response({'msg': "Already answered", 'answer': serializer.data}, status=status.HTTP_200_OK)
+
+
+class MessageAnswerStreamView(APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [EventStreamRenderer, JSONRenderer]
+
+    @staticmethod
+    def sse_event(data, event=None):
+        payload = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+        if event:
+            payload = f"event: {event}\n{payload}"
+        return payload
+
+    def stream_answer(self, message, regenerate=False):
+        if not regenerate:
+            try:
+                answer = latest_answer(message.id)
+                if answer is None and (message_flight.in_flight(message.id) or eager.in_flight(message.id)):
+                    # Another request or the eager generation is answering it: replay that answer once it is stored
+                    # instead of streaming a second completion
+                    answer, created = get_or_generate_answer(message)
+            except Throttled as e:
+                yield self.sse_event({'error': str(e.detail), 'retry_after': e.wait}, event='error')
+                return
+            if answer is not None:
+                yield self.sse_event({'delta': answer.answer})
+                yield self.sse_event({'answer_id': answer.id}, event='done')
+                return
+
+        chunks = []
+        try:
+            # The queue slot is taken on the first delta; the priority is only set around that step because a
+            # context variable set across yields is not reliably restored between chunks under ASGI.
+            with priority(message_priority(message)):
+                history = conversation_history(message)
+                deltas = chatbot_response_stream(message.question, refresh=regenerate, history=history)
+                first = next(deltas, None)
+            for delta in itertools.chain([first] if first is not None else [], deltas):
+                chunks.append(delta)
+                yield self.sse_event({'delta': delta})
+        except Throttled as e:
+            yield self.sse_event({'error': str(e.detail), 'retry_after': e.wait}, event='error')
+            return
+        except Exception as e:
+            log_chatbot_error(e)
+            yield self.sse_event({'error': error_response(detect_language(message.question))}, event='error')
+            return
+
+        text = "".join(chunks)
+        answer, created = save_answer(message, text, regenerate=regenerate, with_context=bool(history))
+        if not created and answer.answer != text:
+            # Another generation stored its answer first and that one is kept: send it to replace the streamed text
+            yield self.sse_event({'answer': answer.answer}, event='replace')
+        yield self.sse_event({'answer_id': answer.id}, event='done')
+
+    @swagger_auto_schema(
+        operation_description="Generate an answer for a specific message by ID and stream it as Server-Sent Events. "
+                              "Each `data:` event carries a `delta` chunk of text; the final `done` event carries "
+                              "the id of the stored answer. An existing answer, or one another request is already "
+                              "generating, is replayed unless `regenerate=true`. When another request stored its "
+                              "answer while this one streamed, a `replace` event carries the text that was kept.",
+        tags=['Messages'],
+        manual_parameters=[
+            openapi.Parameter(
+                name='regenerate',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_BOOLEAN,
+                default=False,
+                description="Generate a new answer version even if the message is already answered"
+            )
+        ],
+        responses={
+            200: openapi.Response(description="text/event-stream with answer deltas."),
+            404: openapi.Response(
+                description="Message not found.",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'detail': openapi.Schema(type=openapi.TYPE_STRING, example="Not found.")
+                    }
+                )
+            )
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        message_id = kwargs['id']
+        msg_data = get_object_or_404(Message, id=message_id)
+        regenerate = request.query_params.get('regenerate') in ('1', 'true', 'True')
+        response = StreamingHttpResponse(self.stream_answer(msg_data, regenerate), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class MessageAnswerWaitView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Wait for the answer of a message. Answers start generating as soon as the message "
+                              "is created, so the request is held until the answer exists or `timeout` seconds "
+                              "pass (long-polling). When nothing is generating the answer (eager answers are off, "
+                              "were rejected or lost in a restart) it is generated by this request.",
+        tags=['Messages'],
+        manual_parameters=[
+            openapi.Parameter(
+                name='timeout',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                default=25,
+                description="Seconds to wait for the answer"
+            )
+        ],
+        responses={
+            200: AnswerSerializer(many=False),
+            202: openapi.Response(
+                description="The answer is not ready yet, retry the request.",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'status': openapi.Schema(type=openapi.TYPE_STRING, example="pending")
+                    }
+                )
+            ),
+            429: openapi.Response(
+                description="Too many answers are being generated; retry after the `Retry-After` header.",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'detail': openapi.Schema(type=openapi.TYPE_STRING)
+                    }
+                )
+            ),
+            404: openapi.Response(
+                description="Message not found.",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'detail': openapi.Schema(type=openapi.TYPE_STRING, example="Not found.")
+                    }
+                )
+            )
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        msg_data = get_object_or_404(Message, id=kwargs['id'])
+        try:
+            timeout = min(float(request.query_params.get('timeout', settings.CHAT_ANSWER_WAIT_TIMEOUT)),
+                          settings.CHAT_ANSWER_WAIT_TIMEOUT)
+        except ValueError:
+            return Response({"error": "Invalid timeout"}, status=status.HTTP_400_BAD_REQUEST)
+
+        answer = eager.wait_for_answer(msg_data.id, max(timeout, 0))
+        if answer is None and not eager.in_flight(msg_data.id):
+            answer, created = get_or_generate_answer(msg_data)
+        if answer is None:
+            return Response({"status": "pending"}, status=status.HTTP_202_ACCEPTED)
+        serializer = AnswerSerializer(answer, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class AnswerJobCreateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Queue answer generation for a message. The answer is produced by "
+                              "`manage.py run_answer_workers`; poll the returned job for the result.",
+        tags=['Messages'],
+        responses={
+            202: GenerationJobSerializer(many=False),
+            404: openapi.Response(
+                description="Message not found.",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'detail': openapi.Schema(type=openapi.TYPE_STRING, example="Not found.")
+                    }
+                )
+            )
+        }
+    )
+    def post(self, request, *args, **kwargs):
+        msg_data = get_object_or_404(Message, id=kwargs['id'])
+        job = enqueue_answer_job(msg_data)
+        serializer = GenerationJobSerializer(job, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+class AnswerJobDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Get the state of an answer generation job. With `wait`, the request is held "
+                              "until the job finishes or `wait` seconds pass (long-polling).",
+        tags=['Messages'],
+        manual_parameters=[
+            openapi.Parameter(
+                name='wait',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                default=0,
+                description="Seconds to wait for the job to finish"
+            )
+        ],
+        responses={
+            200: GenerationJobSerializer(many=False),
+            404: openapi.Response(
+                description="Job not found.",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'detail': openapi.Schema(type=openapi.TYPE_STRING, example="Not found.")
+                    }
+                )
+            )
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        job = get_object_or_404(GenerationJob.objects.select_related('answer'), id=kwargs['id'])
+        try:
+            wait = min(float(request.query_params.get('wait', 0)), settings.CHAT_JOB_MAX_WAIT)
+        except ValueError:
+            return Response({"error": "Invalid wait"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if wait > 0:
+            job = wait_for_job(job, wait)
+        serializer = GenerationJobSerializer(job, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 class ChatHistoryStatisticByWeekendView(APIView):
     permission_classes = [IsAuthenticated]
 
     @swagger_auto_schema(
-        operation_description="Retrieve chat history statistics for the past 7 days for the authenticated user.",
+        operation_description="Retrieve chat history statistics for the past 7 days for the authenticated user: "
+                              "a lightweight summary of every chat, bucketed by day.",
         tags=['Chat History Statistics'],
         responses={
             200: openapi.Response(
@@ -218,49 +551,56 @@ class ChatHistoryStatisticByWeekendView(APIView):
                                 type=openapi.TYPE_ARRAY,
                                 items=openapi.Schema(
                                     type=openapi.TYPE_OBJECT,
-                                    description="Chat history details"
+                                    description="Chat summary: id, created, is_active, message_count, "
+                                                "answered_count, last_message_at, first_question"
                                 )
                             ),
                             'yesterday': openapi.Schema(
                                 type=openapi.TYPE_ARRAY,
                                 items=openapi.Schema(
                                     type=openapi.TYPE_OBJECT,
-                                    description="Chat history details"
+                                    description="Chat summary: id, created, is_active, message_count, "
+                                                "answered_count, last_message_at, first_question"
                                 )
                             ),
                             '2_days_ago': openapi.Schema(
                                 type=openapi.TYPE_ARRAY,
                                 items=openapi.Schema(
                                     type=openapi.TYPE_OBJECT,
-                                    description="Chat history details"
+                                    description="Chat summary: id, created, is_active, message_count, "
+                                                "answered_count, last_message_at, first_question"
                                 )
                             ),
                             '3_days_ago': openapi.Schema(
                                 type=openapi.TYPE_ARRAY,
                                 items=openapi.Schema(
                                     type=openapi.TYPE_OBJECT,
-                                    description="Chat history details"
+                                    description="Chat summary: id, created, is_active, message_count, "
+                                                "answered_count, last_message_at, first_question"
                                 )
                             ),
                             '4_days_ago': openapi.Schema(
                                 type=openapi.TYPE_ARRAY,
                                 items=openapi.Schema(
                                     type=openapi.TYPE_OBJECT,
-                                    description="Chat history details"
+                                    description="Chat summary: id, created, is_active, message_count, "
+                                                "answered_count, last_message_at, first_question"
                                 )
                             ),
                             '5_days_ago': openapi.Schema(
                                 type=openapi.TYPE_ARRAY,
                                 items=openapi.Schema(
                                     type=openapi.TYPE_OBJECT,
-                                    description="Chat history details"
+                                    description="Chat summary: id, created, is_active, message_count, "
+                                                "answered_count, last_message_at, first_question"
                                 )
                             ),
                             '6_days_ago': openapi.Schema(
                                 type=openapi.TYPE_ARRAY,
                                 items=openapi.Schema(
                                     type=openapi.TYPE_OBJECT,
-                                    description="Chat history details"
+                                    description="Chat summary: id, created, is_active, message_count, "
+                                                "answered_count, last_message_at, first_question"
                                 )
                             ),
                         }
@@ -270,139 +610,197 @@ class ChatHistoryStatisticByWeekendView(APIView):
         }
     )
     def get(self, request, *args, **kwargs):
-        today = now().date()
-        chat_history = ChatHistory.objects.filter(user=request.user)
-
-        result = []
-
-        for i in range(7):
-            day_date = today - timedelta(days=i)
-            day_chats = chat_history.filter(created__date=day_date)
-            serialized = ChatHistoryDetailSerializer(day_chats, many=True).data
-
-            if i == 0:
-                key = "today"
-            elif i == 1:
-                key = "yesterday"
-            else:
-                key = f"{i}_days_ago"
-
-            result.append({
-                key: serialized
-            })
-
-        return Response(result)
+        return Response(weekly_chat_summaries(request.user.id))
 
 
 class UserStatisticView(APIView):
     permission_classes = [IsAuthenticated]
+    ordering_fields = {'messages_count', 'id', 'username'}
 
     @swagger_auto_schema(
-        operation_description="Retrieve statistics for all users, including their details and message counts.",
+        operation_description="Retrieve statistics for all users, including their details and message counts. "
+                              "Paginated; sorted by message count, most active users first, unless `ordering` "
+                              "is given.",
         tags=['User Statistics'],
+        manual_parameters=[
+            openapi.Parameter(
+                name='page',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="Page number"
+            ),
+            openapi.Parameter(
+                name='page_size',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="Number of users per page"
+            ),
+            openapi.Parameter(
+                name='ordering',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="messages_count, id or username; prefix with '-' for descending order",
+                default='-messages_count'
+            ),
+            openapi.Parameter(
+                name='source',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                enum=['aggregate', 'counters'],
+                description="Count messages in the query (aggregate) or read the precomputed per-user counters"
+            ),
+        ],
         responses={
             200: openapi.Response(
                 description="User statistics.",
                 schema=openapi.Schema(
-                    type=openapi.TYPE_ARRAY,
-                    items=openapi.Schema(
-                        type=openapi.TYPE_OBJECT,
-                        properties={
-                            'user_info': openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'count': openapi.Schema(type=openapi.TYPE_INTEGER),
+                        'next': openapi.Schema(type=openapi.TYPE_STRING),
+                        'previous': openapi.Schema(type=openapi.TYPE_STRING),
+                        'results': openapi.Schema(
+                            type=openapi.TYPE_ARRAY,
+                            items=openapi.Schema(
                                 type=openapi.TYPE_OBJECT,
-                                description="User details"
-                            ),
-                            'messages_count': openapi.Schema(
-                                type=openapi.TYPE_INTEGER,
-                                description="Number of messages"
+                                properties={
+                                    'user_info': openapi.Schema(
+                                        type=openapi.TYPE_OBJECT,
+                                        description="User details"
+                                    ),
+                                    'messages_count': openapi.Schema(
+                                        type=openapi.TYPE_INTEGER,
+                                        description="Number of messages"
+                                    )
+                                }
                             )
-                        }
-                    )
+                        ),
+                    }
                 )
             )
         }
     )
     def get(self, request, *args, **kwargs):
-        users = CustomUser.objects.all()
-        response_data = []
-
-        for user in users:
-            user_messages_count = Message.objects.select_related('chat_history').filter(chat_history__user=user).count()
-            user_info = CustomUserDetailSerializer(user, context={'request': request}).data
-
-            response_data.append({
-                "user_info": user_info,
-                "messages_count": user_messages_count
-            })
-
-        return Response(response_data, status=status.HTTP_200_OK)
+        source = request.query_params.get('source', settings.CHAT_USER_STATS_SOURCE)
+        ordering = request.query_params.get('ordering', '-messages_count')
+        if ordering.lstrip('-') not in self.ordering_fields:
+            ordering = '-messages_count'
+
+        users = user_message_counts(source).order_by(ordering, 'id')
+        paginator = UserStatisticPagination()
+        page = paginator.paginate_queryset(users, request, view=self)
+        response_data = [
+            {
+                "user_info": CustomUserDetailSerializer(user, context={'request': request}).data,
+                "messages_count": user.messages_count
+            }
+            for user in page
+        ]
+        return paginator.get_paginated_response(response_data)
 
 
 class MessageStatisticView(APIView):
     permission_classes = [IsAuthenticated]
 
     @swagger_auto_schema(
-        operation_description="Group messages by similarity based on their content and provide counts.",
+        operation_description="Group messages by similarity based on their content and provide counts. "
+                              "Clusters are computed in the background by `manage.py cluster_questions`; "
+                              "the largest come first, each with a sample of its questions.",
         tags=['Message Statistics'],
+        manual_parameters=[
+            openapi.Parameter(
+                name='page',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="Page number"
+            ),
+            openapi.Parameter(
+                name='page_size',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="Number of groups per page"
+            ),
+            openapi.Parameter(
+                name='min_count',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="Only groups with at least this many messages",
+                default=1
+            ),
+        ],
         responses={
             200: openapi.Response(
                 description="Grouped message statistics.",
                 schema=openapi.Schema(
-                    type=openapi.TYPE_ARRAY,
-                    items=openapi.Schema(
-                        type=openapi.TYPE_OBJECT,
-                        properties={
-                            'messages_info': openapi.Schema(
-                                type=openapi.TYPE_ARRAY,
-                                items=openapi.Schema(
-                                    type=openapi.TYPE_STRING,
-                                    description="Similar message content"
-                                )
-                            ),
-                            'messages_count': openapi.Schema(
-                                type=openapi.TYPE_INTEGER,
-                                description="Number of similar messages"
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'count': openapi.Schema(type=openapi.TYPE_INTEGER),
+                        'next': openapi.Schema(type=openapi.TYPE_STRING),
+                        'previous': openapi.Schema(type=openapi.TYPE_STRING),
+                        'results': openapi.Schema(
+                            type=openapi.TYPE_ARRAY,
+                            items=openapi.Schema(
+                                type=openapi.TYPE_OBJECT,
+                                properties={
+                                    'messages_info': openapi.Schema(
+                                        type=openapi.TYPE_ARRAY,
+                                        items=openapi.Schema(
+                                            type=openapi.TYPE_STRING,
+                                            description="Similar message content"
+                                        )
+                                    ),
+                                    'messages_count': openapi.Schema(
+                                        type=openapi.TYPE_INTEGER,
+                                        description="Number of similar messages"
+                                    )
+                                }
                             )
-                        }
-                    )
+                        ),
+                    }
                 )
             )
         }
     )
     def get(self, request, *args, **kwargs):
-        messages = Message.objects.all().values_list('question', flat=True)
-        messages = list(messages)
-
-        grouped = []
-        used = set()
-
-        for i, msg in enumerate(messages):
-            if msg in used:
-                continue
-
-            group = [msg]
-            used.add(msg)
-
-            similar = difflib.get_close_matches(msg, messages, n=10, cutoff=0.7)
-
-            for sim in similar:
-                if sim != msg and sim not in used:
-                    group.append(sim)
-                    used.add(sim)
-
-            grouped.append({
-                "messages_info": group,
-                "messages_count": len(group)
-            })
-
-        return Response(grouped, status=status.HTTP_200_OK)
+        min_count = request.query_params.get('min_count', '1')
+        min_count = int(min_count) if min_count.isdigit() else 1
+        clusters = QuestionCluster.objects.filter(size__gte=min_count).order_by('-size', 'id').prefetch_related(
+            Prefetch(
+                'messages',
+                queryset=Message.objects.order_by('id').only('id', 'question', 'cluster_id')[
+                    :settings.CHAT_CLUSTER_SAMPLE_SIZE
+                ],
+                to_attr='sample_messages'
+            )
+        )
+        paginator = QuestionClusterPagination()
+        page = paginator.paginate_queryset(clusters, request, view=self)
+        grouped = [
+            {
+                "messages_info": [message.question for message in cluster.sample_messages],
+                "messages_count": cluster.size
+            }
+            for cluster in page
+        ]
+        return paginator.get_paginated_response(grouped)
 
 
 class PaymentStatisticView(APIView):
     permission_classes = [IsAuthenticated]
 
+    RANGES = {
+        "7": (timedelta(days=7), "day"),
+        "30": (timedelta(days=30), "day"),
+        "6": (timedelta(days=180), "month"),
+        "12": (timedelta(days=365), "month"),
+    }
+    STATUSES = {"success", "pending", "failed", "all"}
+    CUSTOM_RANGE_DAILY_LIMIT = 62
+
     @swagger_auto_schema(
-        operation_description="Retrieve payment statistics aggregated by month or day for a specified range (7, 30, 6 months, or 12 months).",
+        operation_description="Retrieve payment statistics aggregated by month or day for a specified range "
+                              "(7, 30, 6 months, or 12 months) or for a custom start/end range. "
+                              "Read from daily revenue rollups; only successful payments are counted by default.",
         tags=['Payment Statistics'],
         manual_parameters=[
             openapi.Parameter(
@@ -412,7 +810,43 @@ class PaymentStatisticView(APIView):
                 enum=['7', '30', '6', '12'],
                 default='12',
                 description="Time range for statistics: 7 (days), 30 (days), 6 (months), 12 (months)"
-            )
+            ),
+            openapi.Parameter(
+                name='start',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                format='date',
+                description="Start of a custom range (YYYY-MM-DD, inclusive); overrides `range`"
+            ),
+            openapi.Parameter(
+                name='end',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                format='date',
+                description="End of a custom range (YYYY-MM-DD, inclusive); defaults to today"
+            ),
+            openapi.Parameter(
+                name='period',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                enum=['day', 'month'],
+                description="Grouping of a custom range; by default days for ranges up to 62 days, months otherwise"
+            ),
+            openapi.Parameter(
+                name='status',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                enum=['success', 'pending', 'failed', 'all'],
+                default='success',
+                description="Payment status to count"
+            ),
+            openapi.Parameter(
+                name='currency',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                enum=['RUB', 'USD'],
+                description="Only count payments in this currency"
+            ),
         ],
         responses={
             200: openapi.Response(
@@ -430,6 +864,10 @@ class PaymentStatisticView(APIView):
                             'amount': openapi.Schema(
                                 type=openapi.TYPE_NUMBER,
                                 description="Total payment amount"
+                            ),
+                            'count': openapi.Schema(
+                                type=openapi.TYPE_INTEGER,
+                                description="Number of payments"
                             )
                         }
                     )
@@ -450,59 +888,98 @@ class PaymentStatisticView(APIView):
         }
     )
     def get(self, request, *args, **kwargs):
-        range_type = request.query_params.get("range", "12")
-
-        now = timezone.now()
-
-        if range_type == "12":
-            start_date = now - timedelta(days=365)
-            payments = (
-                Payment.objects.filter(created__gte=start_date)
-                .annotate(period=TruncMonth("created"))
-                .values("period")
-                .annotate(total=Sum("amount"))
-                .order_by("period")
-            )
-
-        elif range_type == "6":
-            start_date = now - timedelta(days=180)
-            payments = (
-                Payment.objects.filter(created__gte=start_date)
-                .annotate(period=TruncMonth("created"))
-                .values("period")
-                .annotate(total=Sum("amount"))
-                .order_by("period")
+        params = request.query_params
+        today = timezone.localdate()
+
+        if params.get("start"):
+            try:
+                start_date = date.fromisoformat(params["start"])
+                end_date = date.fromisoformat(params["end"]) if params.get("end") else today
+            except ValueError:
+                return Response({"error": "Invalid date"}, status=400)
+            if start_date > end_date:
+                return Response({"error": "Invalid range"}, status=400)
+            period = params.get("period") or (
+                "day" if (end_date - start_date).days <= self.CUSTOM_RANGE_DAILY_LIMIT else "month"
             )
-
-        elif range_type == "30":
-            start_date = now - timedelta(days=30)
-            payments = (
-                Payment.objects.filter(created__gte=start_date)
-                .annotate(period=TruncDay("created"))
-                .values("period")
-                .annotate(total=Sum("amount"))
-                .order_by("period")
-            )
-
-        elif range_type == "7":
-            start_date = now - timedelta(days=7)
-            payments = (
-                Payment.objects.filter(created__gte=start_date)
-                .annotate(period=TruncDay("created"))
-                .values("period")
-                .annotate(total=Sum("amount"))
-                .order_by("period")
-            )
-
+            if period not in ("day", "month"):
+                return Response({"error": "Invalid period"}, status=400)
         else:
-            return Response({"error": "Invalid range"}, status=400)
-
+            range_type = params.get("range", "12")
+            if range_type not in self.RANGES:
+                return Response({"error": "Invalid range"}, status=400)
+            span, period = self.RANGES[range_type]
+            start_date, end_date = today - span, today
+
+        payment_status = params.get("status", "success")
+        if payment_status not in self.STATUSES:
+            return Response({"error": "Invalid status"}, status=400)
+        currency = params.get("currency") or None
+
+        payments = payment_revenue(
+            start_date, end_date, period=period,
+            status=None if payment_status == "all" else payment_status, currency=currency,
+        )
         data = [
             {
                 "date": p["period"].strftime("%Y-%m-%d"),
-                "amount": p["total"] or 0
+                "amount": p["total"] or 0,
+                "count": p["count"] or 0
             }
             for p in payments
         ]
 
         return Response(data)
+
+
+class ChatMetricsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Counters of the answer generation pipeline (cache hits and misses, "
+                              "estimated LLM spend saved by the semantic cache, coalesced upstream calls, "
+                              "LLM retries, circuit breaker state, LLM queue depth and wait time; queue depth and "
+                              "in-flight calls are per process).",
+        tags=['Chat Metrics'],
+        responses={
+            200: openapi.Response(
+                description="Chat metrics.",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'answer_cache_hits': openapi.Schema(type=openapi.TYPE_INTEGER),
+                        'answer_cache_misses': openapi.Schema(type=openapi.TYPE_INTEGER),
+                        'answer_cache_hit_rate': openapi.Schema(type=openapi.TYPE_NUMBER),
+                        'semantic_cache_hits': openapi.Schema(type=openapi.TYPE_INTEGER),
+                        'semantic_cache_misses': openapi.Schema(type=openapi.TYPE_INTEGER),
+                        'semantic_cache_hit_rate': openapi.Schema(type=openapi.TYPE_NUMBER),
+                        'semantic_cache_saved_spend': openapi.Schema(type=openapi.TYPE_NUMBER),
+                        'answer_coalesced': openapi.Schema(type=openapi.TYPE_INTEGER),
+                        'answer_coalesced_remote': openapi.Schema(type=openapi.TYPE_INTEGER),
+                        'eager_answers_scheduled': openapi.Schema(type=openapi.TYPE_INTEGER),
+                        'eager_answers_rejected': openapi.Schema(type=openapi.TYPE_INTEGER),
+                        'llm_retries': openapi.Schema(type=openapi.TYPE_INTEGER),
+                        'llm_failures': openapi.Schema(type=openapi.TYPE_INTEGER),
+                        'llm_circuit_opened': openapi.Schema(type=openapi.TYPE_INTEGER),
+                        'llm_circuit_rejected': openapi.Schema(type=openapi.TYPE_INTEGER),
+                        'llm_circuit_state': openapi.Schema(type=openapi.TYPE_STRING),
+                        'llm_queue_admitted': openapi.Schema(type=openapi.TYPE_INTEGER),
+                        'llm_queue_rejected': openapi.Schema(type=openapi.TYPE_INTEGER),
+                        'llm_queue_timeouts': openapi.Schema(type=openapi.TYPE_INTEGER),
+                        'llm_queue_avg_wait_ms': openapi.Schema(type=openapi.TYPE_NUMBER),
+                        'llm_queue_depth': openapi.Schema(type=openapi.TYPE_INTEGER),
+                        'llm_active': openapi.Schema(type=openapi.TYPE_INTEGER),
+                    }
+                )
+            )
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        data = {
+            **answer_cache.stats(),
+            **semantic_cache.stats(),
+            **answer_flight.stats(),
+            **eager.stats(),
+            **(llm.stats() if hasattr(llm, 'stats') else {}),
+        }
+        return Response(data, status=status.HTTP_200_OK)
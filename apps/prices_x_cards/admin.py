@@ -1,5 +1,5 @@
 from django.contrib import admin
-from apps.prices_x_cards.models import ProductPocket, Card, Payment
+from apps.prices_x_cards.models import ProductPocket, Card, Payment, PaymentDailyRollup
 
 
 @admin.register(ProductPocket)
@@ -42,4 +42,11 @@ class PaymentAdmin(admin.ModelAdmin):
             'fields': ('created',),
             'classes': ('collapse',),
         }),
-    )
\ No newline at end of file
+    )
+
+@admin.register(PaymentDailyRollup)
+class PaymentDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'currency', 'status', 'product', 'payments_count', 'amount', 'updated')
+    list_filter = ('status', 'currency', 'date')
+    readonly_fields = ('date', 'currency', 'status', 'product', 'payments_count', 'amount', 'updated')
+    ordering = ('-date',)
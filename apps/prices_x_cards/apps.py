@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PricesXCardsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.prices_x_cards'
+
+    def ready(self):
+        import apps.prices_x_cards.signals  # noqa: F401
@@ -0,0 +1,26 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.prices_x_cards.statistics import rebuild_payment_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill PaymentDailyRollup from the payments table. Without --since every day is rebuilt; "
+        "payments changed while the command runs may need another run for their day."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Only rebuild days from this date on (YYYY-MM-DD).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError("--since must be a date in YYYY-MM-DD format")
+        written = rebuild_payment_rollups(since=since, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} payment rollup rows."))
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices_x_cards', '0007_payment_order_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('currency', models.CharField(blank=True, choices=[('RUB', 'Рубли'), ('USD', 'Доллары')], max_length=3, null=True, verbose_name='Валюта')),
+                ('status', models.CharField(blank=True, choices=[('pending', 'В ожидании'), ('success', 'Успешно'), ('failed', 'Неудачно')], max_length=10, null=True, verbose_name='Статус')),
+                ('payments_count', models.IntegerField(default=0, verbose_name='Количество платежей')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_rollups', to='prices_x_cards.productpocket', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Дневная выручка',
+                'verbose_name_plural': 'Дневная выручка',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['status', 'date'], name='payment_rollup_status_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'currency', 'status', 'product'), name='payment_rollup_key_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:14
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_order_ids(apps, schema_editor):
+    """Empty order ids become NULL; real duplicates have to be resolved by hand before the constraint is added."""
+    Payment = apps.get_model('prices_x_cards', 'Payment')
+    Payment.objects.filter(order_id='').update(order_id=None)
+    duplicates = list(
+        Payment.objects.exclude(order_id=None).values('order_id').annotate(count=Count('id'))
+        .filter(count__gt=1).values_list('order_id', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(f"Duplicate Payment.order_id values, resolve them before migrating: {duplicates}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices_x_cards', '0008_paymentdailyrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(check_order_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='payment',
+            name='order_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True, verbose_name='Номер заказа'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', 'status', 'created'], name='payment_user_status_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:46
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_rollups(apps, schema_editor):
+    """Folds rollup rows the old constraint let through (NULL in the key) into the oldest row of their key."""
+    PaymentDailyRollup = apps.get_model('prices_x_cards', 'PaymentDailyRollup')
+    duplicates = (
+        PaymentDailyRollup.objects.values('date', 'currency', 'status', 'product_id')
+        .annotate(rows=Count('id'), keep_id=Min('id'), payments=Sum('payments_count'), total=Sum('amount'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for key in list(duplicates):
+        rows = PaymentDailyRollup.objects.filter(
+            date=key['date'], currency=key['currency'], status=key['status'], product_id=key['product_id']
+        )
+        rows.exclude(id=key['keep_id']).delete()
+        rows.update(payments_count=key['payments'], amount=key['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prices_x_cards', '0009_payment_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='paymentdailyrollup',
+            name='payment_rollup_key_uniq',
+        ),
+        migrations.AlterField(
+            model_name='paymentdailyrollup',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='prices_x_cards.productpocket', verbose_name='Товар'),
+        ),
+        migrations.RunPython(merge_duplicate_rollups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='paymentdailyrollup',
+            constraint=models.UniqueConstraint(models.F('date'), django.db.models.functions.comparison.Coalesce('currency', models.Value('')), django.db.models.functions.comparison.Coalesce('status', models.Value('')), django.db.models.functions.comparison.Coalesce('product', models.Value(0)), name='payment_rollup_key_uniq'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Coalesce
 
 User = get_user_model()
 
@@ -54,7 +56,7 @@ class Payment(models.Model):
 	user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь", null=True, blank=True)
 	product_pocket = models.ForeignKey(ProductPocket, on_delete=models.CASCADE, verbose_name="Товар", null=True,
 	                                   blank=True)
-	order_id = models.CharField(max_length=255, verbose_name="Номер заказа", null=True, blank=True)
+	order_id = models.CharField(max_length=255, unique=True, verbose_name="Номер заказа", null=True, blank=True)
 	card = models.ForeignKey(Card, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Карта")
 	amount = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Сумма", null=True, blank=True)
 	status = models.CharField(max_length=10, choices=PAYMENT_STATUS_CHOICES, default='pending', verbose_name="Статус",
@@ -70,3 +72,44 @@ class Payment(models.Model):
 		verbose_name = "Платёж"
 		verbose_name_plural = "Платежи"
 		ordering = ['-created']
+		indexes = [
+			models.Index(fields=['user', 'status', 'created'], name='payment_user_status_idx'),
+		]
+
+
+class PaymentDailyRollup(models.Model):
+	"""
+	Payments summed per day, currency, status and product; maintained by signals, see statistics.py.
+	The key columns may be NULL, so the unique constraint compares them through COALESCE: NULLs are distinct in a
+	plain unique constraint and two rows of one key could be inserted side by side.
+	"""
+	date = models.DateField(verbose_name="Дата")
+	currency = models.CharField(max_length=3, choices=ProductPocket.PRICE_TYPE_CHOICES, verbose_name="Валюта",
+	                            null=True, blank=True)
+	status = models.CharField(max_length=10, choices=Payment.PAYMENT_STATUS_CHOICES, verbose_name="Статус",
+	                          null=True, blank=True)
+	# The payments of a deleted product are deleted with it, so are its rollups
+	product = models.ForeignKey(ProductPocket, on_delete=models.CASCADE, related_name='daily_rollups',
+	                            verbose_name="Товар", null=True, blank=True)
+	payments_count = models.IntegerField(default=0, verbose_name="Количество платежей")
+	amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Сумма")
+	updated = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+
+	objects = models.Manager()
+
+	def __str__(self):
+		return f"{self.date} {self.currency} {self.status}: {self.amount}"
+
+	class Meta:
+		verbose_name = "Дневная выручка"
+		verbose_name_plural = "Дневная выручка"
+		ordering = ['-date']
+		constraints = [
+			models.UniqueConstraint(
+				'date', Coalesce('currency', Value('')), Coalesce('status', Value('')), Coalesce('product', Value(0)),
+				name='payment_rollup_key_uniq',
+			),
+		]
+		indexes = [
+			models.Index(fields=['status', 'date'], name='payment_rollup_status_date_idx'),
+		]
@@ -1,7 +1,7 @@
 from rest_framework import serializers
 
 from apps.accounts.serializers import CustomUserDetailSerializer
-from apps.chat.models import ChatHistory, RequestCount
+from apps.chat.models import ChatHistory
 from apps.prices_x_cards.models import ProductPocket, Card, Payment
 
 
@@ -51,10 +51,6 @@ class PaymentSerializer(serializers.ModelSerializer):
         create_card = Card.objects.create(user=user, **card_data)
 
         create_payment = Payment.objects.create(**validated_data, card=create_card)
-
-        request_count = RequestCount.objects.create(
-            user=user, is_active=True
-        )
         return create_payment
 
 
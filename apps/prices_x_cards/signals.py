@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from apps.prices_x_cards.models import Payment
+from apps.prices_x_cards.statistics import apply_payment_change, payment_rollup_state, stored_rollup_state
+
+
+@receiver(pre_save, sender=Payment)
+def payment_saving(sender, instance, raw=False, **kwargs):
+    # The stored row, not the instance, is what the rollups currently include
+    instance._rollup_previous = None if raw or instance._state.adding else stored_rollup_state(instance.pk)
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        apply_payment_change(getattr(instance, '_rollup_previous', None), payment_rollup_state(instance))
+
+
+@receiver(post_delete, sender=Payment)
+def payment_deleted(sender, instance, **kwargs):
+    apply_payment_change(payment_rollup_state(instance), None)
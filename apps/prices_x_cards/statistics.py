@@ -0,0 +1,109 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+from django.utils.timezone import localdate
+
+from apps.prices_x_cards.models import Payment, PaymentDailyRollup, ProductPocket
+
+ZERO = Decimal('0')
+
+
+def payment_rollup_state(payment):
+    """What a saved payment contributes to the rollups: (date, status, product id, amount), or None."""
+    if payment.created is None:
+        return None
+    return localdate(payment.created), payment.status, payment.product_pocket_id, payment.amount or ZERO
+
+
+def stored_rollup_state(payment_id):
+    row = Payment.objects.filter(pk=payment_id).values('created', 'status', 'product_pocket_id', 'amount').first()
+    if row is None or row['created'] is None:
+        return None
+    return localdate(row['created']), row['status'], row['product_pocket_id'], row['amount'] or ZERO
+
+
+def add_to_rollup(state, sign):
+    """Adds (sign=1) or removes (sign=-1) one payment from its daily rollup row in a single UPDATE."""
+    day, status, product_id, amount = state
+    currency = None
+    if product_id is not None:
+        currency = ProductPocket.objects.filter(pk=product_id).values_list('price_type', flat=True).first()
+    rollup = PaymentDailyRollup.objects.filter(date=day, currency=currency, status=status, product_id=product_id)
+    changes = {'payments_count': F('payments_count') + sign, 'amount': F('amount') + sign * amount}
+    if rollup.update(**changes) or sign < 0:
+        return
+    try:
+        with transaction.atomic():
+            PaymentDailyRollup.objects.create(
+                date=day, currency=currency, status=status, product_id=product_id, payments_count=1, amount=amount
+            )
+    except IntegrityError:
+        rollup.update(**changes)
+
+
+def apply_payment_change(previous, current):
+    """Moves a payment between rollup rows when its status, amount, product or date changed."""
+    if previous == current:
+        return
+    with transaction.atomic():
+        if previous is not None:
+            add_to_rollup(previous, -1)
+        if current is not None:
+            add_to_rollup(current, 1)
+
+
+def rebuild_payment_rollups(since=None, batch_size=1000):
+    """
+    Recomputes the rollups from the payments table, for every day or for days from `since` on;
+    returns the number of rollup rows written.
+    """
+    payments = Payment.objects.filter(created__isnull=False)
+    rollups = PaymentDailyRollup.objects.all()
+    if since is not None:
+        payments = payments.filter(created__date__gte=since)
+        rollups = rollups.filter(date__gte=since)
+    grouped = (
+        payments
+        .annotate(day=TruncDate('created'))
+        .values('day', 'status', 'product_pocket_id', 'product_pocket__price_type')
+        .annotate(payments_count=Count('id'), total=Coalesce(Sum('amount'), Value(ZERO)))
+        .order_by()
+    )
+    with transaction.atomic():
+        rollups.delete()
+        created = PaymentDailyRollup.objects.bulk_create(
+            [
+                PaymentDailyRollup(
+                    date=row['day'], currency=row['product_pocket__price_type'], status=row['status'],
+                    product_id=row['product_pocket_id'], payments_count=row['payments_count'], amount=row['total'],
+                )
+                for row in grouped.iterator()
+            ],
+            batch_size=batch_size,
+        )
+    return len(created)
+
+
+def payment_revenue(start, end, period='day', status='success', currency=None):
+    """
+    Revenue per day or per month between `start` and `end` (dates, inclusive) read from the rollups,
+    so the cost depends on the length of the range, not on the number of payments.
+    `status=None` counts payments of every status.
+    """
+    rollups = PaymentDailyRollup.objects.filter(date__gte=start, date__lte=end)
+    if status is not None:
+        rollups = rollups.filter(status=status)
+    if currency is not None:
+        rollups = rollups.filter(currency=currency)
+    return (
+        rollups
+        .annotate(period=TruncMonth('date') if period == 'month' else F('date'))
+        .values('period')
+        .annotate(
+            total=Sum('amount', output_field=DecimalField(max_digits=14, decimal_places=2)),
+            count=Sum('payments_count'),
+        )
+        .order_by('period')
+    )
@@ -1,3 +1,22 @@
+from datetime import date
+
+from django.db import IntegrityError
 from django.test import TestCase
 
-# Create your tests here.
+from apps.prices_x_cards.models import Payment, PaymentDailyRollup
+
+
+class PaymentDailyRollupTests(TestCase):
+
+    def test_payments_without_product_share_one_rollup_row(self):
+        for amount in (100, 50):
+            Payment.objects.create(amount=amount, status='success')
+
+        rollup = PaymentDailyRollup.objects.get()
+        self.assertEqual((rollup.currency, rollup.product_id), (None, None))
+        self.assertEqual((rollup.payments_count, rollup.amount), (2, 150))
+
+    def test_key_with_nulls_is_unique(self):
+        PaymentDailyRollup.objects.create(date=date(2026, 1, 1), status='success')
+        with self.assertRaises(IntegrityError):
+            PaymentDailyRollup.objects.create(date=date(2026, 1, 1), status='success')
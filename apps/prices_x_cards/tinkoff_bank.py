@@ -11,7 +11,6 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from apps.chat.models import RequestCount
 from apps.prices_x_cards.models import ProductPocket, Payment, Card
 
 
@@ -305,14 +304,8 @@ class CheckPaymentStatusView(APIView):
             updated_payment.status = 'success'
             updated_payment.save()
             print("✅ Final payment status saved as 'success'")
-
-            request_count = RequestCount.objects.create(
-                user=request.user,
-                is_active=True
-            )
-            print("📊 RequestCount record created")
         except Exception as e:
-            print("❌ DB error while saving payment/request count:", str(e))
+            print("❌ DB error while saving payment:", str(e))
             return Response({
                 "detail": f"Ошибка базы данных: {str(e)}"
             }, status=500)
@@ -1,18 +1,31 @@
 # Import necessary modules and functions
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.http import JsonResponse
 from rest_framework import status
 
 
 # Middleware for handling JSON error responses
 class JsonErrorResponseMiddleware:
+    # Supports both WSGI and ASGI so async views are not pushed onto a thread per request
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
         # Get the response from the view function
         response = self.get_response(request)
         return response
 
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        return response
+
     def process_exception(self, request, exception):
         # Process exceptions and return JSON error response
         error_message = str(exception)
@@ -22,12 +35,26 @@ class JsonErrorResponseMiddleware:
 
 # Middleware for handling custom 404 responses
 class Custom404Middleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
         # Get the response from the view function
         response = self.get_response(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
         if response is None:
             # If response is None, handle 404 error
             return self.handle_404(request)
@@ -42,4 +69,3 @@ class Custom404Middleware:
         # Handle 404 error and return JSON response
         data = {"detail": "Page not Found"}
         return JsonResponse(data, status=status.HTTP_404_NOT_FOUND)
-
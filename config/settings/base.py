@@ -1,3 +1,4 @@
+import json
 import os
 from datetime import timedelta
 from pathlib import Path
@@ -253,6 +254,164 @@ SIMPLE_JWT = {
 
 AUTH_USER_MODEL = 'accounts.CustomUser'
 
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'verbose': {'format': '{asctime} {levelname} {name} {message}', 'style': '{'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'verbose'},
+    },
+    'loggers': {
+        'apps': {'handlers': ['console'], 'level': os.getenv("APPS_LOG_LEVEL", "INFO")},
+    },
+}
+
+# Chat / LLM
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
+
+# LLM backend. For offline load tests use apps.chat.llm.FakeBackend, e.g.
+#   CHAT_LLM_BACKEND=apps.chat.llm.FakeBackend CHAT_LLM_OPTIONS='{"latency": 0.8, "tokens_per_second": 40}'
+# or keep OpenAIBackend and point it at `manage.py run_fake_llm_server`:
+#   CHAT_LLM_OPTIONS='{"base_url": "http://127.0.0.1:9000/v1"}'
+CHAT_LLM = {
+    'BACKEND': os.getenv("CHAT_LLM_BACKEND", "apps.chat.llm.OpenAIBackend"),
+    'RESILIENT': True,
+    'SCHEDULED': True,
+    'OPTIONS': json.loads(os.getenv("CHAT_LLM_OPTIONS", "{}")),
+}
+
+# Every LLM call is bounded by a per-attempt and a total deadline (seconds) and retried with jittered
+# exponential backoff on 429/5xx and connection errors. After CHAT_LLM_BREAKER_THRESHOLD consecutive failures
+# calls fail fast for CHAT_LLM_BREAKER_RESET seconds.
+CHAT_LLM_TIMEOUT = float(os.getenv("CHAT_LLM_TIMEOUT", 20))
+CHAT_LLM_TOTAL_TIMEOUT = float(os.getenv("CHAT_LLM_TOTAL_TIMEOUT", 45))
+CHAT_LLM_MAX_RETRIES = 3
+CHAT_LLM_BACKOFF_BASE = 0.5
+CHAT_LLM_BACKOFF_MAX = 8
+CHAT_LLM_BREAKER_THRESHOLD = 5
+CHAT_LLM_BREAKER_RESET = 30
+
+# Admission control for LLM calls, per process: at most CHAT_LLM_MAX_CONCURRENCY calls in flight and
+# CHAT_LLM_MAX_QUEUE waiting (higher tariffs first). A full queue or a wait over CHAT_LLM_QUEUE_TIMEOUT seconds
+# answers 429 with Retry-After. The priority is the user's tariff, read through the entitlement cache.
+CHAT_LLM_MAX_CONCURRENCY = int(os.getenv("CHAT_LLM_MAX_CONCURRENCY", 16))
+CHAT_LLM_MAX_QUEUE = int(os.getenv("CHAT_LLM_MAX_QUEUE", 64))
+CHAT_LLM_QUEUE_TIMEOUT = 20
+
+# Shared HTTP connection pool of the OpenAI backend (per process)
+CHAT_LLM_POOL = {
+    'MAX_CONNECTIONS': 100,
+    'MAX_KEEPALIVE_CONNECTIONS': 20,
+    'KEEPALIVE_EXPIRY': 30,
+    'CONNECT_TIMEOUT': 5,
+}
+
+# Answers are shared by every worker and survive restarts; the table is created by the chat migrations.
+CHAT_ANSWER_CACHE_ALIAS = 'chat_answers'
+CHAT_ANSWER_CACHE_TTL = int(os.getenv("CHAT_ANSWER_CACHE_TTL", 60 * 60 * 24 * 7))
+CHAT_ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("CHAT_ANSWER_CACHE_MAX_ENTRIES", 100000))
+
+# Near-duplicate questions (estimated Jaccard similarity of character 3-grams) reuse a stored answer.
+CHAT_SEMANTIC_CACHE_ENABLED = os.getenv("CHAT_SEMANTIC_CACHE_ENABLED", "True") == "True"
+CHAT_SEMANTIC_CACHE_THRESHOLD = float(os.getenv("CHAT_SEMANTIC_CACHE_THRESHOLD", 0.8))
+CHAT_SEMANTIC_CACHE_NUM_PERM = 64
+CHAT_SEMANTIC_CACHE_BANDS = 16
+CHAT_SEMANTIC_CACHE_SYNC_INTERVAL = 30
+CHAT_SEMANTIC_CACHE_BATCH_SIZE = 5000
+
+# Identical questions in flight at the same time share one upstream call. The distributed mode also coalesces
+# across workers through a lock in the (shared) answer cache.
+CHAT_SINGLEFLIGHT_DISTRIBUTED = os.getenv("CHAT_SINGLEFLIGHT_DISTRIBUTED", "False") == "True"
+CHAT_SINGLEFLIGHT_LOCK_CACHE_ALIAS = CHAT_ANSWER_CACHE_ALIAS
+CHAT_SINGLEFLIGHT_LOCK_TIMEOUT = 60
+CHAT_SINGLEFLIGHT_POLL_INTERVAL = 0.25
+
+# Multi-turn context: previous turns of a chat are sent along with the question, within a token budget.
+# Turns that no longer fit are folded into a per-chat summary every CHAT_CONTEXT_SUMMARY_STRIDE turns.
+CHAT_CONTEXT_ENABLED = os.getenv("CHAT_CONTEXT_ENABLED", "True") == "True"
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", 3000))
+CHAT_CONTEXT_MAX_TURNS = 50
+CHAT_CONTEXT_MAX_ANSWER_TOKENS = 600
+CHAT_MAX_QUESTION_TOKENS = 1000
+CHAT_CONTEXT_SUMMARIZE = os.getenv("CHAT_CONTEXT_SUMMARIZE", "True") == "True"
+CHAT_CONTEXT_SUMMARY_STRIDE = 4
+CHAT_CONTEXT_SUMMARY_INPUT_TOKENS = 6000
+CHAT_CONTEXT_SUMMARY_MAX_TOKENS = 200
+
+# Answers start generating in-process as soon as a new message is committed
+CHAT_EAGER_ANSWERS = os.getenv("CHAT_EAGER_ANSWERS", "True") == "True"
+CHAT_EAGER_ANSWER_WORKERS = 8
+CHAT_EAGER_ANSWER_QUEUE = 32
+# Seconds a scheduled eager answer counts as in flight; the wait endpoint generates answers nobody is working on
+CHAT_EAGER_ANSWER_TIMEOUT = 120
+CHAT_ANSWER_WAIT_TIMEOUT = 25
+
+# Background answer generation (manage.py run_answer_workers)
+CHAT_JOB_LEASE_SECONDS = 120
+CHAT_JOB_MAX_ATTEMPTS = 3
+CHAT_JOB_RETRY_DELAY = 10
+CHAT_JOB_MAX_WAIT = 30
+
+# Per-user cache of the sidebar's weekly chat summaries; dropped whenever a chat or message of the user changes.
+# It must be shared by every worker, or a change made through one worker leaves stale summaries in the others.
+CHAT_WEEKLY_STATS_CACHE_ALIAS = CHAT_ANSWER_CACHE_ALIAS
+CHAT_WEEKLY_STATS_CACHE_TTL = 60 * 10
+
+# Default source of /chat/user/statistics/ message counts: 'aggregate' counts in the query, 'counters' reads
+# UserMessageCounter, kept current by signals (fill it once with `manage.py rebuild_user_message_counters`).
+CHAT_USER_STATS_SOURCE = os.getenv("CHAT_USER_STATS_SOURCE", "aggregate")
+
+# Near-duplicate question clusters for /chat/message/statistics/, filled by `manage.py cluster_questions`.
+# A question joins a cluster when the MinHash estimate of their character 3-gram Jaccard similarity reaches
+# the threshold.
+CHAT_CLUSTER_THRESHOLD = float(os.getenv("CHAT_CLUSTER_THRESHOLD", 0.6))
+CHAT_CLUSTER_BATCH_SIZE = 5000
+CHAT_CLUSTER_SAMPLE_SIZE = 10
+
+# Rows per DELETE statement of purge_deleted_chats
+CHAT_PURGE_BATCH_SIZE = 1000
+
+# PostgreSQL only: monthly partitions of chat_message/chat_answer are created CHAT_PARTITION_MONTHS_AHEAD months
+# ahead, and archive_chat_partitions moves months older than CHAT_ARCHIVE_AFTER_MONTHS into gzipped JSONL files
+# under CHAT_ARCHIVE_DIR, CHAT_ARCHIVE_BUCKETS files per month (apps.chat.archive)
+CHAT_PARTITION_MONTHS_AHEAD = 3
+CHAT_ARCHIVE_AFTER_MONTHS = int(os.getenv("CHAT_ARCHIVE_AFTER_MONTHS", 12))
+CHAT_ARCHIVE_DIR = os.getenv("CHAT_ARCHIVE_DIR", str(BASE_DIR / 'archive' / 'chat'))
+CHAT_ARCHIVE_BUCKETS = 64
+# Opened chats are restored from the archive in the background by this many threads per process; a restore that
+# has not finished after CHAT_ARCHIVE_RESTORE_TIMEOUT seconds may be started again
+CHAT_ARCHIVE_RESTORE_WORKERS = 2
+CHAT_ARCHIVE_RESTORE_TIMEOUT = 300
+
+# Per-process cache of user entitlements (apps.chat.entitlements). Entries are invalidated across processes through
+# a per-user version in CHAT_ENTITLEMENT_VERSION_CACHE_ALIAS, which must be shared by every worker.
+CHAT_ENTITLEMENT_VERSION_CACHE_ALIAS = CHAT_ANSWER_CACHE_ALIAS
+CHAT_ENTITLEMENT_CACHE_TTL = 300
+CHAT_ENTITLEMENT_CACHE_SIZE = 10000
+
+# Used to report the estimated LLM spend saved by the caches (USD per completion).
+CHAT_ESTIMATED_COST_PER_COMPLETION = float(os.getenv("CHAT_ESTIMATED_COST_PER_COMPLETION", 0.0003))
+
+# Counters are only cluster-wide when this alias points at a shared backend (Redis, Memcached).
+CHAT_METRICS_CACHE_ALIAS = 'default'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    CHAT_ANSWER_CACHE_ALIAS: {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'chat_answer_cache',
+        'TIMEOUT': CHAT_ANSWER_CACHE_TTL,
+        'OPTIONS': {
+            'MAX_ENTRIES': CHAT_ANSWER_CACHE_MAX_ENTRIES,
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+
 # CHANNEL_LAYERS = {
 #     "default": {
 #         "BACKEND": "channels.layers.InMemoryChannelLayer",